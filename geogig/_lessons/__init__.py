@@ -16,7 +16,7 @@ from qgis.core import *
 from qgis.utils import iface
 from qgis.PyQt.QtCore import Qt
 
-from geogig.geogigwebapi.repository import createRepoAtUrl, GeoGigException, Repository, readRepos
+from geogig.geogigwebapi.repository import createRepoAtUrl, GeoGigException, Repository, readRepos, revalidateEndpoints
 from geogig.geogigwebapi import repository
 from geogig.tools import layertracking
 from geogig.gui.dialogs.navigatordialog import navigatorInstance
@@ -36,6 +36,7 @@ def cleanup():
     if _lastRepo is not None:
         _lastRepo.delete()
     readRepos()
+    revalidateEndpoints()
     navigatorInstance.updateNavigator()
 
 def _openNavigator(empty = False, group = "Lesson repos"):
@@ -24,7 +24,7 @@ def checkVersions(n):
 def checkEdited(layername):
     layer = layerFromName(layername)
     if layer:
-        return len(hasLocalChanges(layer)) > 0
+        return hasLocalChanges(layer)
     else:
         return False
 
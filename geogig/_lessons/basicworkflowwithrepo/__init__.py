@@ -30,7 +30,7 @@ def checkBranch(name):
 def checkEdited(layername):
     layer = layerFromName(layername)
     if layer:
-        return len(hasLocalChanges(layer)) > 0
+        return hasLocalChanges(layer)
     else:
         return False
 
@@ -37,6 +37,12 @@ REPOS_FOLDER = "ReposFolder"
 USERNAME = "Username"
 EMAIL = "Email"
 LOG_SERVER_CALLS = "LogServerCalls"
+CONNECTION_POOL_SIZE = "ConnectionPoolSize"
+DIFF_CACHE_SIZE = "DiffCacheSize"
+LAYER_CACHE_SIZE = "LayerCacheSize"
+FEATURE_CACHE_SIZE = "FeatureCacheSize"
+MAX_CONCURRENT_JOBS = "MaxConcurrentJobs"
+USE_WAL = "UseWal"
 
 
 def initConfigParams():
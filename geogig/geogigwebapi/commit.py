@@ -30,6 +30,7 @@ import datetime
 import time
 
 from .commitish import Commitish
+from .commitstore import commitStore
 from geogig.tools.utils import relativeDate
 
 NULL_ID = "0" * 40
@@ -37,8 +38,6 @@ NULL_ID = "0" * 40
 
 class Commit(Commitish):
 
-    _commitcache = {}
-
     ''' A geogig commit'''
 
     def __init__(self, repo, commitid, treeid, parents, message, authorname,
@@ -67,13 +66,14 @@ class Commit(Commitish):
             return Commitish(repo, NULL_ID)
         else:
             cid = repo.revparse(ref)
-            if (repo.url, cid) not in Commit._commitcache:
-                log = repo.log(until = cid, limit = 1)
-                if log:
-                    Commit._commitcache[(repo.url, cid)] = log[0]
-                else:
-                    return Commitish(repo, NULL_ID)
-            return Commit._commitcache[(repo.url, cid)]
+            data = commitStore().commitData(repo.url, cid)
+            if data is not None:
+                return Commit(repo, *data)
+            log = repo.log(until = cid, limit = 1)
+            if log:
+                return log[0]
+            else:
+                return Commitish(repo, NULL_ID)
 
     @property
     def parents(self):
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    commitgraph.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import threading
+
+from .commit import NULL_ID
+from .commitstore import commitStore
+
+
+class CommitGraph(object):
+    '''
+    The known part of the commit graph of a repository, with the parents
+    of each commit and its generation number (one more than the largest
+    generation of its parents, with root commits having generation 1).
+    A commit is never reachable from a commit with a lower or equal
+    generation, which is used to cut ancestry searches short.
+
+    Ancestry queries are answered locally. They can only be made for
+    commits whose whole history is known, which can be checked with
+    isComplete
+    '''
+
+    def __init__(self):
+        self.parents = {}
+        self.generations = {}
+        self._lock = threading.Lock()
+
+    def addCommit(self, commitid, parents):
+        with self._lock:
+            self.parents[commitid] = [p for p in parents if p != NULL_ID]
+
+    def addCommits(self, commits):
+        '''Adds Commit objects to the graph'''
+        with self._lock:
+            for c in commits:
+                self.parents[c.commitid] = [p for p in c._parents if p != NULL_ID]
+
+    def __contains__(self, commitid):
+        return commitid in self.parents
+
+    def generation(self, commitid):
+        '''Returns the generation number of a commit, or None if its history is not completely known'''
+        with self._lock:
+            return self._generation(commitid)
+
+    def _generation(self, commitid):
+        if commitid in self.generations:
+            return self.generations[commitid]
+        if commitid not in self.parents:
+            return None
+        # iterative post-order walk, since histories can be deeper than the recursion limit
+        stack = [commitid]
+        while stack:
+            cid = stack[-1]
+            if cid in self.generations:
+                stack.pop()
+                continue
+            pending = [p for p in self.parents[cid] if p not in self.generations]
+            for p in pending:
+                if p not in self.parents:
+                    return None
+            if pending:
+                stack.extend(pending)
+            else:
+                self.generations[cid] = 1 + max([self.generations[p] for p in self.parents[cid]] or [0])
+                stack.pop()
+        return self.generations[commitid]
+
+    def isComplete(self, commitid):
+        return self.generation(commitid) is not None
+
+    def ancestors(self, commitid, minGeneration = 0):
+        '''
+        Returns the set of commits reachable from the passed one, including
+        itself, leaving out those with a generation lower than minGeneration
+        '''
+        with self._lock:
+            found = set()
+            stack = [commitid]
+            while stack:
+                cid = stack.pop()
+                if cid in found or cid not in self.parents:
+                    continue
+                if minGeneration and self._generation(cid) < minGeneration:
+                    continue
+                found.add(cid)
+                stack.extend(self.parents[cid])
+            return found
+
+    def isAncestor(self, ancestor, commitid):
+        '''Returns True if ancestor is reachable from commitid, or both are the same commit'''
+        generation = self.generation(ancestor)
+        if generation is None or self.generation(commitid) is None:
+            return False
+        return ancestor in self.ancestors(commitid, generation)
+
+    def mergeBase(self, commitid, commitid2):
+        '''
+        Returns the best common ancestor of two commits, that is, the common
+        ancestor with the highest generation, or None if they have no common history
+        '''
+        common = self.ancestors(commitid) & self.ancestors(commitid2)
+        if not common:
+            return None
+        return max(common, key = lambda c: (self.generations[c], c))
+
+    def aheadBehind(self, commitid, commitid2):
+        '''
+        Returns the number of commits reachable from the first commit but
+        not from the second one, and the other way round
+        '''
+        ancestors = self.ancestors(commitid)
+        ancestors2 = self.ancestors(commitid2)
+        return len(ancestors - ancestors2), len(ancestors2 - ancestors)
+
+    def topologicalOrder(self, commitids):
+        '''
+        Sorts the passed commits so that every commit comes before its
+        ancestors. Commits with unknown history are put at the end
+        '''
+        keys = {c: self.generation(c) or 0 for c in commitids}
+        return sorted(commitids, key = lambda c: (keys[c], c), reverse = True)
+
+
+_graphs = {}
+
+def commitGraph(url):
+    '''
+    Returns the commit graph of the repository at the passed url,
+    initially filled with the commits in the local commit store
+    '''
+    if url not in _graphs:
+        graph = CommitGraph()
+        for commitid, parents in commitStore().commitParents(url).items():
+            graph.addCommit(commitid, parents)
+        _graphs[url] = graph
+    return _graphs[url]
+
+def removeCommitGraph(url):
+    _graphs.pop(url, None)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    commitstore.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from geogig.tools.utils import userFolder
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+# Number of histories of each path kept in the store
+MAX_HISTORIES = 20
+
+
+class CommitStore(object):
+    '''
+    A local database of the commits read from GeoGig servers, keyed
+    by repository url and commit id. Commits are immutable, so entries
+    never have to be invalidated.
+
+    The number of changes in a commit is only known when it has been
+    read from an unfiltered log, since the server counts only the
+    changes under the path used as filter. Otherwise it is stored as
+    unknown and returned as zero.
+
+    The store also keeps the commits in the history of a layer at a given
+    commit, since they cannot be found from the commit graph
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._local = threading.local()
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.filename, timeout = 30)
+            self._local.con = con
+        with self._lock:
+            if not self._initialized:
+                con.execute('''CREATE TABLE IF NOT EXISTS commits (
+                                    repo TEXT NOT NULL,
+                                    commitid TEXT NOT NULL,
+                                    treeid TEXT,
+                                    parents TEXT,
+                                    message TEXT,
+                                    authorname TEXT,
+                                    authordate TEXT,
+                                    committername TEXT,
+                                    committerdate TEXT,
+                                    added INTEGER,
+                                    removed INTEGER,
+                                    modified INTEGER,
+                                    PRIMARY KEY (repo, commitid))''')
+                con.execute('''CREATE TABLE IF NOT EXISTS histories (
+                                    repo TEXT NOT NULL,
+                                    path TEXT NOT NULL,
+                                    head TEXT NOT NULL,
+                                    commitids TEXT,
+                                    PRIMARY KEY (repo, path, head))''')
+                con.commit()
+                self._initialized = True
+        return con
+
+    def addCommits(self, url, commits, countsKnown = True):
+        '''
+        Stores the passed commits. If countsKnown is False, the change
+        counts of the commits are not stored, and commits already in the
+        store are kept as they are
+        '''
+        if not commits:
+            return
+        rows = []
+        for c in commits:
+            counts = (c.added, c.removed, c.modified) if countsKnown else (None, None, None)
+            rows.append((url, c.commitid, c.treeid, " ".join(c._parents), c.message,
+                         c.authorname, c.authordate.strftime(DATE_FORMAT),
+                         c.committername, c.committerdate.strftime(DATE_FORMAT)) + counts)
+        sql = "INSERT OR %s INTO commits VALUES (?,?,?,?,?,?,?,?,?,?,?,?)" % ("REPLACE" if countsKnown else "IGNORE")
+        try:
+            con = self._connection()
+            with con:
+                con.executemany(sql, rows)
+        except sqlite3.Error:
+            pass # the store is just a cache, commits can be read again from the server
+
+    def commitData(self, url, commitid):
+        '''
+        Returns the arguments needed to create the Commit object for the
+        passed commit id, after the repository one, or None if it is not
+        in the store
+        '''
+        return self.commitsData(url, [commitid]).get(commitid)
+
+    def commitsData(self, url, commitids):
+        '''
+        Returns a dict with the arguments needed to create the Commit objects
+        for the passed commit ids, leaving out those not in the store
+        '''
+        commitids = list(commitids)
+        data = {}
+        try:
+            con = self._connection()
+            for i in range(0, len(commitids), 500):
+                chunk = commitids[i:i + 500]
+                rows = con.execute('''SELECT commitid, treeid, parents, message, authorname,
+                                             authordate, committername, committerdate,
+                                             added, removed, modified
+                                      FROM commits WHERE repo = ? AND commitid IN (%s)'''
+                                   % ",".join("?" * len(chunk)), [url] + chunk).fetchall()
+                for row in rows:
+                    (commitid, treeid, parents, message, authorname, authordate,
+                        committername, committerdate, added, removed, modified) = row
+                    data[commitid] = (commitid, treeid, parents.split(" "), message,
+                                      authorname, datetime.strptime(authordate, DATE_FORMAT),
+                                      committername, datetime.strptime(committerdate, DATE_FORMAT),
+                                      added or 0, removed or 0, modified or 0)
+        except sqlite3.Error:
+            return {}
+        return data
+
+    def changeCounts(self, url, commitids):
+        '''
+        Returns a dict with the total number of changes of the passed
+        commits, leaving out those not in the store or with unknown counts
+        '''
+        commitids = list(commitids)
+        counts = {}
+        try:
+            con = self._connection()
+            for i in range(0, len(commitids), 500):
+                chunk = commitids[i:i + 500]
+                rows = con.execute('''SELECT commitid, added + removed + modified FROM commits
+                                      WHERE repo = ? AND added IS NOT NULL AND commitid IN (%s)'''
+                                   % ",".join("?" * len(chunk)), [url] + chunk).fetchall()
+                counts.update(rows)
+        except sqlite3.Error:
+            pass
+        return counts
+
+    def commitParents(self, url):
+        '''Returns a dict with the parents of all the stored commits of a repository'''
+        try:
+            rows = self._connection().execute("SELECT commitid, parents FROM commits WHERE repo = ?",
+                                              (url,)).fetchall()
+        except sqlite3.Error:
+            return {}
+        return {commitid: parents.split(" ") for commitid, parents in rows}
+
+    def addHistory(self, url, path, head, commitids):
+        '''
+        Stores the ids of the commits in the history of a path at the passed
+        commit, as returned by the server. Only the last histories read for
+        each path are kept
+        '''
+        try:
+            con = self._connection()
+            with con:
+                con.execute("INSERT OR REPLACE INTO histories VALUES (?,?,?,?)",
+                            (url, path, head, " ".join(commitids)))
+                con.execute('''DELETE FROM histories WHERE repo = ? AND path = ? AND rowid NOT IN
+                                  (SELECT rowid FROM histories WHERE repo = ? AND path = ?
+                                   ORDER BY rowid DESC LIMIT ?)''',
+                            (url, path, url, path, MAX_HISTORIES))
+        except sqlite3.Error:
+            pass
+
+    def history(self, url, path, head):
+        '''
+        Returns the ids of the commits in the history of a path at the passed
+        commit, or None if it is not in the store
+        '''
+        try:
+            row = self._connection().execute("SELECT commitids FROM histories WHERE repo = ? AND path = ? AND head = ?",
+                                              (url, path, head)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        return row[0].split(" ") if row[0] else []
+
+    def removeRepo(self, url):
+        '''Removes all the commits of a repository'''
+        try:
+            con = self._connection()
+            with con:
+                con.execute("DELETE FROM commits WHERE repo = ?", (url,))
+                con.execute("DELETE FROM histories WHERE repo = ?", (url,))
+        except sqlite3.Error:
+            pass
+
+
+_commitStore = None
+
+def commitStore():
+    global _commitStore
+    if _commitStore is None:
+        _commitStore = CommitStore(os.path.join(userFolder(), "commits.sqlite"))
+    return _commitStore
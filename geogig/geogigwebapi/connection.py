@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    connection.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from geogig.config import CONNECTION_POOL_SIZE
+
+from qgiscommons2.settings import pluginSetting
+
+DEFAULT_POOL_SIZE = 10
+
+_sessions = {}
+_endpointHeaders = {}
+_lock = threading.Lock()
+
+
+def endpointRoot(url):
+    '''Returns the root URL of the GeoGig server that serves the passed URL'''
+    root = url.split("/repos")[0]
+    if not root.endswith("/"):
+        root += "/"
+    return root
+
+
+def _poolSize():
+    try:
+        return max(1, int(pluginSetting(CONNECTION_POOL_SIZE)))
+    except Exception:
+        return DEFAULT_POOL_SIZE
+
+
+def setEndpointHeaders(url, headers):
+    '''
+    Sets the headers to send with every request made to the endpoint
+    that serves the passed URL
+    '''
+    root = endpointRoot(url)
+    with _lock:
+        _endpointHeaders[root] = dict(headers)
+        if root in _sessions:
+            _sessions[root].headers.update(headers)
+
+
+def session(url):
+    '''
+    Returns the keep-alive session shared by all requests to the endpoint
+    that serves the passed URL, creating it the first time it is used
+    '''
+    root = endpointRoot(url)
+    with _lock:
+        if root not in _sessions:
+            size = _poolSize()
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            s.headers.update({"Connection": "keep-alive"})
+            s.headers.update(_endpointHeaders.get(root, {}))
+            _sessions[root] = s
+        return _sessions[root]
+
+
+def closeSessions():
+    '''Closes all pooled connections'''
+    with _lock:
+        for s in _sessions.values():
+            s.close()
+        _sessions.clear()
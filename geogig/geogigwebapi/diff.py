@@ -62,12 +62,23 @@ class LocalDiff(object):
         self.changetype = changetype
         self.oldcommitid = oldcommitid
         self.repo = repo
+        self._oldfeature = None
+
+    @property
+    def path(self):
+        return self.layername + "/" + self.fid
 
     @property
     def oldfeature(self):
         if self.changetype == LOCAL_FEATURE_ADDED:
             return {}
-        return self.repo.feature(self.layername + "/" + self.fid, self.oldcommitid)
+        if self._oldfeature is None:
+            self._oldfeature = self.repo.feature(self.path, self.oldcommitid)
+        return self._oldfeature
+
+    @oldfeature.setter
+    def oldfeature(self, feature):
+        self._oldfeature = feature
 
 class ConflictDiff(object):
 
@@ -82,6 +93,8 @@ class ConflictDiff(object):
         self.localFeature = localFeature
         self.localFeatureId = localFeatureId
         self.transactionId = transactionId
+        self.originFeature = None
+        self.remoteFeature = None
 
     def resolveWithLocalVersion(self):
         self.repo.resolveConflictWithFeatureId(self.path, self.localFeatureId, self.transactionId)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    history.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+from .commit import NULL_ID, Commit
+from .commitstore import commitStore
+from .commitgraph import commitGraph
+
+
+class HistoryIterator(object):
+    '''
+    Iterates over the commits in the history of a commit, with the same
+    interface as PageIterator. Commits already in the local commit store
+    are read from it, and only the missing ones are requested to the server.
+
+    For the whole history, the server is paged from the head commit until
+    all the commits not returned yet are in the local commit graph, and
+    the rest of them are read from the store, newest first. The history of
+    a path cannot be found from the graph, so it is read from the store
+    only if it was completely read before for the same head commit.
+
+    serverPages is a function that returns a PageIterator over the server
+    log of the head commit
+    '''
+
+    def __init__(self, repo, head, path, serverPages, pageSize):
+        self.repo = repo
+        self.head = head
+        self.path = path
+        self.pageSize = pageSize
+        self.finished = False
+        self._server = None
+        self._local = None
+        self._returned = []
+        self._returnedSet = set()
+        self._frontier = set()
+        if path is None:
+            if commitGraph(repo.url).isComplete(head):
+                self._local = self._knownCommits(self._unreturnedAncestors([head]))
+        else:
+            commitids = commitStore().history(repo.url, path, head)
+            if commitids is not None:
+                self._local = self._knownCommits(commitids)
+        if self._local is None:
+            self._server = serverPages()
+
+    def _unreturnedAncestors(self, commitids):
+        graph = commitGraph(self.repo.url)
+        ancestors = set()
+        for cid in commitids:
+            ancestors.update(graph.ancestors(cid))
+        return [cid for cid in ancestors if cid not in self._returnedSet]
+
+    def _knownCommits(self, commitids):
+        '''
+        Returns the passed commits as Commit objects, newest first, or None
+        if any of them is not in the store
+        '''
+        data = commitStore().commitsData(self.repo.url, commitids)
+        if len(data) != len(set(commitids)):
+            return None
+        commits = [Commit(self.repo, *data[cid]) for cid in commitids]
+        if self.path is None:
+            graph = commitGraph(self.repo.url)
+            commits.sort(key = lambda c: (c.committerdate, graph.generation(c.commitid)), reverse = True)
+        return commits
+
+    def _switchToLocal(self):
+        # all the commits that the server has still to return are known
+        for cid in self._frontier:
+            if not commitGraph(self.repo.url).isComplete(cid):
+                return
+        commits = self._knownCommits(self._unreturnedAncestors(self._frontier))
+        if commits is not None:
+            self._server.cancel()
+            self._server = None
+            self._local = commits
+
+    def _addReturned(self, commits):
+        for commit in commits:
+            self._returned.append(commit.commitid)
+            self._returnedSet.add(commit.commitid)
+
+    def pageReady(self):
+        return self.finished or self._server is None or self._server.pageReady()
+
+    def nextPage(self):
+        '''Returns the commits in the next page, or an empty list if there are no more pages'''
+        if self.finished:
+            return []
+        if self._server is not None:
+            commits = self._server.nextPage()
+            self._addReturned(commits)
+            if commits and self.path is None:
+                for commit in commits:
+                    self._frontier.discard(commit.commitid)
+                for commit in commits:
+                    self._frontier.update([p for p in commit._parents
+                                           if p != NULL_ID and p not in self._returnedSet])
+                if self._frontier:
+                    self._switchToLocal()
+        else:
+            commits, self._local = self._local[:self.pageSize], self._local[self.pageSize:]
+            self._addReturned(commits)
+        if not commits:
+            if self._server is not None and self.path is not None and not self.finished:
+                commitStore().addHistory(self.repo.url, self.path, self.head, self._returned)
+            self.close()
+        return commits
+
+    def __iter__(self):
+        try:
+            while True:
+                commits = self.nextPage()
+                if not commits:
+                    return
+                for commit in commits:
+                    yield commit
+        finally:
+            self.close()
+
+    def cancel(self):
+        '''Stops fetching commits'''
+        self.close()
+
+    def close(self):
+        if not self.finished:
+            self.finished = True
+            if self._server is not None:
+                self._server.cancel()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    paging.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+# Number of pages requested to the server ahead of the one being consumed
+PREFETCH_PAGES = 3
+
+
+class PageIterator(object):
+    '''
+    Iterates over the items of a paged server response, fetching the
+    following pages in background threads while the current one is
+    consumed. fetchPage is called with the page number and must return
+    the list of items in it, or an empty list past the last page.
+
+    Items can be consumed one by one iterating over this object, or a
+    page at a time with nextPage. pageReady tells whether nextPage can
+    be called without blocking, so GUI code can poll it from a timer.
+
+    If the number of items per page is passed as pageSize, a page with
+    fewer items is taken as the last one. If limit is passed, no more
+    pages are requested once that number of items has been received
+    '''
+
+    def __init__(self, fetchPage, prefetch = PREFETCH_PAGES, pageSize = None, limit = None):
+        self.fetchPage = fetchPage
+        self.prefetch = max(1, prefetch)
+        self.pageSize = pageSize
+        self.limit = limit
+        self.finished = False
+        self._count = 0
+        self._pool = ThreadPool(self.prefetch)
+        self._pending = deque()
+        self._page = 0
+        self._fill()
+
+    def _fill(self):
+        while not self.finished and len(self._pending) < self.prefetch:
+            self._pending.append(self._pool.apply_async(self.fetchPage, (self._page,)))
+            self._page += 1
+
+    def pageReady(self):
+        return self.finished or self._pending[0].ready()
+
+    def nextPage(self):
+        '''Returns the items in the next page, or an empty list if there are no more pages'''
+        if self.finished:
+            return []
+        try:
+            items = self._pending.popleft().get()
+        except:
+            self.close()
+            raise
+        if not items:
+            self.close()
+            return []
+        self._count += len(items)
+        if ((self.limit is not None and self._count >= self.limit)
+                or (self.pageSize is not None and len(items) < self.pageSize)):
+            self.close()
+        else:
+            self._fill()
+        return items
+
+    def __iter__(self):
+        try:
+            while True:
+                items = self.nextPage()
+                if not items:
+                    return
+                for item in items:
+                    yield item
+        finally:
+            self.close()
+
+    def cancel(self):
+        '''Stops fetching pages. Pages already requested are discarded'''
+        self.close()
+
+    def close(self):
+        if not self.finished:
+            self.finished = True
+            self._pending.clear()
+            self._pool.close()
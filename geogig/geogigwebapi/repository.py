@@ -34,24 +34,33 @@ import time
 import sqlite3
 from datetime import datetime
 import shutil
+import threading
 import xml.etree.ElementTree as ET
 from collections import defaultdict
+from multiprocessing.pool import ThreadPool
 
-import requests
 from requests.exceptions import HTTPError, ConnectionError
 from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
 
-from qgis.PyQt.QtCore import pyqtSignal, Qt, QTimer, QObject, QEventLoop
+from qgis.PyQt.QtCore import pyqtSignal, Qt, QObject
 from qgis.PyQt.QtGui import QCursor
 from qgis.PyQt.QtWidgets import QApplication
 
-from qgis.core import QgsMessageLog, QgsCoordinateTransform, QgsCoordinateReferenceSystem, QgsFeatureRequest, NULL
+from qgis.core import (QgsMessageLog, QgsCoordinateTransform, QgsCoordinateReferenceSystem,
+                       QgsFeatureRequest, QgsVectorLayer, NULL)
 from qgis.utils import iface
 
 from geogig import config
-from geogig.config import LOG_SERVER_CALLS
+from geogig.config import LOG_SERVER_CALLS, DIFF_CACHE_SIZE, LAYER_CACHE_SIZE, FEATURE_CACHE_SIZE
+from geogig.repowatcher import repoWatcher
 
+from geogig.geogigwebapi.connection import session
+from geogig.geogigwebapi.tasks import taskPoller, Future, isMainThread, runInMainThread, FINISHED
+from geogig.geogigwebapi.paging import PageIterator, PREFETCH_PAGES
 from geogig.geogigwebapi.commit import NULL_ID, Commit
+from geogig.geogigwebapi.commitstore import commitStore
+from geogig.geogigwebapi.commitgraph import commitGraph, removeCommitGraph
+from geogig.geogigwebapi.history import HistoryIterator
 from geogig.geogigwebapi.commitish import Commitish
 from geogig.geogigwebapi.diff import Diffentry, ConflictDiff
 
@@ -59,7 +68,16 @@ from qgiscommons2.gui import execute
 
 from geogig.tools.layers import formatSource, namesFromLayer
 from geogig.tools.utils import userFolder, resourceFile
+from geogig.tools.filecache import FileCache, cacheKey
+from geogig.tools.featurecache import FeatureCache
+from geogig.tools.interchange import copyDatabase, saveAuditTables, fillColumns, UPDATE
+from geogig.tools.fids import FidMapping, fidMapping
+from geogig.tools.geometries import gpkgToWkt
+from geogig.tools.dbconnection import connect
+from geogig.tools.jobs import (reportProgress, progressReporter, addCancelAction,
+                               checkCancelled, JobCancelledException, jobManager)
 from geogig.tools.layertracking import isRepoLayer, getTrackingInfoForGeogigLayer
+from geogig.tools.profiles import layerProfile
 
 from qgiscommons2.settings import pluginSetting
 from qgiscommons2.files import tempFilenameInTempFolder
@@ -96,12 +114,79 @@ def _resolveref(ref):
 
 SHA_MATCHER = re.compile(r"\b([a-f0-9]{40})\b")
 
+def _bboxparam(bbox):
+    '''Formats a (QgsRectangle, crs authid) bounding box as expected by the export command'''
+    rect, authid = bbox
+    if authid != "EPSG:4326":
+        trans = QgsCoordinateTransform(QgsCoordinateReferenceSystem(authid),
+                                       QgsCoordinateReferenceSystem("EPSG:4326"))
+        rect = trans.transformBoundingBox(rect)
+    return ",".join([repr(rect.xMinimum()), repr(rect.yMinimum()),
+                     repr(rect.xMaximum()), repr(rect.yMaximum()), "EPSG:4326"])
+
 def _ensurelist(o):
     if isinstance(o, list):
         return o
     else:
         return [o]
 
+# Number of features of a layer from which the features method exports
+# the whole layer instead of fetching them one by one, if they are also at
+# least the given fraction of the features of the layer
+FEATURES_EXPORT_THRESHOLD = 200
+FEATURES_EXPORT_FRACTION = 0.25
+# Maximum number of features fetched at the same time by the features method
+MAX_CONCURRENT_FEATURE_CALLS = 8
+
+# Seconds a resolved ref is trusted before asking the server again.
+# Other users can move branches at any time, so it must be short
+REF_CACHE_TTL = 10
+# Commits per page requested by the log method. Same as the server default,
+# so a shorter page always means the end of the history
+LOG_PAGE_SIZE = 30
+
+class RefCache(object):
+    '''
+    Commit ids of the refs resolved recently, per repository. Entries of
+    a repository are dropped when it changes, or when a ref is moved
+    from this client
+    '''
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._refs = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, ref):
+        with self._lock:
+            try:
+                commitid, timestamp = self._refs[(url, ref)]
+            except KeyError:
+                return None
+            if time.time() - timestamp > self.ttl:
+                del self._refs[(url, ref)]
+                return None
+            return commitid
+
+    def put(self, url, ref, commitid):
+        with self._lock:
+            self._refs[(url, ref)] = (commitid, time.time())
+
+    def invalidate(self, url = None):
+        with self._lock:
+            if url is None:
+                self._refs.clear()
+            else:
+                for key in [k for k in self._refs if k[0] == url]:
+                    del self._refs[key]
+
+refCache = RefCache(REF_CACHE_TTL)
+
+def _repoChanged(repo):
+    refCache.invalidate(repo.url)
+
+repoWatcher.repoChanged.connect(_repoChanged)
+
 
 class Repository(object):
 
@@ -125,6 +210,10 @@ class Repository(object):
     def __ne__(self, o):
         return not self.__eq__(o)
 
+    @property
+    def _session(self):
+        return session(self.rootUrl)
+
     def __log(self, url, response, params, operation = "GET"):
         if pluginSetting(LOG_SERVER_CALLS):
             msg = "%s: %s\nPARAMS: %s\nRESPONSE: %s" % (operation, url, params, response)
@@ -135,26 +224,26 @@ class Repository(object):
             if transaction:
                 url = self.url + "beginTransaction"
                 params = {"output_format":"json"}
-                r = requests.get(url, params=params)
+                r = self._session.get(url, params=params)
                 r.raise_for_status()
                 self.__log(url, r.json(), params)
                 transactionId = r.json()["response"]["Transaction"]["ID"]
                 payload["output_format"] = "json"
                 payload["transactionId"] = transactionId
                 url = self.url + command
-                r = requests.get(url, params=payload)
+                r = self._session.get(url, params=payload)
                 r.raise_for_status()
                 resp = json.loads(r.text.replace(r"\/", "/"))["response"]
                 self.__log(url, resp, payload)
                 params = {"transactionId":transactionId, "output_format":"json"}
-                r = requests.get(self.url + "endTransaction", params = params)
+                r = self._session.get(self.url + "endTransaction", params = params)
                 r.raise_for_status()
                 self.__log(url, r.json(), params)
                 return resp
             else:
                 payload["output_format"] = "json"
                 url = self.url + command
-                r = requests.get(url, params=payload)
+                r = self._session.get(url, params=payload)
                 r.raise_for_status()
                 j = json.loads(r.text.replace(r"\/", "/"))
                 self.__log(url, r.json(), payload)
@@ -165,6 +254,8 @@ class Repository(object):
             raise GeoGigException(msg)
 
     def _apicall(self, command, payload = {}, transaction = False):
+        if not isMainThread():
+            return self.__apicall(command, payload, transaction)
         return execute(lambda: self.__apicall(command, payload, transaction))
 
     def branches(self):
@@ -173,115 +264,339 @@ class Repository(object):
 
     def createbranch(self, ref, branch):
         self._apicall("branch", {"branchName":branch, "source": ref})
+        refCache.invalidate(self.url)
 
     def deletebranch(self, branch):
         self._apicall("updateref", {"name": branch, "delete": True})
+        refCache.invalidate(self.url)
 
     def tags(self):
         r = self._apicall("tag", {})
         if "Tag" in r:
             tags = {t["name"]: t["commitid"] for t in _ensurelist(r["Tag"])}
+            # the listing already has the commit of each tag, so resolving them needs no more calls
+            for tag, commitid in tags.items():
+                refCache.put(self.url, tag, commitid)
         else:
             tags = {}
         return tags
 
     def createtag(self, ref, tag):
-        r = requests.post(self.url + "tag", params = {"commit":ref, "name": tag, "message": tag}, json = {})
+        r = self._session.post(self.url + "tag", params = {"commit":ref, "name": tag, "message": tag}, json = {})
         r.raise_for_status()
+        refCache.invalidate(self.url)
 
     def deletetag(self, tag):
         self._apicall("updateref", {"name": tag, "delete": True})
+        refCache.invalidate(self.url)
 
     def diff(self, oldRefSpec, newRefSpec, pathFilter = None):
+        return list(self.iterdiff(oldRefSpec, newRefSpec, pathFilter))
+
+    def iterdiff(self, oldRefSpec, newRefSpec, pathFilter = None, prefetch = PREFETCH_PAGES):
+        '''
+        Returns an iterator over the Diffentry objects representing the
+        changes between two refs. Entries are available as soon as the
+        page that contains them arrives, and the following pages are
+        fetched in the background. Call cancel() on it to stop fetching
+        '''
         payload = {"oldRefSpec": oldRefSpec, "newRefSpec": newRefSpec}
         if pathFilter is not None:
             payload["pathFilter"]= pathFilter
-        changes = []
-        payload["page"] = 0
-        while True:
-            resp = self._apicall("diff", payload)
+        def _fetchPage(page):
+            pagePayload = dict(payload)
+            pagePayload["page"] = page
+            resp = self._apicall("diff", pagePayload)
             if "diff" in resp and resp["diff"]:
-                for d in _ensurelist(resp["diff"]):
-                    path = d["newPath"] or d["path"]
-                    changes.append(Diffentry(self, oldRefSpec, newRefSpec,
-                                                path, d["changeType"]))
-                payload["page"] += 1
+                return [Diffentry(self, oldRefSpec, newRefSpec, d["newPath"] or d["path"], d["changeType"])
+                        for d in _ensurelist(resp["diff"])]
             else:
-                break
-        return changes
+                return []
+        return PageIterator(_fetchPage, prefetch)
 
     def _downloadfile(self, taskid, filename):
         url  = self.rootUrl + "tasks/%s/download" % str(taskid)
-        r = requests.get(url, stream=True)
-        r.raise_for_status()
-        with open(filename, 'wb') as f:
-            total = r.headers.get('content-length')
-            if total is None:
-                r.raw.decode_content = True
-                shutil.copyfileobj(r.raw, f)
-            else:
-                dl = 0
-                total = float(total)
-                for data in r.iter_content(chunk_size=4096):
-                    dl += len(data)
-                    f.write(data)
-                    done = int(100 * dl / total)
-                    iface.mainWindow().statusBar().showMessage("Transferring geopkg from GeoGig server [{}%]".format(done))
-
-        iface.mainWindow().statusBar().showMessage("")
-
-    def exportdiff(self, oldRef, newRef, filename, layername = None):
-        QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
+        r = self._session.get(url, stream=True)
+        try:
+            r.raise_for_status()
+            with open(filename, 'wb') as f:
+                total = r.headers.get('content-length')
+                if total is None:
+                    r.raw.decode_content = True
+                    shutil.copyfileobj(r.raw, f)
+                else:
+                    dl = 0
+                    total = float(total)
+                    for data in r.iter_content(chunk_size=4096):
+                        dl += len(data)
+                        f.write(data)
+                        reportProgress("Transferring geopkg from GeoGig server", int(100 * dl / total))
+        finally:
+            # return the connection to the pool even if the transfer fails
+            r.close()
+
+        reportProgress("")
+
+    def _aftertask(self, taskid, then, callback = None):
+        '''
+        Waits for a server task to finish and returns the result of calling
+        then with the task response. If a callback is passed, it returns
+        a Future instead. then is called in a worker thread, so it does not
+        block the main thread, and the callback is called in the main
+        thread with the Future when done
+        '''
+        task = taskPoller.watch(self.rootUrl, taskid, onProgress = progressReporter())
+        addCancelAction(lambda: self._canceltask(task))
+        if callback is None:
+            mainThread = isMainThread()
+            if mainThread:
+                QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
+            try:
+                return then(task.result())
+            finally:
+                if mainThread:
+                    QApplication.restoreOverrideCursor()
+        future = Future()
+        def _then(f):
+            try:
+                result = then(f.result())
+            except Exception as e:
+                runInMainThread(lambda exception = e: future.setException(exception))
+                return
+            runInMainThread(lambda: future.setResult(result))
+        def _taskFinished(f):
+            t = threading.Thread(target=_then, args=(f,))
+            t.daemon = True
+            t.start()
+        task.addDoneCallback(_taskFinished)
+        future.addDoneCallback(callback)
+        return future
+
+    def _canceltask(self, task):
+        try:
+            self._session.get(task.url, params = {"cancel": True})
+        except:
+            pass
+        task.setException(JobCancelledException())
+
+    def _completed(self, result, callback = None):
+        if callback is None:
+            return result
+        future = Future.completed(result)
+        future.addDoneCallback(callback)
+        return future
+
+    def exportdiff(self, oldRef, newRef, filename, layername = None, callback = None):
+        '''
+        Exports the differences between two refs to a geopackage.
+        Diffs between resolved commits never change, so they are kept in
+        a disk cache and later requests for them do not reach the server.
+        If a callback is passed, this method returns a Future right away
+        and the callback is called with it once the diff is exported
+        '''
+        oldRef, newRef = self.revparse(oldRef), self.revparse(newRef)
+        key = cacheKey(self.url, oldRef, newRef, layername)
+        if diffCache().get(key, filename):
+            return self._completed(filename, callback)
+        def _download(response):
+            self._downloadfile(taskid, filename)
+            diffCache().put(key, filename)
+            return filename
+        taskid = self._prepareexportdiff(oldRef, newRef, layername)
+        return self._aftertask(taskid, _download, callback)
+
+    def _prepareexportdiff(self, oldRef, newRef, layername = None):
         params = {"oldRef": oldRef, "newRef": newRef, "format": "gpkg"}
         if layername is not None:
             params["path"] = layername
         url  = self.url + "export-diff.json"
-        r = requests.get(url, params=params)
+        r = self._session.get(url, params=params)
         r.raise_for_status()
-        taskid = r.json()["task"]["id"]
-        checker = TaskChecker(self.rootUrl, taskid)
-        loop = QEventLoop()
-        checker.taskIsFinished.connect(loop.exit, Qt.QueuedConnection)
-        checker.start()
-        loop.exec_(flags = QEventLoop.ExcludeUserInputEvents)
-        self._downloadfile(taskid, filename)
-        QApplication.restoreOverrideCursor()
+        return r.json()["task"]["id"]
 
     def featurediff(self, oldTreeish, newTreeish, path, allAttrs = True):
-        payload = {"oldTreeish": _resolveref(oldTreeish), "newTreeish": _resolveref(newTreeish),
-                   "path": path, "all": allAttrs}
-        resp = self._apicall("featurediff", payload)
-        return _ensurelist(resp["diff"])
+        oldCommitId = self.revparse(_resolveref(oldTreeish))
+        newCommitId = self.revparse(_resolveref(newTreeish))
+        key = cacheKey(self.url, "featurediff", oldCommitId, newCommitId, path, allAttrs)
+        featurediff = featureCache().get(key)
+        if featurediff is None:
+            payload = {"oldTreeish": oldCommitId, "newTreeish": newCommitId,
+                       "path": path, "all": allAttrs}
+            resp = self._apicall("featurediff", payload)
+            featurediff = _ensurelist(resp["diff"])
+            featureCache().put(key, featurediff)
+        return featurediff
 
     def feature(self, path, ref):
-        payload = {"oldTreeish": _resolveref(ref), "newTreeish": _resolveref(ref), "path": path, "all": True}
-        resp = self._apicall("featurediff", payload)
-        featurediff = _ensurelist(resp["diff"])
-        return {f["attributename"]: f.get("oldvalue", None) for f in featurediff}
+        commitid = self.revparse(_resolveref(ref))
+        key = cacheKey(self.url, "feature", commitid, path)
+        feature = featureCache().get(key)
+        if feature is None:
+            payload = {"oldTreeish": commitid, "newTreeish": commitid, "path": path, "all": True}
+            resp = self._apicall("featurediff", payload)
+            featurediff = _ensurelist(resp["diff"])
+            feature = {f["attributename"]: f.get("oldvalue", None) for f in featurediff}
+            featureCache().put(key, feature)
+        return feature
+
+    def features(self, paths, ref):
+        '''
+        Returns a dict with the attributes of the features at the passed
+        paths in the given ref, keyed by path. Features that cannot be
+        found are not in it.
+
+        For a few features of a layer, the features are fetched one by
+        one in concurrent calls. If they are a large part of the layer, the
+        layer is exported at that ref and the features are read from the
+        exported geopackage
+        '''
+        commitid = self.revparse(_resolveref(ref))
+        features = {}
+        byLayer = defaultdict(list)
+        for path in set(paths):
+            feature = featureCache().get(cacheKey(self.url, "feature", commitid, path))
+            if feature is None:
+                byLayer[path.split("/")[0]].append(path)
+            else:
+                features[path] = feature
+        toFetch = []
+        for layername, layerPaths in byLayer.items():
+            if self._exportforfeatures(layername, len(layerPaths), commitid):
+                features.update(self._featuresfromexport(layername, layerPaths, commitid))
+            else:
+                toFetch.extend(layerPaths)
+        if toFetch:
+            def _fetch(path):
+                try:
+                    return path, self.feature(path, commitid)
+                except:
+                    return path, None
+            pool = ThreadPool(min(len(toFetch), MAX_CONCURRENT_FEATURE_CALLS))
+            try:
+                for path, feature in pool.imap_unordered(_fetch, toFetch):
+                    if feature is not None:
+                        features[path] = feature
+            finally:
+                pool.close()
+        return features
+
+    def _exportforfeatures(self, layername, count, commitid):
+        if count < FEATURES_EXPORT_THRESHOLD:
+            return False
+        layerCount = self.layerfeaturecount(layername, commitid)
+        return layerCount is not None and count >= layerCount * FEATURES_EXPORT_FRACTION
+
+    def layerfeaturecount(self, layername, ref):
+        '''
+        Returns the number of features of a layer in the given ref, or None
+        if the server does not report it
+        '''
+        commitid = self.revparse(_resolveref(ref))
+        key = cacheKey(self.url, "featurecount", commitid, layername)
+        count = featureCache().get(key)
+        if count is None:
+            resp = self._apicall("ls-tree", {"onlyTrees": True, "verbose": True, "path": commitid})
+            for node in _ensurelist(resp.get("node", [])):
+                if node.get("path") == layername and "size" in node:
+                    count = int(node["size"])
+                    featureCache().put(key, count)
+        return count
+
+    def _featuresfromexport(self, layername, paths, commitid):
+        '''
+        Reads features from an export of the layer, with the same values
+        that the feature method returns, and adds them to the feature cache.
+        No QGIS layer is used, so it can run in any thread
+        '''
+        filename = tempFilenameInTempFolder(layername + ".gpkg")
+        self.checkoutlayer(filename, layername, ref = commitid)
+        pathsByFid = {path.split("/")[-1]: path for path in paths}
+        gpkgFids = FidMapping(filename, layername).gpkgFids(list(pathsByFid.keys()))
+        pathsByGpkgFid = {gpkgfid: pathsByFid[geogigfid] for geogigfid, gpkgfid in gpkgFids.items()}
+        features = {}
+        con = connect(filename)
+        try:
+            cursor = con.cursor()
+            geomField = cursor.execute("SELECT column_name FROM gpkg_geometry_columns WHERE table_name=?;",
+                                       (layername,)).fetchone()[0]
+            columns = [(c[1], c[2].upper()) for c in cursor.execute('PRAGMA table_info("%s");' % layername)
+                       if c[1] != "fid"]
+            sql = 'SELECT fid, %s FROM "%s" WHERE fid IN (%%s);' % (", ".join(['"%s"' % c[0] for c in columns]),
+                                                                  layername)
+            gpkgfids = list(pathsByGpkgFid.keys())
+            for i in range(0, len(gpkgfids), 500):
+                chunk = gpkgfids[i:i + 500]
+                cursor.execute(sql % ",".join("?" * len(chunk)), chunk)
+                for row in cursor.fetchall():
+                    feature = {}
+                    for (name, sqlType), value in zip(columns, row[1:]):
+                        if name == geomField:
+                            value = gpkgToWkt(value)
+                        elif sqlType == "BOOLEAN" and value is not None:
+                            value = bool(value)
+                        feature[name] = value
+                    path = pathsByGpkgFid[row[0]]
+                    features[path] = feature
+                    featureCache().put(cacheKey(self.url, "feature", commitid, path), feature)
+        finally:
+            con.close()
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        return features
 
-    def log(self, until = None, path = None, limit = None):
+    def log(self, until = None, path = None, limit = None, since = None):
+        try:
+            return list(self.iterlog(until, path, limit, since))
+        except HTTPError as e:
+            #TODO more accurate error treatment
+            return []
+
+    def iterlog(self, until = None, path = None, limit = None, since = None, prefetch = PREFETCH_PAGES):
+        '''
+        Returns an iterator over the commits in the history of a ref.
+        Pages of commits are fetched in the background ahead of the one
+        being consumed, so long histories can be read lazily. Call
+        cancel() on it to stop fetching. With a limit, pages are fetched
+        one at a time, as usually a single one is needed.
+
+        For a full history, commits already in the local commit store are
+        not requested to the server again
+        '''
+        head = None
+        if since is None and limit is None:
+            try:
+                head = self.revparse(_resolveref(until) or self.HEAD)
+            except:
+                pass # empty repository. The server log gives the right answer
+            until = head or until
         payload = {"path": path} if path is not None else {}
         if until is not None:
             payload["until"]= _resolveref(until)
+        if since is not None:
+            payload["since"]= _resolveref(since)
         if limit is not None:
             payload["limit"] = limit
         payload["countChanges"] = True
-        commits = []
-        payload["page"] = 0
-        while True:
-            try:
-                resp = self._apicall("log", payload)
-            except HTTPError as e:
-                #TODO more accurate error treatment
-                return []
+        payload["elementsPerPage"] = LOG_PAGE_SIZE
+        def _fetchPage(page):
+            pagePayload = dict(payload)
+            pagePayload["page"] = page
+            resp = self._apicall("log", pagePayload)
             if "commit" in resp and resp["commit"]:
-                for c in _ensurelist(resp["commit"]):
-                    commits.append(self._parseCommit(c))
-                payload["page"] += 1
+                commits = [self._parseCommit(c) for c in _ensurelist(resp["commit"])]
+                commitStore().addCommits(self.url, commits, countsKnown = path is None)
+                commitGraph(self.url).addCommits(commits)
+                return commits
             else:
-                break
-
-        return commits
+                return []
+        if limit is not None:
+            prefetch = 1
+        if head is not None:
+            return HistoryIterator(self, head, path, lambda: PageIterator(_fetchPage, prefetch, LOG_PAGE_SIZE),
+                                   LOG_PAGE_SIZE)
+        return PageIterator(_fetchPage, prefetch, LOG_PAGE_SIZE, limit)
 
     def _parseCommit(self, c):
         parentslist = _ensurelist(c["parents"])
@@ -297,6 +612,89 @@ class Repository(object):
                  c["committer"]["name"], committerdate,
                  c.get("adds", 0), c.get("removes", 0), c.get("modifies", 0))
 
+    def _graphids(self, *refs):
+        '''
+        Resolves the passed refs, making sure that their whole history is
+        in the local commit graph. The history of a commit is only
+        downloaded the first time it is needed. It reports its progress
+        and can be cancelled when run in a job
+        '''
+        graph = commitGraph(self.url)
+        ids = [self.revparse(ref) for ref in refs]
+        for cid in ids:
+            if cid != NULL_ID and not graph.isComplete(cid):
+                commits = self.iterlog(until = cid)
+                addCancelAction(commits.cancel)
+                count = 0
+                while True:
+                    page = commits.nextPage()
+                    if not page:
+                        break
+                    count += len(page)
+                    reportProgress("Reading repository history [%i commits]" % count)
+                checkCancelled()
+                reportProgress("")
+        return ids
+
+    def hascompletehistory(self, *refs):
+        '''Returns True if the whole history of the passed refs is in the local commit graph'''
+        graph = commitGraph(self.url)
+        return all(cid == NULL_ID or graph.isComplete(cid) for cid in [self.revparse(ref) for ref in refs])
+
+    def loadhistory(self, refs, callback):
+        '''
+        Makes sure the whole history of the passed refs is in the local commit
+        graph, so ancestry queries on them do not reach the server, and then
+        calls callback. If the history is not known, it is downloaded in a job,
+        so the main thread is not blocked, and callback is called in the main
+        thread once it finishes. It is not called if the job fails or is cancelled
+        '''
+        if self.hascompletehistory(*refs):
+            callback()
+        else:
+            jobManager.submit("Read history of repository '%s'" % (self.title or self.url),
+                              lambda: self._graphids(*refs), lambda ids: callback())
+
+    def isancestor(self, ancestorRef, ref):
+        '''Returns True if ancestorRef is in the history of ref'''
+        ancestor, commitid = self._graphids(ancestorRef, ref)
+        return commitGraph(self.url).isAncestor(ancestor, commitid)
+
+    def mergebase(self, ref, ref2):
+        '''Returns the id of the best common ancestor of two refs, or None if they have no common history'''
+        commitid, commitid2 = self._graphids(ref, ref2)
+        return commitGraph(self.url).mergeBase(commitid, commitid2)
+
+    def aheadbehind(self, ref, ref2):
+        '''Returns the number of commits in ref and not in ref2, and the other way round'''
+        commitid, commitid2 = self._graphids(ref, ref2)
+        return commitGraph(self.url).aheadBehind(commitid, commitid2)
+
+    def topologicalorder(self, commits):
+        '''Sorts the passed Commit objects so each one comes before its ancestors'''
+        self._graphids(*[c.commitid for c in commits])
+        byId = {c.commitid: c for c in commits}
+        return [byId[cid] for cid in commitGraph(self.url).topologicalOrder(list(byId.keys()))]
+
+    def estimatedchanges(self, oldRef, newRef):
+        '''
+        Returns an upper bound of the number of features that differ between
+        two commits, adding up the change counts of the commits reachable
+        from only one of them. The commits are taken from the local commit
+        graph, and their counts from the commit store
+        '''
+        oldCommitId, newCommitId = self._graphids(oldRef, newRef)
+        graph = commitGraph(self.url)
+        commitids = graph.ancestors(oldCommitId) ^ graph.ancestors(newCommitId)
+        counts = commitStore().changeCounts(self.url, commitids)
+        count = sum(counts.values())
+        # commits only read from filtered logs have unknown counts
+        for cid in commitids:
+            if cid not in counts:
+                commit = self.log(until = cid, limit = 1)[0]
+                count += commit.added + commit.removed + commit.modified
+        return count
+
     def lastupdated(self):
         try:
             return self.log(limit = 1)[0].committerdate
@@ -327,12 +725,12 @@ class Repository(object):
 
     def _checkoutbranch(self, branch, transactionId):
         payload = {"branch": branch,"transactionId": transactionId}
-        r = requests.get(self.url + "checkout", params = payload)
+        r = self._session.get(self.url + "checkout", params = payload)
         self.__log(r.url, r.text, payload)
         r.raise_for_status()
 
     def removetree(self, path, user, email, branch = None):
-        r = requests.get(self.url + "beginTransaction", params = {"output_format":"json"})
+        r = self._session.get(self.url + "beginTransaction", params = {"output_format":"json"})
         r.raise_for_status()
         transactionId = r.json()["response"]["Transaction"]["ID"]
         self.__log(r.url, r.json(), params = {"output_format":"json"})
@@ -340,14 +738,14 @@ class Repository(object):
             self._checkoutbranch(branch, transactionId)
         payload = {"path":path, "recursive":"true", "output_format": "json",
                    "transactionId": transactionId}
-        r = requests.get(self.url + "remove", params=payload)
+        r = self._session.get(self.url + "remove", params=payload)
         r.raise_for_status()
         self.__log(r.url, r.json(), payload)
 
         params = {"all": True, "message": "removed layer %s" % path,
                   "transactionId": transactionId,
                   "authorName": user, "authorEmail": email}
-        r = requests.get(self.url + "commit", params = params)
+        r = self._session.get(self.url + "commit", params = params)
         self.__log(r.url, r.text, params)
         r.raise_for_status()
         if branch:
@@ -358,70 +756,114 @@ class Repository(object):
         '''Returns the SHA-1 of a given element, represented as a string'''
         if SHA_MATCHER.match(rev) is not None:
             return rev
-        else:
-            return self._apicall("refparse", {"name": rev})["Ref"]["objectId"]
+        commitid = refCache.get(self.url, rev)
+        if commitid is None:
+            commitid = self._apicall("refparse", {"name": rev})["Ref"]["objectId"]
+            refCache.put(self.url, rev, commitid)
+        return commitid
 
     def _preparelayerdownload(self, layername, bbox = None, ref = None):
         ref = _resolveref(ref) or self.HEAD
         params = {"root": ref, "format": "gpkg", "table": layername,
                   "path": layername, "interchange":True}
         if bbox is not None:
-            trans = QgsCoordinateTransform(QgsCoordinateReferenceSystem(bbox[1]),
-                                            QgsCoordinateReferenceSystem("EPSG:4326"))
-            bbox4326 = trans.transform(bbox[0])
-            sbbox = ",".join([bbox4326.xMinimum(), bbox4326.xMaximum(),
-                             bbox4326.yMinimum(), bbox4326.yMaximum(), "EPSG:4326"])
-            params["bbox"] = sbbox
+            params["bbox"] = _bboxparam(bbox)
         url  = self.url + "export.json"
-        r = requests.get(url, params=params)
+        r = self._session.get(url, params=params)
         r.raise_for_status()
         return r.json()["task"]["id"]
 
-    def checkoutlayer(self, filename, layername, bbox = None, ref = None):
-        QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
-        iface.mainWindow().statusBar().showMessage("Creating geopkg on GeoGig server...")
-        taskid = self._preparelayerdownload(layername, bbox, ref)
-        checker = TaskChecker(self.rootUrl, taskid)
-        loop = QEventLoop()
-        checker.taskIsFinished.connect(loop.exit, Qt.QueuedConnection)
-        checker.start()
-        loop.exec_(flags = QEventLoop.ExcludeUserInputEvents)
-        self._downloadfile(taskid, filename)
-        QApplication.restoreOverrideCursor()
+    def checkoutlayer(self, filename, layername, bbox = None, ref = None, callback = None):
+        '''
+        Downloads a layer at the given commit to a geopackage.
+        Checked out layers are kept in a disk cache, so switching back to
+        a version that was downloaded before does not reach the server.
+        If a callback is passed, this method returns a Future right away
+        and the callback is called with it once the layer is downloaded
+        '''
+        commitid = self.revparse(_resolveref(ref) or self.HEAD)
+        key = self._layerCacheKey(layername, commitid, bbox)
+        snapshot = layerCache().path(key)
+        if snapshot is not None:
+            try:
+                copyDatabase(snapshot, filename)
+                return self._completed(filename, callback)
+            except sqlite3.Error:
+                layerCache().remove(key)
+        def _download(response):
+            self._downloadfile(taskid, filename)
+            layerCache().put(key, filename)
+            return filename
+        reportProgress("Creating geopkg on GeoGig server...")
+        taskid = self._preparelayerdownload(layername, bbox, commitid)
+        return self._aftertask(taskid, _download, callback)
+
+    def _layerCacheKey(self, layername, commitid, bbox = None):
+        if bbox is None:
+            return cacheKey(self.url, layername, commitid)
+        return cacheKey(self.url, layername, commitid, _bboxparam(bbox))
+
+    def islayercached(self, layername, commitid):
+        '''Returns True if checking out the layer at the given commit needs no server call'''
+        return self._layerCacheKey(layername, commitid) in layerCache()
 
     def saveaudittables(self, filename, layer):
         newfilename = tempFilenameInTempFolder(os.path.basename(filename))
-
-        conn = sqlite3.connect(newfilename)
-        c = conn.cursor()
-        c.execute("ATTACH DATABASE ? AS db2", (filename,))
-        tables = ["%s_audit" % layer, "%s_fids" % layer, "geogig_audited_tables", "gpkg_geometry_columns"]
-        for table in tables:
-            c.execute("SELECT sql FROM db2.sqlite_master WHERE type='table' AND name='%s'" % table)
-            c.execute(c.fetchone()[0])
-            c.execute("INSERT INTO main.%s SELECT * FROM db2.%s" % (table, table))
-
-        c.execute("SELECT sql FROM db2.sqlite_master WHERE type='table' AND name='%s'" % layer)
-        c.execute(c.fetchone()[0])
-        c.execute("SELECT * FROM db2.%s_audit WHERE audit_op<>3;" % layer)
-        changed = c.fetchall()
-        used = []
-        for feature in changed[::-1]:
-            if feature[0] not in used:
-                c.execute('INSERT INTO main.%s SELECT * FROM db2.%s WHERE fid=%s;' % (layer, layer, feature[0]))
-                used.append(feature[0])
-
-        conn.commit()
-        conn.close()
-
+        saveAuditTables(filename, layer, newfilename)
+        profile = layerProfile(filename, layer)
+        if profile is not None:
+            self._fillhiddencolumns(newfilename, layer, profile.hiddenColumns(filename, layer))
         return newfilename
 
-    def importgeopkg(self, layer, branch, message, authorName, authorEmail, interchange):
-        QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
+    def _fillhiddencolumns(self, filename, layername, columns):
+        '''
+        Sets the values of the columns left out of the checkout profile of
+        a layer in the modified features to upload, taking them from the
+        commit the layer is at, so they are not overwritten with empty values
+        '''
+        if not columns:
+            return
+        con = connect(filename)
+        try:
+            cursor = con.cursor()
+            cursor.execute('''SELECT DISTINCT f.geogig_fid FROM "{layer}_audit" AS a
+                              JOIN "{layer}_fids" AS f ON CAST(f.gpkg_fid AS INTEGER) = a.fid
+                              WHERE a.audit_op = ?;'''.format(layer = layername), (UPDATE,))
+            paths = ["%s/%s" % (layername, row[0]) for row in cursor.fetchall()]
+            cursor.execute("SELECT commit_id FROM geogig_audited_tables WHERE table_name = ?;", (layername,))
+            commitid = cursor.fetchone()[0]
+        finally:
+            con.close()
+        if not paths:
+            return
+        # Features are always fetched one by one, since exporting the layer
+        # to read a few columns would download the whole layer. Errors are not
+        # ignored, as a missing feature would have its hidden columns emptied
+        def _fetch(path):
+            feature = self.feature(path, commitid)
+            return path.split("/")[-1], {c: feature.get(c) for c in columns}
+        values = {}
+        pool = ThreadPool(min(len(paths), MAX_CONCURRENT_FEATURE_CALLS))
+        try:
+            for fid, attrs in pool.imap_unordered(_fetch, paths):
+                values[fid] = attrs
+                reportProgress("Reading hidden columns of modified features [%i/%i]" % (len(values), len(paths)))
+        finally:
+            pool.close()
+        reportProgress("")
+        fillColumns(filename, layername, columns, values)
+
+    def importgeopkg(self, layer, branch, message, authorName, authorEmail, interchange, callback = None):
+        '''
+        Imports a layer into the given branch. If a callback is passed,
+        this method returns a Future right away and the callback is called
+        with it once the import has finished
+        '''
         filename, layername = namesFromLayer(layer)
-        r = requests.get(self.url + "beginTransaction", params = {"output_format":"json"})
+        r = self._session.get(self.url + "beginTransaction", params = {"output_format":"json"})
         r.raise_for_status()
         transactionId = r.json()["response"]["Transaction"]["ID"]
+        addCancelAction(lambda: self.closeTransaction(transactionId))
         self._checkoutbranch(branch, transactionId)
         payload = {"authorEmail": authorEmail, "authorName": authorName,
                    "message": message, 'destPath':layername, "format": "gpkg",
@@ -434,47 +876,51 @@ class Repository(object):
 
         encoder = MultipartEncoder(files)
         total = float(encoder.len)
-        def callback(m):
-            done = int(100 * m.bytes_read / total)
-            iface.mainWindow().statusBar().showMessage("Transferring geopkg to GeoGig server [{}%]".format(done))
-        monitor = MultipartEncoderMonitor(encoder, callback)
-        r = requests.post(self.url + "import.json", params = payload, data=monitor,
+        def _progress(m):
+            reportProgress("Transferring geopkg to GeoGig server", int(100 * m.bytes_read / total))
+        monitor = MultipartEncoderMonitor(encoder, _progress)
+        r = self._session.post(self.url + "import.json", params = payload, data=monitor,
                   headers={'Content-Type': monitor.content_type})
         self.__log(r.url, r.text, payload, "POST")
         r.raise_for_status()
         resp = r.json()
         taskId = resp["task"]["id"]
-        checker = TaskChecker(self.rootUrl, taskId)
-        loop = QEventLoop()
-        checker.taskIsFinished.connect(loop.exit, Qt.QueuedConnection)
-        checker.start()
-        loop.exec_(flags = QEventLoop.ExcludeUserInputEvents)
-        QApplication.restoreOverrideCursor()
-        iface.mainWindow().statusBar().showMessage("")
-        if not checker.ok and "error" in checker.response["task"]:
-            errorMessage = checker.response["task"]["error"]["message"]
+        return self._aftertask(taskId, lambda response: self._importfinished(response, layer, filename,
+                                                                   interchange, transactionId), callback)
+
+    def _importfinished(self, response, layer, filename, interchange, transactionId):
+        layername = namesFromLayer(layer)[1]
+        reportProgress("")
+        if response["task"]["status"] != FINISHED and "error" in response["task"]:
+            errorMessage = response["task"]["error"]["message"]
             raise GeoGigException("Cannot import layer: %s" % errorMessage)
         if interchange:
             try:
-                nconflicts = checker.response["task"]["result"]["Merge"]["conflicts"]
+                nconflicts = response["task"]["result"]["Merge"]["conflicts"]
             except KeyError, e:
                 nconflicts = 0
             if nconflicts:
                 mergeCommitId = self.HEAD
-                importCommitId = checker.response["task"]["result"]["import"]["importCommit"]["id"]
-                ancestor = checker.response["task"]["result"]["Merge"]["ancestor"]
-                remote = checker.response["task"]["result"]["Merge"]["ours"]
+                importCommitId = response["task"]["result"]["import"]["importCommit"]["id"]
+                ancestor = response["task"]["result"]["Merge"]["ancestor"]
+                remote = response["task"]["result"]["Merge"]["ours"]
                 try:
-                    featureIds = checker.response["task"]["result"]["import"]["NewFeatures"]["type"][0].get("ids", [])
+                    featureIds = response["task"]["result"]["import"]["NewFeatures"]["type"][0].get("ids", [])
                 except:
                     featureIds = []
-                con = sqlite3.connect(filename)
+                if not isMainThread():
+                    # QGIS layers must only be used from the main thread
+                    layer = QgsVectorLayer(layer.source(), layername, "ogr")
+                con = connect(filename)
                 cursor = con.cursor()
                 geomField = cursor.execute("SELECT column_name FROM gpkg_geometry_columns WHERE table_name='%s';" % layername).fetchone()[0]
 
+                fids = fidMapping(filename, layername)
+
                 def _local(fid):
-                    cursor.execute("SELECT gpkg_fid FROM %s_fids WHERE geogig_fid='%s';" % (layername, fid))
-                    gpkgfid = int(cursor.fetchone()[0])
+                    gpkgfid = fids.gpkgFid(fid)
+                    if gpkgfid is None:
+                        return None
                     request = QgsFeatureRequest()
                     request.setFilterFid(gpkgfid)
                     try:
@@ -494,7 +940,7 @@ class Repository(object):
                     return local
 
                 conflicts = []
-                conflictsResponse = _ensurelist(checker.response["task"]["result"]["Merge"]["Feature"])
+                conflictsResponse = _ensurelist(response["task"]["result"]["Merge"]["Feature"])
                 for c in conflictsResponse:
                     if c["change"] == "CONFLICT":
                         remoteFeatureId = c["ourvalue"]
@@ -507,10 +953,10 @@ class Repository(object):
             else:
                 #self._checkoutbranch("master", transactionId)
                 self.closeTransaction(transactionId)
-                mergeCommitId = checker.response["task"]["result"]["newCommit"]["id"]
-                importCommitId = checker.response["task"]["result"]["importCommit"]["id"]
+                mergeCommitId = response["task"]["result"]["newCommit"]["id"]
+                importCommitId = response["task"]["result"]["importCommit"]["id"]
                 try:
-                    featureIds = checker.response["task"]["result"]["NewFeatures"]["type"][0].get("id", [])
+                    featureIds = response["task"]["result"]["NewFeatures"]["type"][0].get("id", [])
                 except:
                     featureIds = []
                 conflicts = []
@@ -518,12 +964,22 @@ class Repository(object):
             return mergeCommitId, importCommitId, conflicts, featureIds
         else:
             self.closeTransaction(transactionId)
+            result = response["task"].get("result", {})
+            mergeCommitId = result.get("newCommit", {}).get("id")
+            importCommitId = result.get("importCommit", {}).get("id")
+            try:
+                newFeatures = result["NewFeatures"]["type"][0]
+                featureIds = _ensurelist(newFeatures.get("id", newFeatures.get("ids", [])))
+                featureIds = [(f["provided"], f["assigned"]) for f in featureIds]
+            except:
+                featureIds = []
+            return mergeCommitId, importCommitId, [], featureIds
 
     def resolveConflictWithFeature(self, path, feature, ours, theirs, transactionId):
         merges = {k:{"value": v} for k,v in feature.items()}
         payload = {"path": path, "ours": ours, "theirs": theirs,
                    "merges": merges}
-        r = requests.post(self.url + "repo/mergefeature", json = payload)
+        r = self._session.post(self.url + "repo/mergefeature", json = payload)
         self.__log(r.url, r.text, payload, "POST")
         r.raise_for_status()
         fid = r.text
@@ -532,37 +988,39 @@ class Repository(object):
     def resolveConflictWithFeatureId(self, path, fid, transactionId):
         payload = {"path": path, "objectid": fid,
                    "transactionId": transactionId}
-        r = requests.get(self.url + "resolveconflict", params = payload)
+        r = self._session.get(self.url + "resolveconflict", params = payload)
         self.__log(r.url, r.text, payload)
         r.raise_for_status()
 
     def deleteFeature(self, path, transactionId):
         payload = {"path": path, "transactionId": transactionId}
-        r = requests.get(self.url + "remove", params = payload)
+        r = self._session.get(self.url + "remove", params = payload)
         self.__log(r.url, r.text, payload)
         r.raise_for_status()
 
     def commitAndCloseTransaction(self, user, email, message, transactionId):
         params = {"all": True, "message": message, "transactionId": transactionId,
                   "authorName": user, "authorEmail": email}
-        r = requests.get(self.url + "commit", params = params)
+        r = self._session.get(self.url + "commit", params = params)
         self.__log(r.url, r.text, params)
         r.raise_for_status()
         self.closeTransaction(transactionId)
 
     def closeTransaction(self, transactionId):
-        r = requests.get(self.url + "endTransaction", params = {"transactionId": transactionId})
+        r = self._session.get(self.url + "endTransaction", params = {"transactionId": transactionId})
         self.__log(r.url, r.text, {"transactionId": transactionId})
         r.raise_for_status()
+        # ending a transaction applies its commits and merges to the repository refs
+        refCache.invalidate(self.url)
 
     def merge(self, branchToMerge, branchToMergeInto):
-        r = requests.get(self.url + "beginTransaction", params = {"output_format":"json"})
+        r = self._session.get(self.url + "beginTransaction", params = {"output_format":"json"})
         r.raise_for_status()
         transactionId = r.json()["response"]["Transaction"]["ID"]
         self.__log(r.url, r.json(), params = {"output_format":"json"})
         self._checkoutbranch(branchToMergeInto, transactionId)
         payload = {"commit":branchToMerge, "transactionId": transactionId, "output_format":"json"}
-        r = requests.get(self.url + "merge", params=payload)
+        r = self._session.get(self.url + "merge", params=payload)
         r.raise_for_status()
         self.__log(r.url, r.json(), payload)
         response = r.json()["response"]["Merge"]
@@ -590,7 +1048,7 @@ class Repository(object):
     def commitAndCloseMergeAndTransaction(self, user, email, message, transactionId):
         params = {"all": True, "message": message, "transactionId": transactionId,
                   "authorName": user, "authorEmail": email}
-        r = requests.get(self.url + "commit", params = params)
+        r = self._session.get(self.url + "commit", params = params)
         self.__log(r.url, r.text, params)
         r.raise_for_status()
         self._checkoutbranch("master", transactionId)
@@ -599,8 +1057,11 @@ class Repository(object):
     def delete(self):
         r = self._apicall("delete")
         params = {"token": r["token"]}
-        r = requests.delete(self.url, params = params)
+        r = self._session.delete(self.url, params = params)
         r.raise_for_status()
+        commitStore().removeRepo(self.url)
+        refCache.invalidate(self.url)
+        removeCommitGraph(self.url)
 
     def addremote(self, name, url):
         url = url.strip(" ")
@@ -630,17 +1091,18 @@ class Repository(object):
                 raise CannotPushException(r["error"])
             if not r["dataPushed"]:
                 raise NothingToPushException()
+            refCache.invalidate(self.url)
         except HTTPError, e:
             raise CannotPushException(e.response.json()["response"]["error"])
 
     def pull (self, remote, branch):
-        r = requests.get(self.url + "beginTransaction", params = {"output_format":"json"})
+        r = self._session.get(self.url + "beginTransaction", params = {"output_format":"json"})
         r.raise_for_status()
         transactionId = r.json()["response"]["Transaction"]["ID"]
         self.__log(r.url, r.json(), params = {"output_format":"json"})
         self._checkoutbranch(branch, transactionId)
         payload = {"ref": branch, "remoteName": remote, "transactionId": transactionId, "output_format":"json"}
-        r = requests.get(self.url + "pull", params=payload)
+        r = self._session.get(self.url + "pull", params=payload)
         r.raise_for_status()
         self.__log(r.url, r.json(), payload)
         response = r.json()["response"]
@@ -664,38 +1126,86 @@ class Repository(object):
             return []
 
 
-class TaskChecker(QObject):
-    taskIsFinished = pyqtSignal()
-    def __init__(self, url, taskid):
-        QObject.__init__(self)
-        self.taskid = taskid
-        self.url = url + "tasks/%s.json" % str(self.taskid)
-    def start(self):
-        self.checkTask()
-    def checkTask(self):
-        r = requests.get(self.url, stream=True)
-        r.raise_for_status()
-        self.response = r.json()
-        if self.response["task"]["status"] == "FINISHED":
-            self.ok = True
-            self.taskIsFinished.emit()
-        elif self.response["task"]["status"] == "FAILED":
-            self.ok = False
-            self.taskIsFinished.emit()
-        else:
-            try:
-                progressTask = self.response["task"]["progress"]["task"]
-                progressAmount = self.response["task"]["progress"]["amount"]
-                iface.mainWindow().statusBar().showMessage("%s [%s]" % (progressTask, progressAmount))
-            except KeyError:
-                pass
-            QTimer.singleShot(500, self.checkTask)
+DEFAULT_DIFF_CACHE_SIZE = 500
+DEFAULT_LAYER_CACHE_SIZE = 1000
+DEFAULT_FEATURE_CACHE_SIZE = 100
+# Number of feature versions and diffs kept in memory
+FEATURE_MEMORY_CACHE_ENTRIES = 5000
+
+_caches = {}
+
+def _fileCache(name, setting, defaultSize):
+    if name not in _caches:
+        try:
+            size = float(pluginSetting(setting))
+        except:
+            size = defaultSize
+        _caches[name] = FileCache(os.path.join(userFolder(), "cache", name),
+                                  int(size * 1024 * 1024), ".gpkg")
+    return _caches[name]
+
+def diffCache():
+    '''Returns the disk cache of geopackages exported by exportdiff'''
+    return _fileCache("diffs", DIFF_CACHE_SIZE, DEFAULT_DIFF_CACHE_SIZE)
+
+def layerCache():
+    '''Returns the disk cache of layer snapshots downloaded by checkoutlayer'''
+    return _fileCache("layers", LAYER_CACHE_SIZE, DEFAULT_LAYER_CACHE_SIZE)
+
+def featureCache():
+    '''Returns the cache of feature versions and diffs read by feature and featurediff'''
+    if "features" not in _caches:
+        try:
+            size = float(pluginSetting(FEATURE_CACHE_SIZE))
+        except:
+            size = DEFAULT_FEATURE_CACHE_SIZE
+        folder = os.path.join(userFolder(), "cache")
+        try:
+            os.makedirs(folder)
+        except os.error:
+            pass
+        _caches["features"] = FeatureCache(os.path.join(folder, "features.sqlite"),
+                                           FEATURE_MEMORY_CACHE_ENTRIES, int(size * 1024 * 1024))
+    return _caches["features"]
+
+def cacheStatistics():
+    '''Returns a dict with the number of hits and misses of each cache, by cache name'''
+    diffCache(), layerCache(), featureCache()
+    return {name: (cache.hits, cache.misses) for name, cache in _caches.items()}
 
 
 repos = []
 repoEndpoints = {}
 availableRepoEndpoints = {}
 
+# Seconds to wait for a GeoGig server to answer when listing its repositories
+ENDPOINT_TIMEOUT = 10
+
+
+class EndpointValidator(QObject):
+    '''
+    Fetches the list of repositories of GeoGig servers in background
+    threads, so a slow or dead server does not block QGIS
+    '''
+    endpointValidated = pyqtSignal(str, str, object)
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.endpointValidated.connect(_endpointValidated)
+
+    def validate(self, title, url):
+        def _fetch():
+            try:
+                names = repoNamesFromUrl(url)
+            except:
+                names = None
+            self.endpointValidated.emit(title, url, names)
+        t = threading.Thread(target=_fetch)
+        t.daemon = True
+        t.start()
+
+_validator = None
+
 
 def addRepo(repo):
     global repos
@@ -715,9 +1225,11 @@ def addRepoEndpoint(url, title):
     global repos
     repoEndpoints[title] = url
     saveRepoEndpoints()
-    _repos = execute(lambda: repositoriesFromUrl(url, title))
+    names = execute(lambda: repoNamesFromUrl(url))
+    _repos = _reposFromNames(url, title, names)
     repos.extend(_repos)
     availableRepoEndpoints[title] = url
+    _cacheRepoNames(url, names)
     return _repos
 
 
@@ -733,6 +1245,7 @@ def removeRepoEndpoint(title):
     if title in availableRepoEndpoints:
         del availableRepoEndpoints[title]
     saveRepoEndpoints()
+    _cacheRepoNames(url, None)
 
 
 def saveRepoEndpoints():
@@ -742,51 +1255,133 @@ def saveRepoEndpoints():
         f.write(json.dumps(towrite))
 
 
-def repositoriesFromUrl(url, title):
+def _endpointUrl(url):
     if not url.endswith("/"):
         url = url + "/"
+    return url
+
 
-    r = requests.get(url + "repos")
+def repoNamesFromUrl(url):
+    url = _endpointUrl(url)
+    r = session(url).get(url + "repos", timeout=ENDPOINT_TIMEOUT)
     r.raise_for_status()
 
     root = ET.fromstring(r.text)
+    return [node.find('name').text for node in root.findall('repo')]
 
-    repos = []
-    for node in root.findall('repo'):
-        name = node.find('name').text
-        repos.append(Repository(url + "repos/%s/" % name, title, name))
 
-    return repos
+def _reposFromNames(url, title, names):
+    url = _endpointUrl(url)
+    return [Repository(url + "repos/%s/" % name, title, name) for name in names]
+
+
+def repositoriesFromUrl(url, title):
+    return _reposFromNames(url, title, repoNamesFromUrl(url))
 
 
 def createRepoAtUrl(url, group, name):
     if not url.endswith("/"):
         url = url + "/"
-    r = requests.put(url + "repos/%s/init.json" % name, data = "dummy")
+    r = session(url).put(url + "repos/%s/init.json" % name, data = "dummy")
     if not r.json()["response"]["success"]:
         raise GeoGigException("A repository with that name already exists")
     r.raise_for_status()
     return Repository(url + "repos/%s/" % name, group, name)
 
 
-def readRepos():
+_repoNamesCache = {}
+_cacheFolder = None
+
+def _readRepoNamesCache(folder):
+    global _repoNamesCache
+    global _cacheFolder
+    _cacheFolder = folder
+    filename = os.path.join(folder, "repositorycache")
+    try:
+        with open(filename) as f:
+            _repoNamesCache = json.load(f)
+    except:
+        _repoNamesCache = {}
+
+
+def _cacheRepoNames(url, names):
+    if names is None:
+        _repoNamesCache.pop(url, None)
+    else:
+        _repoNamesCache[url] = list(names)
+    filename = os.path.join(_cacheFolder or userFolder(), "repositorycache")
+    try:
+        with open(filename, "w") as f:
+            f.write(json.dumps(_repoNamesCache))
+    except:
+        QgsMessageLog.logMessage("Could not write repository cache to %s" % filename,
+                                 level=QgsMessageLog.WARNING)
+
+
+def readRepos(folder = None):
+    '''
+    Reads the saved GeoGig servers and the last known list of repositories
+    for each of them. No server is contacted; call revalidateEndpoints
+    to update the lists in the background
+    '''
     global repos
     global repoEndpoints
     global availableRepoEndpoints
     repos = []
     repoEndpoints = {}
     availableRepoEndpoints = {}
-    filename = os.path.join(userFolder(), "repositories")
+    folder = folder or userFolder()
+    _readRepoNamesCache(folder)
+    filename = os.path.join(folder, "repositories")
     if os.path.exists(filename):
         repoDescs = json.load(open(filename))
         for r in repoDescs:
             repoEndpoints[r["title"]] = r["url"]
-            try:
-                _repos = execute(lambda: repositoriesFromUrl(r["url"], r["title"]))
-                repos.extend(_repos)
+            names = _repoNamesCache.get(r["url"])
+            if names is not None:
+                repos.extend(_reposFromNames(r["url"], r["title"], names))
                 availableRepoEndpoints[r["title"]] = r["url"]
-            except:
-                pass
+
+
+def revalidateEndpoints(titles = None):
+    '''
+    Fetches the current list of repositories of the passed GeoGig servers
+    (all of them by default) concurrently, in background threads.
+    repoWatcher.endpointChanged is emitted for each server whose list
+    of repositories or availability has changed
+    '''
+    global _validator
+    if _validator is None:
+        _validator = EndpointValidator()
+    titles = list(repoEndpoints.keys()) if titles is None else titles
+    for title in titles:
+        if title in repoEndpoints:
+            _validator.validate(title, repoEndpoints[title])
+
+
+def _endpointValidated(title, url, names):
+    global repos
+    if repoEndpoints.get(title) != url:
+        return # server was removed or edited while being validated
+    wasAvailable = title in availableRepoEndpoints
+    oldNames = sorted(r.title for r in repos if r.group == title)
+    changed = False
+    if names is None:
+        if wasAvailable:
+            del availableRepoEndpoints[title]
+            changed = True
+    else:
+        availableRepoEndpoints[title] = url
+        changed = not wasAvailable
+        if sorted(names) != oldNames:
+            repos = [r for r in repos if r.group != title]
+            repos.extend(_reposFromNames(url, title, names))
+            changed = True
+        if names != _repoNamesCache.get(url):
+            _cacheRepoNames(url, names)
+    if changed:
+        repoWatcher.endpointChanged.emit(title)
+
 
 def refreshEndpoint(name):
     global repos
@@ -799,9 +1394,11 @@ def refreshEndpoint(name):
             repos.remove(repo)
     if name in repoEndpoints:
         try:
-            _repos = execute(lambda: repositoriesFromUrl(repoEndpoints[name], name))
-            repos.extend(_repos)
-            availableRepoEndpoints[name] = repoEndpoints[name]
+            url = repoEndpoints[name]
+            names = execute(lambda: repoNamesFromUrl(url))
+            repos.extend(_reposFromNames(url, name, names))
+            availableRepoEndpoints[name] = url
+            _cacheRepoNames(url, names)
         except:
             pass
 
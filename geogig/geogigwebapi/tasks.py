@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    tasks.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import time
+import threading
+
+from qgis.PyQt.QtCore import (pyqtSignal, pyqtSlot, Qt, QObject, QTimer, QThread,
+                              QEventLoop, QCoreApplication, QMetaObject)
+from qgis.utils import iface
+
+from geogig.geogigwebapi.connection import session
+
+# Polling intervals for server tasks, in seconds. Tasks are polled quickly
+# at first, since most of them finish in a few milliseconds, and then less
+# and less often, so long running tasks do not flood the server
+INITIAL_INTERVAL = 0.05
+MAX_INTERVAL = 5
+BACKOFF_FACTOR = 1.5
+
+FINISHED, FAILED, CANCELLED = "FINISHED", "FAILED", "CANCELLED"
+
+
+def isMainThread():
+    return QThread.currentThread() == QCoreApplication.instance().thread()
+
+
+class _MainThreadRunner(QObject):
+    '''Runs functions passed from any thread in the main thread'''
+
+    _call = pyqtSignal(object)
+
+    def __init__(self):
+        QObject.__init__(self)
+        self._call.connect(self._run)
+
+    @pyqtSlot(object)
+    def _run(self, func):
+        func()
+
+_mainThreadRunner = _MainThreadRunner()
+
+def runInMainThread(func):
+    '''
+    Calls func in the main thread. If called from another thread, it
+    returns right away and func is called once the event loop runs it
+    '''
+    if isMainThread():
+        func()
+    else:
+        _mainThreadRunner._call.emit(func)
+
+
+class Future(object):
+    '''
+    The result of an operation that finishes asynchronously.
+    Callbacks added with addDoneCallback are called with the future
+    as argument once it is done
+    '''
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    @staticmethod
+    def completed(result):
+        future = Future()
+        future.setResult(result)
+        return future
+
+    def done(self):
+        return self._event.is_set()
+
+    def setResult(self, result):
+        self._finish(result, None)
+
+    def setException(self, exception):
+        self._finish(None, exception)
+
+    def _finish(self, result, exception):
+        with self._lock:
+            if self._event.is_set():
+                return # already cancelled
+            self._result = result
+            self._exception = exception
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def addDoneCallback(self, callback):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self):
+        '''
+        Waits until the future is done. In the main thread, Qt events other
+        than user input keep being processed while waiting
+        '''
+        if self.done():
+            return
+        if isMainThread():
+            loop = QEventLoop()
+            self.addDoneCallback(lambda f: QMetaObject.invokeMethod(loop, "quit", Qt.QueuedConnection))
+            loop.exec_(QEventLoop.ExcludeUserInputEvents)
+        else:
+            self._event.wait()
+
+    def exception(self):
+        self.wait()
+        return self._exception
+
+    def result(self):
+        '''Waits until the future is done and returns its result, raising its exception if it failed'''
+        self.wait()
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class TaskFuture(Future):
+    '''
+    A task running on a GeoGig server. Its result is the last
+    response of the server for the task
+    '''
+
+    def __init__(self, url, taskid, onProgress = None):
+        Future.__init__(self)
+        self.taskid = taskid
+        self.url = url
+        self.onProgress = onProgress
+        self.response = None
+        self.ok = False
+        self.interval = INITIAL_INTERVAL
+        self.nextPoll = time.time() + self.interval
+
+
+class TaskPoller(QObject):
+    '''
+    Polls the status of all running server tasks with a single timer,
+    each of them with its own adaptive interval
+    '''
+
+    _taskAdded = pyqtSignal(object)
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.tasks = []
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._poll)
+        self._taskAdded.connect(self._addTask)
+
+    def watch(self, rootUrl, taskid, callback = None, onProgress = None):
+        '''
+        Starts polling a server task and returns a TaskFuture for it.
+        onProgress is called with a description of the progress of the
+        task while it runs. Can be called from any thread
+        '''
+        future = TaskFuture(rootUrl + "tasks/%s.json" % str(taskid), taskid, onProgress)
+        if callback is not None:
+            future.addDoneCallback(callback)
+        self._taskAdded.emit(future)
+        return future
+
+    @pyqtSlot(object)
+    def _addTask(self, future):
+        if future.done():
+            return
+        self.tasks.append(future)
+        self._schedule()
+
+    def _schedule(self):
+        if self.tasks:
+            delay = min(t.nextPoll for t in self.tasks) - time.time()
+            self.timer.start(max(0, int(delay * 1000)))
+
+    def _poll(self):
+        now = time.time()
+        for task in [t for t in self.tasks if t.nextPoll <= now]:
+            if task.done():
+                self.tasks.remove(task)
+                continue
+            try:
+                r = session(task.url).get(task.url)
+                r.raise_for_status()
+                response = r.json()
+                status = response["task"]["status"]
+            except Exception as e:
+                self.tasks.remove(task)
+                task.setException(e)
+                continue
+            if status in [FINISHED, FAILED, CANCELLED]:
+                self.tasks.remove(task)
+                task.response = response
+                task.ok = status == FINISHED
+                task.setResult(response)
+            else:
+                try:
+                    progressTask = response["task"]["progress"]["task"]
+                    progressAmount = response["task"]["progress"]["amount"]
+                    message = "%s [%s]" % (progressTask, progressAmount)
+                    if task.onProgress is None:
+                        iface.mainWindow().statusBar().showMessage(message)
+                    else:
+                        task.onProgress(message)
+                except KeyError:
+                    pass
+                task.interval = min(task.interval * BACKOFF_FACTOR, MAX_INTERVAL)
+                task.nextPoll = time.time() + task.interval
+        self._schedule()
+
+taskPoller = TaskPoller()
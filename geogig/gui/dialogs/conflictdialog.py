@@ -30,9 +30,11 @@ __revision__ = '$Format:%H$'
 
 import os
 import sys
+import threading
+from collections import defaultdict
 
 from qgis.PyQt import uic
-from qgis.PyQt.QtCore import Qt, QSettings, QSize
+from qgis.PyQt.QtCore import Qt, QSettings, QSize, QObject, pyqtSignal, pyqtSlot
 from qgis.PyQt.QtGui import QIcon, QFont
 from qgis.PyQt.QtWidgets import (QHBoxLayout,
                                  QTreeWidgetItem,
@@ -120,8 +122,11 @@ class ConflictDialog(WIDGET, BASE):
         self.solveRemoteButton.setEnabled(False)
 
         self.fillConflictsTree()
+        self.prefetcher = ConflictPrefetcher()
+        self.prefetcher.prefetch(self.conflictItems[:PREFETCH_AHEAD])
 
     def fillConflictsTree(self):
+        self.conflictItems = []
         topTreeItems = {}
         for c in self.conflicts:
             path = os.path.dirname(c.path)
@@ -136,6 +141,7 @@ class ConflictDialog(WIDGET, BASE):
             topItem.addChild(conflictItem)
         for item in list(topTreeItems.values()):
             self.conflictsTree.addTopLevelItem(item)
+            self.conflictItems.extend([item.child(i) for i in range(item.childCount())])
 
     def cellClicked(self, row, col):
         if col > 2:
@@ -158,6 +164,8 @@ class ConflictDialog(WIDGET, BASE):
         if self.lastSelectedItem == item:
             return
         if isinstance(item, ConflictItem):
+            idx = self.conflictItems.index(item)
+            self.prefetcher.prefetch(self.conflictItems[idx + 1:idx + 1 + PREFETCH_AHEAD])
             self.lastSelectedItem = item
             self.currentPath = item.conflict.path
             self.updateCurrentPath()
@@ -218,6 +226,7 @@ class ConflictDialog(WIDGET, BASE):
         if remove:
             parent = self.lastSelectedItem.parent()
             parent.removeChild(self.lastSelectedItem)
+            self.conflictItems.remove(self.lastSelectedItem)
             self.lastSelectedItem = None
             if parent.childCount() == 0:
                 self.conflictsTree.invisibleRootItem().removeChild(parent)
@@ -380,6 +389,7 @@ class ConflictDialog(WIDGET, BASE):
                 evnt.ignore()
                 return
 
+        self.prefetcher.stop()
         self.cleanCanvas()
 
 class ValueItem(QTableWidgetItem):
@@ -399,6 +409,96 @@ class ValueItem(QTableWidgetItem):
         self.setFlags(Qt.ItemIsEnabled)
 
 
+def conflictFeatures(items):
+    '''
+    Fetches the versions of the features in the passed conflict items that
+    have not been fetched yet, with one call per commit. Returns a list
+    of (item, attribute, feature) tuples, and does not modify the items,
+    so it can be called from any thread
+    '''
+    repos = {}
+    requested = defaultdict(lambda: defaultdict(list))
+    for item in items:
+        conflict = item.conflict
+        repos[conflict.repo.url] = conflict.repo
+        versions = [("_origin", conflict.originCommit), ("_remote", conflict.remoteCommit)]
+        if conflict.localFeature is None:
+            versions.append(("_local", conflict.localCommit))
+        for attr, commit in versions:
+            if getattr(item, attr) is None:
+                requested[(conflict.repo.url, commit)][conflict.path].append((item, attr))
+    fetched = []
+    for (url, commit), itemsByPath in requested.items():
+        features = repos[url].features(list(itemsByPath.keys()), commit)
+        for path, feature in features.items():
+            for item, attr in itemsByPath[path]:
+                fetched.append((item, attr, feature))
+    return fetched
+
+
+# Number of conflicts fetched ahead of the selected one
+PREFETCH_AHEAD = 30
+# Number of conflicts fetched together in each background batch
+PREFETCH_BATCH = 10
+# Maximum number of batches being fetched at the same time
+MAX_PREFETCH_BATCHES = 2
+
+
+class ConflictPrefetcher(QObject):
+    '''
+    Fetches the versions of conflicted features in background threads,
+    so conflicts open without waiting for the server when selected.
+    Only a few batches are fetched at the same time, and the most
+    recently requested conflicts are fetched first
+    '''
+
+    _batchFetched = pyqtSignal(object, object)
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.pending = []
+        self.inFlight = set()
+        self.batches = 0
+        self.stopped = False
+        self._batchFetched.connect(self._fetched)
+
+    def prefetch(self, items):
+        items = [i for i in items if not i.prefetched and i not in self.inFlight]
+        self.pending = items + [i for i in self.pending if i not in items]
+        self._startBatches()
+
+    def _startBatches(self):
+        while not self.stopped and self.pending and self.batches < MAX_PREFETCH_BATCHES:
+            batch, self.pending = self.pending[:PREFETCH_BATCH], self.pending[PREFETCH_BATCH:]
+            self.inFlight.update(batch)
+            self.batches += 1
+            t = threading.Thread(target = self._fetch, args = (batch,))
+            t.daemon = True
+            t.start()
+
+    def _fetch(self, batch):
+        try:
+            fetched = conflictFeatures(batch)
+        except:
+            fetched = [] # they will be fetched when selected
+        self._batchFetched.emit(batch, fetched)
+
+    @pyqtSlot(object, object)
+    def _fetched(self, batch, fetched):
+        self.batches -= 1
+        self.inFlight.difference_update(batch)
+        for item in batch:
+            item.prefetched = True
+        for item, attr, feature in fetched:
+            if getattr(item, attr) is None:
+                setattr(item, attr, feature)
+        self._startBatches()
+
+    def stop(self):
+        self.stopped = True
+        self.pending = []
+
+
 class ConflictItem(QTreeWidgetItem):
 
     def __init__(self, conflict):
@@ -408,8 +508,9 @@ class ConflictItem(QTreeWidgetItem):
         self.setSizeHint(0, QSize(self.sizeHint(0).width(), 25))
         self.conflict = conflict
         self._local = None
-        self._remote = None
-        self._origin = None
+        self._remote = conflict.remoteFeature
+        self._origin = conflict.originFeature
+        self.prefetched = False
 
     @property
     def local(self):
@@ -31,7 +31,7 @@ import os
 import sys
 
 from qgis.PyQt import uic
-from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtCore import Qt, QTimer
 from qgis.PyQt.QtGui import QIcon, QColor
 from qgis.PyQt.QtWidgets import (QHBoxLayout,
                                  QTableWidgetItem,
@@ -43,10 +43,10 @@ from qgis.PyQt.QtWidgets import (QHBoxLayout,
                                  QDialog
                                 )
 from qgis.core import QgsGeometry, QgsCoordinateReferenceSystem
+from qgis.gui import QgsMessageBar
 
 from geogig import config
 from geogig.gui.dialogs.geogigref import RefPanel
-from qgiscommons2.gui import execute
 from geogig.gui.dialogs.geometrydiffviewerdialog import GeometryDiffViewerDialog
 from geogig.geogigwebapi.diff import FEATURE_MODIFIED, FEATURE_ADDED, FEATURE_REMOVED
 from geogig.geogigwebapi.commit import Commit
@@ -97,6 +97,11 @@ class DiffViewerDialog(WIDGET, BASE):
 
         self.featuresTree.header().hide()
 
+        self.diffIterator = None
+        self.diffTimer = QTimer(self)
+        self.diffTimer.setInterval(50)
+        self.diffTimer.timeout.connect(self.addNextDiffs)
+
         self.computeDiffs()
         self.groupBox.adjustSize()
 
@@ -179,50 +184,80 @@ class DiffViewerDialog(WIDGET, BASE):
         self.commit1 = self.commit1Panel.getRef()
         self.commit2 = self.commit2Panel.getRef()
 
+        self.cancelDiffs()
         self.featuresTree.clear()
-        changes = execute(lambda: self.repo.diff(self.commit1.commitid, self.commit2.commitid))
-        layerItems = {}
-        layerSubItems = {}
+        self.layerItems = {}
+        self.layerSubItems = {}
         self.changes = {}
+        self.attributesTable.clear()
+        self.attributesTable.verticalHeader().hide()
+        self.attributesTable.horizontalHeader().hide()
+
+        self.diffIterator = self.repo.iterdiff(self.commit1.commitid, self.commit2.commitid)
+        self.diffTimer.start()
+
+    def cancelDiffs(self):
+        self.diffTimer.stop()
+        if self.diffIterator is not None:
+            self.diffIterator.cancel()
+            self.diffIterator = None
+
+    def addNextDiffs(self):
+        '''Adds to the tree the pages of changes that have already arrived from the server'''
+        while self.diffIterator is not None and self.diffIterator.pageReady():
+            try:
+                changes = self.diffIterator.nextPage()
+            except Exception as e:
+                self.cancelDiffs()
+                config.iface.messageBar().pushMessage("GeoGig", "Cannot compute differences: %s" % str(e),
+                                                      level=QgsMessageBar.CRITICAL, duration=5)
+                return
+            if not changes:
+                self.cancelDiffs()
+                return
+            self.addDiffs(changes)
+
+    def addDiffs(self, changes):
+        updated = set()
         for c in changes:
             self.changes[c.path] = c
             layername = c.path.split("/")[0]
             featureid = c.path.split("/")[-1]
-            if layername not in layerItems:
+            if layername not in self.layerItems:
                 item = QTreeWidgetItem()
                 item.setText(0, layername)
                 item.setIcon(0, layerIcon)
-                layerItems[layername] = item
+                self.layerItems[layername] = item
                 addedItem = QTreeWidgetItem()
-                addedItem.setText(0, "Added")
                 addedItem.setIcon(0, addedIcon)
                 removedItem = QTreeWidgetItem()
-                removedItem.setText(0, "Removed")
                 removedItem.setIcon(0, removedIcon)
                 modifiedItem = QTreeWidgetItem()
-                modifiedItem.setText(0, "Modified")
                 modifiedItem.setIcon(0, modifiedIcon)
-                layerSubItems[layername] = {FEATURE_ADDED: addedItem,
-                                            FEATURE_REMOVED: removedItem,
-                                            FEATURE_MODIFIED:modifiedItem}
+                self.layerSubItems[layername] = {FEATURE_ADDED: addedItem,
+                                                 FEATURE_REMOVED: removedItem,
+                                                 FEATURE_MODIFIED:modifiedItem}
+                for i in [FEATURE_ADDED, FEATURE_REMOVED, FEATURE_MODIFIED]:
+                    item.addChild(self.layerSubItems[layername][i])
+                self.featuresTree.addTopLevelItem(item)
+                item.setExpanded(True)
+                updated.add(layername)
             item = FeatureItem(layername, featureid)
-            layerSubItems[layername][c.changetype].addChild(item)
-        for layername, item in layerItems.iteritems():
+            self.layerSubItems[layername][c.changetype].addChild(item)
+            updated.add(layername)
+        names = {FEATURE_ADDED: "Added", FEATURE_REMOVED: "Removed", FEATURE_MODIFIED: "Modified"}
+        for layername in updated:
             for i in [FEATURE_ADDED, FEATURE_REMOVED, FEATURE_MODIFIED]:
-                subItem = layerSubItems[layername][i]
-                item.addChild(subItem)
-                subItem.setText(0, "%s [%i features]" %
-                                                    (subItem.text(0),
-                                                     subItem.childCount()))
+                subItem = self.layerSubItems[layername][i]
+                subItem.setText(0, "%s [%i features]" % (names[i], subItem.childCount()))
+                subItem.setExpanded(True)
 
-            self.featuresTree.addTopLevelItem(item)
-        self.attributesTable.clear()
-        self.attributesTable.verticalHeader().hide()
-        self.attributesTable.horizontalHeader().hide()
-        
-        self.featuresTree.expandAll()
+    def closeEvent(self, evt):
+        self.cancelDiffs()
+        QDialog.closeEvent(self, evt)
 
     def reject(self):
+        self.cancelDiffs()
         QDialog.reject(self)
 
 class FeatureItem(QTreeWidgetItem):
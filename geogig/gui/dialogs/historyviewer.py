@@ -27,11 +27,11 @@ __copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
 __revision__ = '$Format:%H$'
 
 import os
-import sqlite3
+from requests.exceptions import HTTPError
 from functools import partial
 from collections import defaultdict
 
-from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtCore import Qt, QTimer
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import (QTreeWidget,
                                  QAbstractItemView,
@@ -60,7 +60,10 @@ from qgiscommons2.gui import execute
 from geogig.gui.dialogs.diffviewerdialog import DiffViewerDialog
 from geogig.gui.dialogs.conflictdialog import ConflictDialog
 from geogig.geogigwebapi.commit import Commit
-from geogig.tools.gpkgsync import checkoutLayer, HasLocalChangesError
+from geogig.tools.gpkgsync import checkoutLayer, changeGeopackageVersion, HasLocalChangesError
+from geogig.tools.jobs import jobManager
+from geogig.tools.dbconnection import connect
+from geogig.tools.conflicts import autoMerge, resolveConflicts
 from geogig.tools.layertracking import (getProjectLayerForGeoGigLayer,
                                         getTrackingInfo,
                                         getTrackingInfoForGeogigLayer)
@@ -100,6 +103,7 @@ class HistoryViewer(QTreeWidget):
         if showContextMenu:
             self.customContextMenuRequested.connect(self.showPopupMenu)
         self.itemExpanded.connect(self._itemExpanded)
+        self.verticalScrollBar().valueChanged.connect(self.loadVisibleCommits)
 
     def getRef(self):
         selected = self.selectedItems()
@@ -111,7 +115,7 @@ class HistoryViewer(QTreeWidget):
         if trackedlayer:
             if os.path.exists(trackedlayer.geopkg):
                 try:
-                    con = sqlite3.connect(trackedlayer.geopkg)
+                    con = connect(trackedlayer.geopkg)
                     cursor = con.cursor()
                     cursor.execute("SELECT commit_id FROM geogig_audited_tables WHERE table_name='%s';" % layer)
                     currentCommitId = cursor.fetchone()[0]
@@ -153,13 +157,17 @@ class HistoryViewer(QTreeWidget):
                 QMessageBox.Ok)
         else:
             tracking = getTrackingInfo(layer)
-            repo.checkoutlayer(tracking.geopkg, tracking.layername, None, commit)
-            config.iface.messageBar().pushMessage("GeoGig", "Layer has been updated to commit %s" % commit,
-                                                   level=QgsMessageBar.INFO,
-                                                   duration=5)
             layer.reload()
-            layer.triggerRepaint()
-            repoWatcher.layerUpdated.emit(layer)
+            def _changed(result):
+                config.iface.messageBar().pushMessage("GeoGig", "Layer has been updated to commit %s" % commit,
+                                                       level=QgsMessageBar.INFO,
+                                                       duration=5)
+                layer.reload()
+                layer.triggerRepaint()
+                repoWatcher.layerUpdated.emit(layer)
+            jobManager.submit("Change '%s' to commit %s" % (tracking.layername, commit),
+                              lambda: changeGeopackageVersion(repo, tracking.geopkg, tracking.layername, commit),
+                              _changed)
 
     def showPopupMenu(self, point):
         selected = self.selectedItems()
@@ -237,39 +245,69 @@ class HistoryViewer(QTreeWidget):
     def _itemExpanded(self, item):
         if item is not None and isinstance(item, BranchTreeItem):
             item.populate()
+            self.loadVisibleCommits()
+
+    def loadVisibleCommits(self):
+        '''
+        Adds more commits to the expanded branches whose last loaded
+        commit is visible, so history is loaded as the user scrolls
+        '''
+        waiting = False
+        for i in range(self.topLevelItemCount()):
+            item = self.topLevelItem(i)
+            if not (item.isExpanded() and item.hasMoreCommits()):
+                continue
+            last = item.child(item.childCount() - 1) if item.childCount() else item
+            if self.visualItemRect(last).top() > self.viewport().height():
+                continue
+            if item.moreCommitsReady():
+                item.loadMoreCommits()
+                QTimer.singleShot(0, self.loadVisibleCommits)
+            else:
+                waiting = True
+        if waiting:
+            QTimer.singleShot(100, self.loadVisibleCommits)
 
     def mergeInto(self, mergeInto, branch):
+        self.repo.loadhistory([branch, mergeInto], lambda: self._mergeInto(mergeInto, branch))
+
+    def _mergeInto(self, mergeInto, branch):
+        if self.repo.isancestor(branch, mergeInto):
+            iface.messageBar().pushMessage("GeoGig", "Branch '%s' is already merged into '%s'" % (branch, mergeInto),
+                                              level=QgsMessageBar.INFO, duration=5)
+            return
         conflicts = self.repo.merge(branch, mergeInto)
         if conflicts:
-            ret = QMessageBox.warning(iface.mainWindow(), "Conflict(s) found while syncing",
-                                      "There are conflicts between local and remote changes.\n"
-                                      "Do you want to continue and fix them?",
-                                      QMessageBox.Yes | QMessageBox.No)
-            if ret == QMessageBox.No:
-                self.repo.closeTransaction(conflicts[0].transactionId)
-                return
-
-            dlg = ConflictDialog(conflicts)
-            dlg.exec_()
-            solved, resolvedConflicts = dlg.solved, dlg.resolvedConflicts
-            if not solved:
-                self.repo.closeTransaction(conflicts[0].transactionId)
-                return
-            for conflict, resolution in zip(conflicts, list(resolvedConflicts.values())):
-                if resolution == ConflictDialog.LOCAL:
-                    conflict.resolveWithLocalVersion()
-                elif resolution == ConflictDialog.REMOTE:
-                    conflict.resolveWithRemoteVersion()
-                elif resolution == ConflictDialog.DELETE:
-                    conflict.resolveDeletingFeature()
-                else:
-                    conflict.resolveWithNewFeature(resolution)
+            resolutions, remaining = execute(lambda: autoMerge(conflicts))
+            if remaining:
+                ret = QMessageBox.warning(iface.mainWindow(), "Conflict(s) found while syncing",
+                                          "There are conflicts between local and remote changes.\n"
+                                          "Do you want to continue and fix them?",
+                                          QMessageBox.Yes | QMessageBox.No)
+                if ret == QMessageBox.No:
+                    self.repo.closeTransaction(conflicts[0].transactionId)
+                    return
+
+                dlg = ConflictDialog(remaining)
+                dlg.exec_()
+                solved, resolvedConflicts = dlg.solved, dlg.resolvedConflicts
+                if not solved:
+                    self.repo.closeTransaction(conflicts[0].transactionId)
+                    return
+                resolutions.update(resolvedConflicts)
             user, email = config.getUserInfo()
             if user is None:
+                self.repo.closeTransaction(conflicts[0].transactionId)
                 return
-            self.repo.commitAndCloseMergeAndTransaction(user, email, "Resolved merge conflicts", conflicts[0].transactionId)
-
+            def _resolve():
+                resolveConflicts(conflicts, resolutions)
+                self.repo.commitAndCloseMergeAndTransaction(user, email, "Resolved merge conflicts", conflicts[0].transactionId)
+            jobManager.submit("Merge '%s' into '%s'" % (branch, mergeInto), _resolve,
+                              lambda result: self._merged())
+        else:
+            self._merged()
 
+    def _merged(self):
         iface.messageBar().pushMessage("GeoGig", "Branch has been correctly merged",
                                               level=QgsMessageBar.INFO, duration=5)
         repoWatcher.repoChanged.emit(self.repo)
@@ -298,12 +336,19 @@ class HistoryViewer(QTreeWidget):
                 QMessageBox.Ok)
             return
 
-        commit, commit2 = self._sortCommits(commit, commit2)
-        addDiffLayers(self.repo, commit, commit2, layers)
+        def _export():
+            newCommit, oldCommit = self._sortCommits(commit, commit2)
+            addDiffLayers(self.repo, newCommit, oldCommit, layers)
+        self.repo.loadhistory([commit.commitid, commit2.commitid], _export)
 
     def _sortCommits(self, commit, commit2):
+        # the history of both commits must have been loaded with loadhistory
         try:
-            if commit2.authordate > commit.authordate:
+            if self.repo.isancestor(commit.commitid, commit2.commitid):
+                return commit2, commit
+            elif self.repo.isancestor(commit2.commitid, commit.commitid):
+                return commit, commit2
+            elif commit2.authordate > commit.authordate:
                 return commit2, commit
             else:
                 return commit, commit2
@@ -312,10 +357,11 @@ class HistoryViewer(QTreeWidget):
 
     def showDiffs(self, commit, commit2 = None):
         commit2 = commit2 or commit.parent
-        commit, commit2 = self._sortCommits(commit, commit2)
-
-        dlg = DiffViewerDialog(self, self.repo, commit2, commit)
-        dlg.exec_()
+        def _show():
+            newCommit, oldCommit = self._sortCommits(commit, commit2)
+            dlg = DiffViewerDialog(self, self.repo, oldCommit, newCommit)
+            dlg.exec_()
+        self.repo.loadhistory([commit.commitid, commit2.commitid], _show)
 
     def createTag(self, item):
         tagname, ok = QInputDialog.getText(self, 'Tag name',
@@ -366,6 +412,8 @@ class HistoryViewer(QTreeWidget):
     def updateContent(self, repo, layername = None):
         self.repo = repo
         self.layername = layername
+        for i in range(self.topLevelItemCount()):
+            self.topLevelItem(i).cancel()
         self.clear()
         if repo is not None:
             branches = repo.branches()
@@ -387,6 +435,8 @@ class BranchTreeItem(QTreeWidgetItem):
         self.setText(0, branch)
         self.setIcon(0, branchIcon)
         self._commit = None
+        self.commitIterator = None
+        self.tags = {}
 
     @property
     def commit(self):
@@ -396,19 +446,43 @@ class BranchTreeItem(QTreeWidgetItem):
 
 
     def populate(self):
-        if not self.childCount():
-            tags = defaultdict(list)
+        if not self.childCount() and self.commitIterator is None:
+            self.tags = defaultdict(list)
             for k, v in self.repo.tags().items():
-                tags[v].append(k)
-            commits = self.repo.log(until = self.branch, limit = 100, path = self.path)
-            if commits:
-                self._commit = commits[0]
-            for commit in commits:
-                item = CommitTreeItem(commit)
-                self.addChild(item)
-                w = CommitTreeItemWidget(commit, tags.get(commit.commitid, []))
-                self.treeWidget().setItemWidget(item, 0, w)
-            self.treeWidget().resizeColumnToContents(0)
+                self.tags[v].append(k)
+            self.commitIterator = self.repo.iterlog(until = self.branch, path = self.path)
+            self.loadMoreCommits()
+
+    def hasMoreCommits(self):
+        return self.commitIterator is not None
+
+    def moreCommitsReady(self):
+        return self.commitIterator is not None and self.commitIterator.pageReady()
+
+    def loadMoreCommits(self):
+        '''Adds the next page of commits in the history of the branch'''
+        if self.commitIterator is None:
+            return
+        try:
+            commits = self.commitIterator.nextPage()
+        except HTTPError:
+            commits = []
+        if not commits:
+            self.commitIterator = None
+            return
+        if self._commit is None and not self.childCount():
+            self._commit = commits[0]
+        for commit in commits:
+            item = CommitTreeItem(commit)
+            self.addChild(item)
+            w = CommitTreeItemWidget(commit, self.tags.get(commit.commitid, []))
+            self.treeWidget().setItemWidget(item, 0, w)
+        self.treeWidget().resizeColumnToContents(0)
+
+    def cancel(self):
+        if self.commitIterator is not None:
+            self.commitIterator.cancel()
+            self.commitIterator = None
 
 
 class CommitTreeItemWidget(QLabel):
@@ -26,6 +26,7 @@ __copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
 __revision__ = '$Format:%H$'
 
 import os
+import traceback
 from datetime import datetime
 
 from qgis.PyQt.QtWidgets import (QDialog,
@@ -37,6 +38,7 @@ from qgis.PyQt.QtWidgets import (QDialog,
                                  QPushButton,
                                  QMessageBox
                                 )
+from qgis.core import QgsMessageLog
 from qgis.gui import QgsMessageBar
 from qgis.utils import iface
 
@@ -44,7 +46,7 @@ from geogig import config
 from geogig.geogigwebapi import repository
 from geogig.geogigwebapi.repository import GeoGigException
 from geogig.tools.layertracking import addTrackedLayer, isRepoLayer
-from geogig.tools.gpkgsync import getCommitId
+from geogig.tools.gpkgsync import getCommitId, trackImportedGeopackage
 from geogig.tools.layers import namesFromLayer
 
 from qgiscommons2.layers import layerFromName, vectorLayers
@@ -139,9 +141,23 @@ class ImportDialog(QDialog):
         message = self.messageBox.toPlainText() or datetime.now().strftime("%Y-%m-%d %H_%M_%S")
         branch = self.branchCombo.currentText()
         try:
-            self.repo.importgeopkg(self.layer, branch, message, user, email, False)
             filename, layername = namesFromLayer(self.layer)
-            self.repo.checkoutlayer(filename, layername, ref = branch)
+            try:
+                isNewLayer = layername not in self.repo.trees(branch)
+            except:
+                isNewLayer = False
+            _, _, _, featureIds = self.repo.importgeopkg(self.layer, branch, message, user, email, False)
+            # the layer is only downloaded again if the server changed it
+            tracked = False
+            if isNewLayer:
+                try:
+                    tracked = trackImportedGeopackage(self.repo, filename, layername,
+                                                      self.repo.revparse(branch), featureIds)
+                except:
+                    QgsMessageLog.logMessage("Could not track imported layer locally:\n%s" % traceback.format_exc(),
+                                             level=QgsMessageLog.WARNING)
+            if not tracked:
+                self.repo.checkoutlayer(filename, layername, ref = branch)
             self.layer.reload()
             self.layer.triggerRepaint()
         except GeoGigException as e:
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    jobspanel.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtWidgets import (QDockWidget,
+                                 QWidget,
+                                 QVBoxLayout,
+                                 QHBoxLayout,
+                                 QLabel,
+                                 QProgressBar,
+                                 QPushButton,
+                                 QListWidget,
+                                 QListWidgetItem
+                                )
+
+from geogig.repowatcher import repoWatcher
+from geogig.tools.jobs import Job
+
+
+class JobWidget(QWidget):
+
+    def __init__(self, job):
+        QWidget.__init__(self)
+        self.job = job
+        layout = QVBoxLayout()
+        layout.setMargin(2)
+        self.titleLabel = QLabel(job.title)
+        layout.addWidget(self.titleLabel)
+        hlayout = QHBoxLayout()
+        self.progressBar = QProgressBar()
+        self.progressBar.setTextVisible(True)
+        hlayout.addWidget(self.progressBar)
+        self.cancelButton = QPushButton("Cancel")
+        self.cancelButton.clicked.connect(self.cancel)
+        hlayout.addWidget(self.cancelButton)
+        layout.addLayout(hlayout)
+        self.setLayout(layout)
+        self.updateContent()
+
+    def cancel(self):
+        self.cancelButton.setEnabled(False)
+        self.job.cancel()
+
+    def updateContent(self):
+        if self.job.status == Job.PENDING:
+            text = "Waiting..."
+        else:
+            text = self.job.text
+        if self.job.progress is None:
+            self.progressBar.setRange(0, 0)
+        else:
+            self.progressBar.setRange(0, 100)
+            self.progressBar.setValue(self.job.progress)
+        self.progressBar.setFormat(text + (" %p%" if self.job.progress is not None else ""))
+        self.cancelButton.setEnabled(not self.job.cancelled)
+
+
+class JobsPanel(QDockWidget):
+    '''Shows the progress of the GeoGig operations running in the background'''
+
+    def __init__(self):
+        QDockWidget.__init__(self, "GeoGig operations")
+        self.setObjectName("GeoGigJobsPanel")
+        self.list = QListWidget()
+        self.setWidget(self.list)
+        self.items = {}
+        repoWatcher.jobAdded.connect(self.addJob)
+        repoWatcher.jobChanged.connect(self.updateJob)
+        repoWatcher.jobFinished.connect(self.removeJob)
+
+    def addJob(self, job):
+        widget = JobWidget(job)
+        item = QListWidgetItem()
+        item.setSizeHint(widget.sizeHint())
+        self.list.addItem(item)
+        self.list.setItemWidget(item, widget)
+        self.items[job] = item
+        self.setVisible(True)
+
+    def updateJob(self, job):
+        if job in self.items:
+            self.list.itemWidget(self.items[job]).updateContent()
+
+    def removeJob(self, job):
+        if job in self.items:
+            item = self.items.pop(job)
+            self.list.takeItem(self.list.row(item))
+        if not self.items:
+            self.setVisible(False)
+
+jobsPanelInstance = JobsPanel()
@@ -30,7 +30,6 @@ __revision__ = '$Format:%H$'
 
 import os
 import sys
-import sqlite3
 
 from qgis.PyQt import uic
 from qgis.PyQt.QtCore import Qt
@@ -56,6 +55,7 @@ from geogig.geogigwebapi.repository import Repository
 from geogig.geogigwebapi.diff import LocalDiff, LOCAL_FEATURE_ADDED, LOCAL_FEATURE_MODIFIED, LOCAL_FEATURE_REMOVED
 from geogig.tools.layers import namesFromLayer, geogigFidFromGpkgFid
 from geogig.tools.layertracking import getTrackingInfo
+from geogig.tools.dbconnection import connect
 
 MODIFIED, ADDED, REMOVED = "M", "A", "R"
 
@@ -190,7 +190,7 @@ class LocalDiffViewerDialog(WIDGET, BASE):
 
     def localChanges(self, layer):
         filename, layername = namesFromLayer(layer)
-        con = sqlite3.connect(filename)
+        con = connect(filename)
         cursor = con.cursor()
         attributes = [v[1] for v in cursor.execute("PRAGMA table_info('%s');" % layername)]
         attrnames = [a for a in attributes if a != "fid"]
@@ -219,6 +219,13 @@ class LocalDiffViewerDialog(WIDGET, BASE):
                 featurechanges[attr] = value
             path = geogigFidFromGpkgFid(tracking, path)
             changesdict[path] = LocalDiff(layername, path, repo, featurechanges, commitid, c[-1])
+        # fetch the previous versions of all changed features at once, instead of one by one when clicked
+        changed = [c for c in changesdict.values() if c.changetype != LOCAL_FEATURE_ADDED]
+        if changed:
+            oldfeatures = execute(lambda: repo.features([c.path for c in changed], commitid))
+            for c in changed:
+                if c.path in oldfeatures:
+                    c.oldfeature = oldfeatures[c.path]
         return changesdict
 
 
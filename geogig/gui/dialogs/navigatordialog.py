@@ -27,7 +27,6 @@ __revision__ = '$Format:%H$'
 
 import os
 import sys
-import sqlite3
 import webbrowser
 from collections import defaultdict
 
@@ -70,6 +69,12 @@ from geogig.tools.layers import (WrongLayerSourceException,
                                  formatSource)
 from geogig.tools.utils import resourceFile
 from geogig.tools.gpkgsync import checkoutLayer, HasLocalChangesError
+from geogig.tools.conflicts import autoMerge, resolveConflicts
+from geogig.tools.jobs import jobManager
+from geogig.tools.localchanges import changeCounts
+from geogig.tools.dbconnection import connect
+from geogig.tools.tiles import canvasBbox
+from geogig.tools.profiles import CheckoutProfile
 from geogig.tools.layertracking import (removeTrackedLayer,
                                         getProjectLayerForGeoGigLayer,
                                         removeTrackedForRepo,
@@ -152,6 +157,21 @@ class NavigatorDialog(BASE, WIDGET):
                     item.refreshContent()
         repoWatcher.repoChanged.connect(_repoChanged)
 
+        def _endpointChanged(groupName):
+            if groupName == self.comboEndpoint.currentText():
+                self.fillTree()
+        repoWatcher.endpointChanged.connect(_endpointChanged)
+
+        def _localChangesChanged(layer):
+            for i in range(self.repoTree.topLevelItemCount()):
+                repoItem = self.repoTree.topLevelItem(i)
+                for j in range(repoItem.childCount()):
+                    branchItem = repoItem.child(j)
+                    for k in range(branchItem.childCount()):
+                        branchItem.child(k).updateLocalChanges()
+        repoWatcher.localChangesChanged.connect(_localChangesChanged)
+        repoWatcher.layerUpdated.connect(_localChangesChanged)
+
         self.updateNavigator()
 
         self.repoTree.itemExpanded.connect(self._itemExpanded)
@@ -381,40 +401,39 @@ class RepoItem(QTreeWidgetItem):
         if dlg.remote is not None:
             conflicts = execute(lambda: self.repo.pull(dlg.remote, dlg.branch))
             if conflicts:
-                ret = QMessageBox.warning(iface.mainWindow(), "Conflict(s) found while syncing",
-                                          "There are conflicts between local repository and connection.\n"
-                                          "Do you want to continue and fix them?",
-                                          QMessageBox.Yes | QMessageBox.No)
-                if ret == QMessageBox.No:
-                    self.repo.closeTransaction(conflicts[0].transactionId)
-                    return
-
-                dlg = ConflictDialog(conflicts)
-                dlg.exec_()
-                solved, resolvedConflicts = dlg.solved, dlg.resolvedConflicts
-                if not solved:
-                    self.repo.closeTransaction(conflicts[0].transactionId)
-                    return
-                for conflict, resolution in zip(conflicts, list(resolvedConflicts.values())):
-                    if resolution == ConflictDialog.LOCAL:
-                        conflict.resolveWithLocalVersion()
-                    elif resolution == ConflictDialog.REMOTE:
-                        conflict.resolveWithRemoteVersion()
-                    elif resolution == ConflictDialog.DELETE:
-                        conflict.resolveDeletingFeature()
-                    else:
-                        conflict.resolveWithNewFeature(resolution)
+                resolutions, remaining = execute(lambda: autoMerge(conflicts))
+                if remaining:
+                    ret = QMessageBox.warning(iface.mainWindow(), "Conflict(s) found while syncing",
+                                              "There are conflicts between local repository and connection.\n"
+                                              "Do you want to continue and fix them?",
+                                              QMessageBox.Yes | QMessageBox.No)
+                    if ret == QMessageBox.No:
+                        self.repo.closeTransaction(conflicts[0].transactionId)
+                        return
+
+                    dlg = ConflictDialog(remaining)
+                    dlg.exec_()
+                    solved, resolvedConflicts = dlg.solved, dlg.resolvedConflicts
+                    if not solved:
+                        self.repo.closeTransaction(conflicts[0].transactionId)
+                        return
+                    resolutions.update(resolvedConflicts)
                 user, email = config.getUserInfo()
                 if user is None:
+                    self.repo.closeTransaction(conflicts[0].transactionId)
                     return
-                self.repo.commitAndCloseMergeAndTransaction(user, email, "Resolved merge conflicts", conflicts[0].transactionId)
-                config.iface.messageBar().pushMessage("Changes have been correctly pulled from the connection",
-                                               level = QgsMessageBar.INFO, duration = 5)
-                repoWatcher.repoChanged.emit(self.repo)
+                def _resolve():
+                    resolveConflicts(conflicts, resolutions)
+                    self.repo.commitAndCloseMergeAndTransaction(user, email, "Resolved merge conflicts", conflicts[0].transactionId)
+                jobManager.submit("Pull into repository '%s'" % self.repo.title, _resolve,
+                                  lambda result: self._pulled())
             else:
-                config.iface.messageBar().pushMessage("Changes have been correctly pulled from the connection",
-                                               level = QgsMessageBar.INFO, duration = 5)
-                repoWatcher.repoChanged.emit(self.repo)
+                self._pulled()
+
+    def _pulled(self):
+        config.iface.messageBar().pushMessage("Changes have been correctly pulled from the connection",
+                                       level = QgsMessageBar.INFO, duration = 5)
+        repoWatcher.repoChanged.emit(self.repo)
 
     def push(self):
         dlg = RemoteRefDialog(self.repo)
@@ -505,10 +524,11 @@ class LayerItem(QTreeWidgetItem):
 
         self.status = self.NOT_EXPORTED
         trackedlayer = getTrackingInfoForGeogigLayer(self.repo.url, layer)
+        self.trackedlayer = trackedlayer
         if trackedlayer:
             if os.path.exists(trackedlayer.geopkg):
                 try:
-                    con = sqlite3.connect(trackedlayer.geopkg)
+                    con = connect(trackedlayer.geopkg)
                     cursor = con.cursor()
                     cursor.execute("SELECT commit_id FROM geogig_audited_tables WHERE table_name='%s';" % layer)
                     self.currentCommitId = cursor.fetchone()[0]
@@ -520,6 +540,18 @@ class LayerItem(QTreeWidgetItem):
                         self.status = self.NOT_IN_SYNC
                 except:
                     pass
+        self.updateLocalChanges()
+
+    def updateLocalChanges(self):
+        text = self.layer
+        if self.status != self.NOT_EXPORTED:
+            try:
+                counts = changeCounts(self.trackedlayer.geopkg, self.layer)
+                if counts.total():
+                    text = "%s [local changes: %s]" % (self.layer, counts)
+            except:
+                pass
+        self.setText(0, text)
 
 
     def add(self):
@@ -547,6 +579,27 @@ class LayerItem(QTreeWidgetItem):
         else:
             checkoutLayer(self.repo, self.layer, None, self.branchCommitId)
 
+    def addExtent(self):
+        checkoutLayer(self.repo, self.layer, canvasBbox(), self.branchCommitId)
+
+    def addWithProfile(self):
+        columns, ok = QInputDialog.getText(self.tree, 'Checkout profile',
+                                           'Columns to check out, separated by commas (empty for all):')
+        if not ok:
+            return
+        filter, ok = QInputDialog.getText(self.tree, 'Checkout profile',
+                                          "Filter for the features to check out, as an SQL expression\n"
+                                          "such as region = 'north' (empty for all):")
+        if not ok:
+            return
+        columns = [c.strip() for c in columns.split(",") if c.strip()]
+        profile = CheckoutProfile(columns, filter)
+        try:
+            checkoutLayer(self.repo, self.layer, None, self.branchCommitId, profile)
+        except ValueError as e:
+            QMessageBox.warning(config.iface.mainWindow(), 'Cannot check out layer',
+                                "Wrong checkout profile:\n%s" % e, QMessageBox.Ok)
+
 
     def menu(self):
         menu = QMenu()
@@ -554,6 +607,13 @@ class LayerItem(QTreeWidgetItem):
         addAction = QAction(icon("reset.png"), "Add to project %s" % status, menu)
         addAction.triggered.connect(self.add)
         menu.addAction(addAction)
+        if self.status == self.NOT_EXPORTED:
+            addExtentAction = QAction(icon("reset.png"), "Add to project (current map extent only)", menu)
+            addExtentAction.triggered.connect(self.addExtent)
+            menu.addAction(addExtentAction)
+            addProfileAction = QAction(icon("reset.png"), "Add to project with checkout profile...", menu)
+            addProfileAction.triggered.connect(self.addWithProfile)
+            menu.addAction(addProfileAction)
         deleteAction = QAction(QgsApplication.getThemeIcon('/mActionDeleteSelected.svg'), "Delete", menu)
         deleteAction.triggered.connect(self.delete)
         menu.addAction(deleteAction)
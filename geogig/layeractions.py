@@ -46,16 +46,25 @@ from geogig.gui.dialogs.localdiffviewerdialog import LocalDiffViewerDialog
 from geogig.gui.dialogs import commitdialog
 from geogig.gui.dialogs.historyviewer import HistoryViewerDialog
 
-from geogig.tools.gpkgsync import syncLayer, getCommitId, applyLayerChanges
+from geogig.tools.gpkgsync import syncLayer, getCommitId, applyLayerChanges, changeGeopackageVersion
+from geogig.tools.jobs import jobManager
 from geogig.tools.layers import namesFromLayer, hasLocalChanges
 from geogig.tools.layertracking import getTrackingInfo
+from geogig.tools.localchanges import changeCounts, watchLayer
+from geogig.tools.tiles import checkoutGeopackage, watchTiles
+from geogig.tools.profiles import layerProfile
 
 _actions = {}
 _infoActions = {}
+_changesActions = {}
 
 def setAsRepoLayer(layer):
     removeLayerActions(layer)
+    watchLayer(layer, *namesFromLayer(layer))
+    hideProfileColumns(layer)
     canConnect = addInfoActions(layer)
+    if canConnect:
+        watchTiles(layer, Repository(getTrackingInfo(layer).repoUrl), *namesFromLayer(layer))
     separatorAction = QAction("", config.iface.legendInterface())
     separatorAction.setSeparator(True)
     config.iface.legendInterface().addLegendLayerAction(separatorAction, u"GeoGig", u"id1", QgsMapLayer.VectorLayer, False)
@@ -92,6 +101,21 @@ def setAsRepoLayer(layer):
     _actions[layer.id()].extend(_infoActions[layer.id()])
     repoWatcher.layerUpdated.connect(updateInfoActions)
 
+def hideProfileColumns(layer):
+    '''Hides in forms and attribute tables the columns left out of the checkout profile of a layer'''
+    filename, layername = namesFromLayer(layer)
+    profile = layerProfile(filename, layername)
+    if profile is None:
+        return
+    try:
+        hidden = profile.hiddenColumns(filename, layername)
+    except ValueError:
+        return
+    for name in hidden:
+        idx = layer.fieldNameIndex(name)
+        if idx != -1:
+            layer.setEditorWidgetV2(idx, "Hidden")
+
 def addInfoActions(layer):
     commitId = getCommitId(layer)
     tracking = getTrackingInfo(layer)
@@ -123,8 +147,32 @@ def addInfoActions(layer):
     config.iface.legendInterface().addLegendLayerAction(shaAction, u"GeoGig", u"id1", QgsMapLayer.VectorLayer, False)
     config.iface.legendInterface().addLegendLayerActionForLayer(shaAction, layer)
     _infoActions[layer.id()].append(shaAction)
+    changesAction = QAction(_localChangesText(layer), config.iface.legendInterface())
+    config.iface.legendInterface().addLegendLayerAction(changesAction, u"GeoGig", u"id1", QgsMapLayer.VectorLayer, False)
+    config.iface.legendInterface().addLegendLayerActionForLayer(changesAction, layer)
+    _infoActions[layer.id()].append(changesAction)
+    _changesActions[layer.id()] = changesAction
+    profile = layerProfile(*namesFromLayer(layer))
+    if profile is not None:
+        profileAction = QAction("Checkout profile: %s" % profile, config.iface.legendInterface())
+        config.iface.legendInterface().addLegendLayerAction(profileAction, u"GeoGig", u"id1", QgsMapLayer.VectorLayer, False)
+        config.iface.legendInterface().addLegendLayerActionForLayer(profileAction, layer)
+        _infoActions[layer.id()].append(profileAction)
     return True
 
+def _localChangesText(layer):
+    try:
+        return "Local changes: %s" % changeCounts(*namesFromLayer(layer))
+    except:
+        return "Local changes: unknown"
+
+def updateLocalChangesAction(layer):
+    action = _changesActions.get(layer.id())
+    if action is not None:
+        action.setText(_localChangesText(layer))
+
+repoWatcher.localChangesChanged.connect(updateLocalChangesAction)
+
 def updateInfoActions(layer):
     setAsRepoLayer(layer)
 
@@ -150,6 +198,7 @@ def removeLayerActions(layer):
             config.iface.legendInterface().removeLegendLayerAction(action)
         _actions[layer.id()] = []
         _infoActions[layer.id()] = []
+        _changesActions.pop(layer.id(), None)
     except KeyError:
         pass
 
@@ -167,24 +216,34 @@ def revertChange(layer):
     dlg = HistoryViewerDialog(repo, layername)
     dlg.exec_()
     if dlg.ref is not None:
-        #TODO check that selected commit is in history line
-
-        commit = Commit.fromref(repo, dlg.ref)
-        # check if we are reverting commit which adds layer to the repo
-        if commit.addsLayer():
-            QMessageBox.warning(config.iface.mainWindow(), 'Cannot revert commit',
-                    "Commits which add layer to the repository can not "
-                    "be reverted. Use GeoGig Navigator to remove layer "
-                    "from branch.")
-            return
+        commitId = getCommitId(layer)
+        repo.loadhistory([dlg.ref, commitId], partial(_revertChange, repo, layer, dlg.ref, commitId))
 
-        applyLayerChanges(repo, layer, commit.commitid, commit.parent.commitid, False)
-        layer.reload()
-        layer.triggerRepaint()
-        config.iface.messageBar().pushMessage("GeoGig", "Commit changes have been reverted in local layer",
-                                                      level=QgsMessageBar.INFO,
-                                                      duration=5)
-        commitdialog.suggestedMessage = "Reverted changes from commit %s [%s] " % (commit.commitid, commit.message)
+def _revertChange(repo, layer, ref, commitId):
+    if not repo.isancestor(ref, commitId):
+        QMessageBox.warning(config.iface.mainWindow(), 'Cannot revert commit',
+                "The selected commit is not in the history of the "
+                "current version of the layer.",
+                QMessageBox.Ok)
+        return
+
+    commit = Commit.fromref(repo, ref)
+    # check if we are reverting commit which adds layer to the repo
+    if commit.addsLayer():
+        QMessageBox.warning(config.iface.mainWindow(), 'Cannot revert commit',
+                "Commits which add layer to the repository can not "
+                "be reverted. Use GeoGig Navigator to remove layer "
+                "from branch.")
+        return
+
+    applyLayerChanges(repo, layer, commit.commitid, commit.parent.commitid, False)
+    layer.reload()
+    layer.triggerRepaint()
+    updateLocalChangesAction(layer)
+    config.iface.messageBar().pushMessage("GeoGig", "Commit changes have been reverted in local layer",
+                                                  level=QgsMessageBar.INFO,
+                                                  duration=5)
+    commitdialog.suggestedMessage = "Reverted changes from commit %s [%s] " % (commit.commitid, commit.message)
 
 def changeVersion(layer):
     if hasLocalChanges(layer):
@@ -205,14 +264,19 @@ def changeVersion(layer):
                 "The selected commit does not contain the specified layer.",
                 QMessageBox.Ok)
             else:
-                repo.checkoutlayer(tracking.geopkg, tracking.layername, None, dlg.ref)
-                config.iface.messageBar().pushMessage("GeoGig", "Layer has been updated to commit %s" % dlg.ref,
-                                                       level=QgsMessageBar.INFO,
-                                                       duration=5)
+                ref = dlg.ref
                 layer.reload()
-                layer.triggerRepaint()
-                repoWatcher.layerUpdated.emit(layer)
-                repoWatcher.repoChanged.emit(repo)
+                def _changed(result):
+                    config.iface.messageBar().pushMessage("GeoGig", "Layer has been updated to commit %s" % ref,
+                                                           level=QgsMessageBar.INFO,
+                                                           duration=5)
+                    layer.reload()
+                    layer.triggerRepaint()
+                    repoWatcher.layerUpdated.emit(layer)
+                    repoWatcher.repoChanged.emit(repo)
+                jobManager.submit("Change '%s' to commit %s" % (tracking.layername, ref),
+                                  lambda: changeGeopackageVersion(repo, tracking.geopkg, tracking.layername, ref),
+                                  _changed)
 
 def addLayer(layer):
     if not layer.source().lower().split("|")[0].split(".")[-1] in ["geopkg", "gpkg"]:
@@ -264,12 +328,16 @@ def revertLocalChanges(layer):
         tracking = getTrackingInfo(layer)
         repo = Repository(tracking.repoUrl)
         commitid = getCommitId(layer)
-        repo.checkoutlayer(tracking.geopkg, tracking.layername, None, commitid)
-        config.iface.messageBar().pushMessage("GeoGig", "Local changes have been discarded",
-                                                      level=QgsMessageBar.INFO,
-                                                      duration=5)
-        layer.reload()
-        layer.triggerRepaint()
+        def _reverted(result):
+            config.iface.messageBar().pushMessage("GeoGig", "Local changes have been discarded",
+                                                          level=QgsMessageBar.INFO,
+                                                          duration=5)
+            layer.reload()
+            layer.triggerRepaint()
+            updateLocalChangesAction(layer)
+        jobManager.submit("Revert local changes in '%s'" % tracking.layername,
+                          lambda: checkoutGeopackage(repo, tracking.geopkg, tracking.layername, commitid),
+                          _reverted)
     else:
         config.iface.messageBar().pushMessage("GeoGig", "No local changes were found",
                                                       level=QgsMessageBar.INFO,
@@ -40,11 +40,15 @@ from geogig import config
 from geogig.gui.dialogs.navigatordialog import NavigatorDialog
 from geogig.gui.dialogs.importdialog import ImportDialog
 from geogig.gui.dialogs.navigatordialog import navigatorInstance
+from geogig.gui.dialogs.jobspanel import jobsPanelInstance
 
+from geogig.geogigwebapi.connection import closeSessions
+from geogig.geogigwebapi.repository import revalidateEndpoints
 from geogig.layeractions import setAsRepoLayer, setAsNonRepoLayer, removeLayerActions
 
 from geogig.tools.infotool import MapToolGeoGigInfo
 from geogig.tools.layertracking import removeNonexistentTrackedLayers, readTrackedLayers, isRepoLayer
+from geogig.tools.dbconnection import useWal
 
 from qgiscommons2.gui import addAboutMenu, removeAboutMenu, addHelpMenu, removeHelpMenu
 from qgiscommons2.settings import readSettings
@@ -84,10 +88,12 @@ class GeoGigPlugin(object):
         except Exception as e:
             pass
 
-        QSettings().setValue("/qgis/walForSqlite3", False)
+        QSettings().setValue("/qgis/walForSqlite3", useWal())
 
     def unload(self):
         navigatorInstance.setVisible(False)
+        jobsPanelInstance.setVisible(False)
+        self.iface.removeDockWidget(jobsPanelInstance)
         try:
             QgsMapLayerRegistry.instance().layerWasAdded.disconnect(trackLayer)
             QgsMapLayerRegistry.instance().layerRemoved.disconnect(layerRemoved)
@@ -105,6 +111,7 @@ class GeoGigPlugin(object):
             removeLayerActions(layer)
         removeNonexistentTrackedLayers()
         removeTempFolder()
+        closeSessions()
 
         try:
             from qgistester.tests import removeTestModule
@@ -161,6 +168,9 @@ class GeoGigPlugin(object):
         #self.mapTool.setAction(self.toolAction)
 
         self.iface.addDockWidget(Qt.RightDockWidgetArea, navigatorInstance)
+        self.iface.addDockWidget(Qt.BottomDockWidgetArea, jobsPanelInstance)
+        jobsPanelInstance.setVisible(False)
+        revalidateEndpoints()
 
         try:
             from lessons import addLessonsFolder, addGroup
@@ -4,5 +4,10 @@ class RepoWatcher(QObject):
 
     repoChanged = pyqtSignal(object)
     layerUpdated = pyqtSignal(object)
+    localChangesChanged = pyqtSignal(object)
+    endpointChanged = pyqtSignal(str)
+    jobAdded = pyqtSignal(object)
+    jobChanged = pyqtSignal(object)
+    jobFinished = pyqtSignal(object)
 
 repoWatcher = RepoWatcher()
\ No newline at end of file
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    benchmarks.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+from __future__ import print_function
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import threading
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+import requests
+
+from qgiscommons2.files import tempFilename, tempFolderInTempFolder
+
+from geogig.geogigwebapi import repository
+from geogig.geogigwebapi.repository import (Repository, readRepos, repositoriesFromUrl,
+                                            featureCache, cacheStatistics)
+from geogig.geogigwebapi.connection import closeSessions
+from geogig.tools.interchange import saveAuditTables
+
+# Time the stand-in server spends setting up each new connection, to
+# simulate the TCP/TLS handshake cost of a remote GeoGig server
+HANDSHAKE_DELAY = 0.02
+
+# Time taken by the stand-in server to list its repositories
+REPOS_LISTING_DELAY = 0.5
+
+FAKE_SHA = "a" * 40
+FAKE_REPOS = b"<repos><repo><name>bench</name></repo><repo><name>other</name></repo></repos>"
+FAKE_GPKG = b"x" * 4096
+
+_standInResponses = {
+    "branch": {"response": {"Local": {"Branch": [{"name": "master"}, {"name": "mybranch"}]}}},
+    "ls-tree": {"response": {"node": [{"path": "points"}]}},
+    "refparse": {"response": {"Ref": {"objectId": FAKE_SHA}}},
+    "export-diff.json": {"task": {"id": 1}},
+    "1.json": {"task": {"status": "FINISHED"}},
+    "featurediff": {"response": {"diff": [{"attributename": "name", "oldvalue": "bench"},
+                                          {"attributename": "geom", "oldvalue": "POINT (1 1)"}]}},
+}
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # send headers and body in a single packet, as a real server would
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        time.sleep(HANDSHAKE_DELAY)
+        self.server.connections += 1
+        BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        self.server.requested.append(self.path)
+        command = self.path.split("?")[0].rstrip("/").split("/")[-1]
+        if command == "download":
+            body = FAKE_GPKG
+        elif command == "repos":
+            time.sleep(REPOS_LISTING_DELAY)
+            body = FAKE_REPOS
+        else:
+            body = json.dumps(_standInResponses[command]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StandInServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), _StandInHandler)
+        self.connections = 0
+        self.requested = []
+
+    def url(self):
+        return "http://127.0.0.1:%i/" % self.server_address[1]
+
+
+def _syncLayerCalls(repo):
+    '''Issues the server calls made by syncLayer when updating a layer with no local changes'''
+    for branch in repo.branches():
+        repo.trees(branch)
+    repo.revparse("master")
+    # skip the diff cache, since syncLayer asks for a different diff every time
+    taskid = repo._prepareexportdiff(FAKE_SHA, FAKE_SHA, "points")
+    repo._aftertask(taskid, lambda response: repo._downloadfile(taskid, tempFilename("gpkg")))
+
+
+def benchmarkConnectionPool(iterations = 20):
+    '''
+    Compares the time taken by the server calls of a syncLayer operation
+    when using the pooled sessions, against the same calls made
+    opening a new connection for each request
+    '''
+    server = _StandInServer()
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        closeSessions()
+        repo = Repository(server.url() + "repos/bench/")
+        start = time.time()
+        for i in range(iterations):
+            _syncLayerCalls(repo)
+        pooledTime = (time.time() - start) / iterations
+        pooledConnections = server.connections
+        requested = list(server.requested)
+
+        server.connections = 0
+        start = time.time()
+        for path in requested:
+            requests.get(server.url().rstrip("/") + path).content
+        unpooledTime = (time.time() - start) / iterations
+        unpooledConnections = server.connections
+    finally:
+        closeSessions()
+        server.shutdown()
+        server.server_close()
+
+    print("Requests per syncLayer: %i" % (len(requested) / iterations))
+    print("Pooled sessions: %.1f ms per syncLayer (%i connections opened)"
+          % (pooledTime * 1000, pooledConnections))
+    print("New connection per request: %.1f ms per syncLayer (%i connections opened)"
+          % (unpooledTime * 1000, unpooledConnections))
+    print("Latency saved per syncLayer: %.1f ms" % ((unpooledTime - pooledTime) * 1000))
+    return pooledTime, unpooledTime
+
+
+def benchmarkStartup(endpoints = 5):
+    '''
+    Measures the time taken to read the saved GeoGig servers when the
+    plugin is loaded, checking that no server is contacted, and compares
+    it with fetching the list of repositories from each server in turn
+    '''
+    server = _StandInServer()
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    folder = tempFolderInTempFolder()
+    urls = [server.url() + "endpoint%i/" % i for i in range(endpoints)]
+    with open(os.path.join(folder, "repositories"), "w") as f:
+        f.write(json.dumps([{"url": url, "title": "Server %i" % i} for i, url in enumerate(urls)]))
+    with open(os.path.join(folder, "repositorycache"), "w") as f:
+        f.write(json.dumps({url: ["bench", "other"] for url in urls}))
+    try:
+        start = time.time()
+        readRepos(folder)
+        startupTime = time.time() - start
+        startupRequests = len(server.requested)
+        cachedRepos = len(repository.repos)
+
+        start = time.time()
+        for i, url in enumerate(urls):
+            repositoriesFromUrl(url, "Server %i" % i)
+        sequentialTime = time.time() - start
+    finally:
+        closeSessions()
+        server.shutdown()
+        server.server_close()
+        readRepos()
+
+    print("Startup: %.1f ms to read %i servers (%i repositories from cache, %i requests made)"
+          % (startupTime * 1000, endpoints, cachedRepos, startupRequests))
+    print("Querying each server in turn: %.1f ms" % (sequentialTime * 1000))
+    return startupTime, startupRequests
+
+
+def benchmarkFeatureCache(features = 200):
+    '''
+    Measures the time taken to read the same feature versions twice, as
+    the conflict and diff viewers do, and reports the hits and misses
+    of the feature cache
+    '''
+    server = _StandInServer()
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    # new paths on each run, so previous runs do not warm up the cache
+    paths = ["points/%s" % uuid.uuid4().hex for i in range(features)]
+    try:
+        repo = Repository(server.url() + "repos/bench/")
+        cache = featureCache()
+        hits, misses = cache.hits, cache.misses
+        start = time.time()
+        for path in paths:
+            repo.feature(path, FAKE_SHA)
+        coldTime = time.time() - start
+        start = time.time()
+        for path in paths:
+            repo.feature(path, FAKE_SHA)
+        warmTime = time.time() - start
+        requestsMade = len(server.requested)
+    finally:
+        closeSessions()
+        server.shutdown()
+        server.server_close()
+
+    print("Reading %i features: %.1f ms from the server, %.1f ms from the cache (%i requests made)"
+          % (features, coldTime * 1000, warmTime * 1000, requestsMade))
+    print("Feature cache: %i hits, %i misses" % (cache.hits - hits, cache.misses - misses))
+    for name, (hits, misses) in sorted(cacheStatistics().items()):
+        print("Cache '%s' since startup: %i hits, %i misses" % (name, hits, misses))
+    return coldTime, warmTime
+
+
+def _createAuditedGeopackage(filename, layername, features, edits):
+    '''
+    Creates a geopackage with the tables of a layer tracked by GeoGig, where
+    the passed number of edits have been recorded in the audit table. Most
+    edited features are modified several times, and some of them deleted
+    '''
+    con = sqlite3.connect(filename)
+    c = con.cursor()
+    c.execute('CREATE TABLE "%s" (fid INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, geom BLOB);' % layername)
+    c.execute('CREATE TABLE "%s_audit" (fid INTEGER, name TEXT, geom BLOB, '
+              'audit_timestamp TEXT, audit_op INTEGER);' % layername)
+    c.execute('CREATE TABLE "%s_fids" (gpkg_fid TEXT, geogig_fid TEXT);' % layername)
+    c.execute("CREATE TABLE geogig_audited_tables (table_name TEXT, mapped_path TEXT, "
+              "audit_table TEXT, commit_id TEXT);")
+    c.execute("CREATE TABLE gpkg_geometry_columns (table_name TEXT, column_name TEXT, "
+              "geometry_type_name TEXT, srs_id INTEGER, z INTEGER, m INTEGER);")
+    c.execute("INSERT INTO geogig_audited_tables VALUES (?, ?, ?, ?);",
+              (layername, layername, layername + "_audit", FAKE_SHA))
+    c.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', 'POINT', 4326, 0, 0);", (layername,))
+    geom = b"\x00" * 64
+    c.executemany('INSERT INTO "%s" VALUES (?, ?, ?);' % layername,
+                  ((i, "feature %i" % i, geom) for i in range(1, features + 1)))
+    c.executemany('INSERT INTO "%s_fids" VALUES (?, ?);' % layername,
+                  ((str(i), uuid.uuid4().hex) for i in range(1, features + 1)))
+    rand = random.Random(0)
+    audit = []
+    for i in range(edits):
+        fid = rand.randint(1, features)
+        op = 3 if rand.random() < 0.05 else 2
+        audit.append((fid, "feature %i" % fid, geom, "2026-10-01", op))
+    c.executemany('INSERT INTO "%s_audit" VALUES (?, ?, ?, ?, ?);' % layername, audit)
+    deleted = set(a[0] for a in audit if a[4] == 3)
+    c.executemany('DELETE FROM "%s" WHERE fid = ?;' % layername, ((fid,) for fid in deleted))
+    con.commit()
+    con.close()
+
+
+def _saveAuditTablesRowByRow(filename, layername, newfilename):
+    '''The feature by feature copy that saveAuditTables replaces, used as baseline'''
+    conn = sqlite3.connect(newfilename)
+    c = conn.cursor()
+    c.execute("ATTACH DATABASE ? AS db2", (filename,))
+    tables = ["%s_audit" % layername, "%s_fids" % layername, "geogig_audited_tables", "gpkg_geometry_columns"]
+    for table in tables:
+        c.execute("SELECT sql FROM db2.sqlite_master WHERE type='table' AND name='%s'" % table)
+        c.execute(c.fetchone()[0])
+        c.execute("INSERT INTO main.%s SELECT * FROM db2.%s" % (table, table))
+    c.execute("SELECT sql FROM db2.sqlite_master WHERE type='table' AND name='%s'" % layername)
+    c.execute(c.fetchone()[0])
+    c.execute("SELECT * FROM db2.%s_audit WHERE audit_op<>3;" % layername)
+    changed = c.fetchall()
+    used = []
+    for feature in changed[::-1]:
+        if feature[0] not in used:
+            c.execute('INSERT INTO main.%s SELECT * FROM db2.%s WHERE fid=%s;' % (layername, layername, feature[0]))
+            used.append(feature[0])
+    conn.commit()
+    conn.close()
+
+
+def benchmarkSaveAuditTables(features = 50000, edits = 20000):
+    '''
+    Compares the time taken to prepare the interchange geopackage sent to
+    the server when importing a layer with a large audit table, against
+    copying the changed features one by one
+    '''
+    layername = "points"
+    filename = tempFilename("gpkg")
+    _createAuditedGeopackage(filename, layername, features, edits)
+
+    setFilename = tempFilename("gpkg")
+    start = time.time()
+    saveAuditTables(filename, layername, setFilename)
+    setTime = time.time() - start
+
+    rowFilename = tempFilename("gpkg")
+    start = time.time()
+    _saveAuditTablesRowByRow(filename, layername, rowFilename)
+    rowTime = time.time() - start
+
+    counts = []
+    for f in [setFilename, rowFilename]:
+        con = sqlite3.connect(f)
+        counts.append(con.execute('SELECT COUNT(*) FROM "%s";' % layername).fetchone()[0])
+        con.close()
+
+    print("Interchange geopackage for %i edits (%i changed features): %.1f ms set-based, %.1f ms feature by feature"
+          % (edits, counts[0], setTime * 1000, rowTime * 1000))
+    if counts[0] != counts[1]:
+        print("Warning: %i features copied feature by feature" % counts[1])
+    return setTime, rowTime
+
+
+def run_benchmarks():
+    benchmarkConnectionPool()
+    benchmarkStartup()
+    benchmarkFeatureCache()
+    benchmarkSaveAuditTables()
@@ -30,10 +30,14 @@ import sqlite3
 from sqlite3 import OperationalError
 import unittest
 import shutil
+import threading
 from distutils.dir_util import copy_tree
 
+from requests import Response
+from requests.exceptions import ConnectionError, HTTPError
+
 from qgis.PyQt.QtCore import Qt
-from qgis.core import QgsProject, QgsFeature, QgsGeometry, QgsPoint, edit
+from qgis.core import QgsProject, QgsFeature, QgsGeometry, QgsPoint, QgsRectangle, edit
 from qgis.utils import iface
 
 from geogig import tests
@@ -43,16 +47,48 @@ from geogig import layeractions
 
 from geogig.gui.dialogs.navigatordialog import navigatorInstance
 
-from geogig.tests import conf, _createSimpleTestRepo, _createEmptyTestRepo, _createMultilayerTestRepo
+from geogig.tests import conf, _createSimpleTestRepo, _createEmptyTestRepo, _createMultilayerTestRepo, _layerPath
 from geogig.tests.testwebapilib import webapiSuite
 from geogig.tests.testgpkg import GeoPackageEditTests
 
 from geogig.tools import layertracking
-from geogig.tools.gpkgsync import applyLayerChanges, getCommitId, checkoutLayer
+from geogig.tools.gpkgsync import (applyLayerChanges, getCommitId, checkoutLayer, changeLayerVersion,
+                                  changeGeopackageVersion, trackImportedGeopackage, updateGeopackage,
+                                  _useDelta)
+from geogig.gui.dialogs.conflictdialog import ConflictDialog
+from geogig.tools import conflicts
+from geogig.tools.conflicts import mergeFeatures, resolveConflict, resolveConflicts
+from geogig.tools.fids import fidMapping
+from geogig.tools.interchange import appendFeatures, copyDatabase
+from geogig.tools.tiles import tilesInExtent, checkoutTiles
+from geogig.tools.profiles import CheckoutProfile, applyProfile
+from geogig.tools.localchanges import changeCounts
+from geogig.tools import dbconnection
+from geogig.tools.layers import hasLocalChanges
 
 from qgiscommons2.files import tempFolderInTempFolder, tempFilename
 from qgiscommons2.layers import loadLayerNoCrsDialog, layerFromName
 
+class _FailingConflict(object):
+    '''A conflict that fails with the passed errors before being solved'''
+
+    def __init__(self, errors, path = "points/1"):
+        self.errors = list(errors)
+        self.path = path
+        self.attempts = 0
+        self.solved = False
+
+    def resolveWithLocalVersion(self):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        self.solved = True
+
+def _httpError(status):
+    response = Response()
+    response.status_code = status
+    return HTTPError(response = response)
+
 def openTestProject(name):
     orgPath = os.path.join(os.path.dirname(__file__), "data", "projects", name)
     destPath = tempFolderInTempFolder()
@@ -788,6 +824,322 @@ class PluginTests(unittest.TestCase):
         self.assertEqual(2, len(features))
         self.assertEqual(getCommitId(layer), log[0].commitid)
 
+    def testChangeLayerVersion(self):
+        repo = _createSimpleTestRepo()
+        log = repo.log()
+        filename = tempFilename("gpkg")
+        repo.checkoutlayer(filename, "points", ref = log[-1].commitid)
+        layer = loadLayerNoCrsDialog(filename, "points", "ogr")
+        changeLayerVersion(repo, layer, repo.HEAD)
+        layer.reload()
+        self.assertEqual(2, len(list(layer.getFeatures())))
+        self.assertEqual(getCommitId(layer), log[0].commitid)
+        changeLayerVersion(repo, layer, log[-1].commitid)
+        layer.reload()
+        self.assertEqual(1, len(list(layer.getFeatures())))
+        self.assertEqual(getCommitId(layer), log[-1].commitid)
+
+    def testChangeLayerVersionWithDelta(self):
+        repo = _createSimpleTestRepo()
+        filename = tempFilename("gpkg")
+        repo.checkoutlayer(filename, "points")
+        layer = loadLayerNoCrsDialog(filename, "points", "ogr")
+        with edit(layer):
+            for i in range(50):
+                feat = QgsFeature()
+                feat.setGeometry(QgsGeometry.fromPoint(QgsPoint(i, i)))
+                feat.setAttributes([1000 + i, i])
+                layer.addFeatures([feat])
+        repo.importgeopkg(layer, "master", "message", "me", "me@mysite.com", True)
+        oldCommitId = repo.revparse(repo.HEAD)
+        filename2 = tempFilename("gpkg")
+        repo.checkoutlayer(filename2, "points")
+        layer2 = loadLayerNoCrsDialog(filename2, "points", "ogr")
+        idx = layer2.dataProvider().fieldNameIndex("n")
+        with edit(layer2):
+            layer2.changeAttributeValue(next(layer2.getFeatures()).id(), idx, 5000)
+        repo.importgeopkg(layer2, "master", "message", "me", "me@mysite.com", True)
+        newCommitId = repo.revparse(repo.HEAD)
+        oldFilename = tempFilename("gpkg")
+        repo.checkoutlayer(oldFilename, "points", ref = oldCommitId)
+        # the 50 features added before are not counted in either direction
+        self.assertLess(repo.estimatedchanges(oldCommitId, newCommitId), 10)
+        self.assertLess(repo.estimatedchanges(newCommitId, oldCommitId), 10)
+        self.assertTrue(_useDelta(repo, oldFilename, "points", oldCommitId, newCommitId))
+        changeGeopackageVersion(repo, oldFilename, "points", newCommitId)
+        self.assertEqual(newCommitId, getCommitId(oldFilename + "|layername=points"))
+        con = sqlite3.connect(oldFilename)
+        self.assertEqual(1, con.execute("SELECT COUNT(*) FROM points WHERE n = 5000;").fetchone()[0])
+        con.close()
+
+    def testMergeFeatures(self):
+        origin = {"n": 1, "name": "a", "geometry": "POINT (1 1)"}
+        local = {"n": 2, "name": "a", "geometry": "Point (1 1)"}
+        remote = {"n": 1, "name": "b", "geometry": "POINT (2 2)"}
+        merged, conflicted = mergeFeatures(origin, local, remote)
+        self.assertEqual([], conflicted)
+        self.assertEqual({"n": 2, "name": "b", "geometry": "POINT (2 2)"}, merged)
+        local["name"] = "c"
+        merged, conflicted = mergeFeatures(origin, local, remote)
+        self.assertEqual(["name"], conflicted)
+
+    def testResolveConflictRetriesTransientErrors(self):
+        delay = conflicts.RETRY_DELAY
+        conflicts.RETRY_DELAY = 0
+        try:
+            conflict = _FailingConflict([ConnectionError(), _httpError(503)])
+            resolveConflict(conflict, ConflictDialog.LOCAL)
+            self.assertTrue(conflict.solved)
+            self.assertEqual(3, conflict.attempts)
+            conflict = _FailingConflict([ConnectionError()] * 3)
+            self.assertRaises(ConnectionError, resolveConflict, conflict, ConflictDialog.LOCAL, 2)
+            self.assertEqual(3, conflict.attempts)
+            self.assertFalse(conflict.solved)
+        finally:
+            conflicts.RETRY_DELAY = delay
+
+    def testResolveConflictDoesNotRetryClientErrors(self):
+        conflict = _FailingConflict([_httpError(404)])
+        self.assertRaises(HTTPError, resolveConflict, conflict, ConflictDialog.LOCAL)
+        self.assertEqual(1, conflict.attempts)
+        self.assertFalse(conflict.solved)
+
+    def testResolveConflicts(self):
+        delay = conflicts.RETRY_DELAY
+        conflicts.RETRY_DELAY = 0
+        try:
+            toResolve = [_FailingConflict([ConnectionError()], "points/%i" % i) for i in range(20)]
+            resolveConflicts(toResolve, {c.path: ConflictDialog.LOCAL for c in toResolve})
+            self.assertTrue(all(c.solved for c in toResolve))
+            failing = [_FailingConflict([_httpError(400)], "points/1")]
+            self.assertRaises(HTTPError, resolveConflicts, failing, {"points/1": ConflictDialog.LOCAL})
+        finally:
+            conflicts.RETRY_DELAY = delay
+
+    def testLocalChangeCounts(self):
+        repo = _createSimpleTestRepo()
+        filename = tempFilename("gpkg")
+        repo.checkoutlayer(filename, "points")
+        layer = loadLayerNoCrsDialog(filename, "points", "ogr")
+        self.assertFalse(hasLocalChanges(layer))
+        self.assertEqual(0, changeCounts(filename, "points").total())
+        idx = layer.dataProvider().fieldNameIndex("n")
+        features = list(layer.getFeatures())
+        with edit(layer):
+            layer.changeAttributeValue(features[0].id(), idx, 1000)
+            layer.changeAttributeValue(features[0].id(), idx, 1001)
+            layer.deleteFeatures([features[1].id()])
+        self.assertTrue(hasLocalChanges(layer))
+        self.assertEqual((0, 1, 1), tuple(changeCounts(filename, "points")))
+
+    def testRetryOnLock(self):
+        filename = tempFilename("gpkg")
+        con = dbconnection.connect(filename)
+        con.execute("CREATE TABLE test (n INTEGER);")
+        con.commit()
+        con.close()
+        locker = sqlite3.connect(filename, check_same_thread = False)
+        locker.isolation_level = None
+        locker.execute("BEGIN EXCLUSIVE;")
+        threading.Timer(dbconnection.BUSY_TIMEOUT + dbconnection.RETRY_DELAY / 2,
+                        lambda: locker.execute("COMMIT;")).start()
+        def _insert():
+            con = dbconnection.connect(filename)
+            try:
+                con.execute("INSERT INTO test VALUES (1);")
+                con.commit()
+            finally:
+                con.close()
+        retries = dbconnection.lockStatistics.retries
+        dbconnection.retryOnLock(_insert)
+        self.assertEqual(retries + 1, dbconnection.lockStatistics.retries)
+        locker.close()
+
+    def testTrackImportedGeopackage(self):
+        repo = _createEmptyTestRepo(True)
+        filename = tempFilename("gpkg")
+        shutil.copyfile(_layerPath("points"), filename)
+        layer = loadLayerNoCrsDialog(filename, "points", "ogr")
+        _, _, _, featureIds = repo.importgeopkg(layer, "master", "message", "me", "me@mysite.com", False)
+        self.assertTrue(trackImportedGeopackage(repo, filename, "points", repo.HEAD, featureIds))
+        self.assertEqual(repo.HEAD, getCommitId(layer))
+        checkoutFilename = tempFilename("gpkg")
+        repo.checkoutlayer(checkoutFilename, "points")
+        fids = []
+        for f in [filename, checkoutFilename]:
+            con = sqlite3.connect(f)
+            fids.append(sorted(con.execute("SELECT gpkg_fid, geogig_fid FROM points_fids;").fetchall()))
+            con.close()
+        self.assertEqual(fids[1], fids[0])
+
+    def testFidMapping(self):
+        repo = _createSimpleTestRepo()
+        filename = tempFilename("gpkg")
+        repo.checkoutlayer(filename, "points")
+        con = sqlite3.connect(filename)
+        fids = con.execute("SELECT gpkg_fid, geogig_fid FROM points_fids;").fetchall()
+        con.close()
+        mapping = fidMapping(filename, "points")
+        for gpkgfid, geogigfid in fids:
+            self.assertEqual(geogigfid, mapping.geogigFid(int(gpkgfid)))
+            self.assertEqual(int(gpkgfid), mapping.gpkgFid(geogigfid))
+        mapping.add([(1000, "newfeature")])
+        self.assertEqual("newfeature", mapping.geogigFid(1000))
+        con = sqlite3.connect(filename)
+        con.execute("INSERT INTO points_fids (gpkg_fid, geogig_fid) VALUES ('1001', 'otherfeature');")
+        con.commit()
+        con.close()
+        self.assertEqual(1001, mapping.gpkgFid("otherfeature"))
+
+    def testCopyDatabase(self):
+        filename = tempFilename("gpkg")
+        shutil.copy(_layerPath("lines"), filename)
+        layer = loadLayerNoCrsDialog(filename, "lines", "ogr")
+        self.assertTrue(layer.isValid())
+        copyDatabase(_layerPath("points"), filename)
+        src = sqlite3.connect(_layerPath("points"))
+        con = sqlite3.connect(filename)
+        self.assertEqual("ok", con.execute("PRAGMA integrity_check;").fetchone()[0])
+        self.assertEqual(["points"], [r[0] for r in con.execute("SELECT table_name FROM gpkg_contents;")])
+        self.assertEqual(src.execute("SELECT * FROM points;").fetchall(), con.execute("SELECT * FROM points;").fetchall())
+        src.close()
+        con.close()
+
+    def testAppendFeatures(self):
+        repo = _createSimpleTestRepo()
+        filename = tempFilename("gpkg")
+        repo.checkoutlayer(filename, "points")
+        filename2 = tempFilename("gpkg")
+        repo.checkoutlayer(filename2, "points")
+        con = sqlite3.connect(filename)
+        total = con.execute("SELECT COUNT(*) FROM points;").fetchone()[0]
+        con.execute("DELETE FROM points_fids WHERE CAST(gpkg_fid AS INTEGER) IN (SELECT fid FROM points LIMIT 2);")
+        con.execute("DELETE FROM points WHERE fid NOT IN (SELECT CAST(gpkg_fid AS INTEGER) FROM points_fids);")
+        con.execute("DELETE FROM points_audit;")
+        con.commit()
+        con.close()
+        self.assertEqual(2, appendFeatures(filename, filename2, "points"))
+        self.assertEqual(0, appendFeatures(filename, filename2, "points"))
+        con = sqlite3.connect(filename)
+        self.assertEqual(total, con.execute("SELECT COUNT(*) FROM points;").fetchone()[0])
+        self.assertEqual(total, con.execute("SELECT COUNT(DISTINCT geogig_fid) FROM points_fids;").fetchone()[0])
+        self.assertEqual(0, con.execute("SELECT COUNT(*) FROM points_audit;").fetchone()[0])
+        con.close()
+
+    def testTilesInExtent(self):
+        self.assertEqual([(-1, 40), (0, 40)], tilesInExtent(QgsRectangle(-0.5, 40.2, 0.5, 40.8)))
+        self.assertEqual([(2, 3)], tilesInExtent(QgsRectangle(2, 3, 2, 3)))
+
+    def testSyncTiledLayer(self):
+        repo = _createSimpleTestRepo()
+        filename = tempFilename("gpkg")
+        repo.checkoutlayer(filename, "points")
+        layer = loadLayerNoCrsDialog(filename, "points", "ogr")
+        point = next(layer.getFeatures()).geometry().asPoint()
+        tile = tilesInExtent(QgsRectangle(point.x(), point.y(), point.x(), point.y()))[0]
+        tiledFilename = tempFilename("gpkg")
+        checkoutTiles(repo, tiledFilename, "points", [tile], repo.HEAD)
+        con = sqlite3.connect(tiledFilename)
+        count = con.execute("SELECT COUNT(*) FROM points;").fetchone()[0]
+        con.close()
+        commitid = repo.revparse(repo.HEAD)
+        with edit(layer):
+            feat = QgsFeature()
+            feat.setGeometry(QgsGeometry.fromPoint(QgsPoint(point.x() + (-50 if point.x() > 0 else 50), point.y())))
+            feat.setAttributes([1000, 1000])
+            layer.addFeatures([feat])
+        repo.importgeopkg(layer, "master", "message", "me", "me@mysite.com", True)
+        updateGeopackage(repo, tiledFilename, "points", commitid, repo.HEAD)
+        con = sqlite3.connect(tiledFilename)
+        self.assertEqual(count, con.execute("SELECT COUNT(*) FROM points;").fetchone()[0])
+        self.assertEqual(count, con.execute("SELECT COUNT(*) FROM points_fids;").fetchone()[0])
+        self.assertEqual(0, con.execute("SELECT COUNT(*) FROM points_audit;").fetchone()[0])
+        con.close()
+        self.assertEqual(repo.revparse(repo.HEAD), getCommitId(tiledFilename + "|layername=points"))
+
+    def testSyncTiledLayerWithFeatureMovedIntoTile(self):
+        repo = _createSimpleTestRepo()
+        filename = tempFilename("gpkg")
+        repo.checkoutlayer(filename, "points")
+        layer = loadLayerNoCrsDialog(filename, "points", "ogr")
+        features = list(layer.getFeatures())
+        point = features[0].geometry().asPoint()
+        tile = tilesInExtent(QgsRectangle(point.x(), point.y(), point.x(), point.y()))[0]
+        outside = [f for f in features
+                   if tile not in tilesInExtent(f.geometry().boundingBox())]
+        tiledFilename = tempFilename("gpkg")
+        checkoutTiles(repo, tiledFilename, "points", [tile], repo.HEAD)
+        con = sqlite3.connect(tiledFilename)
+        count = con.execute("SELECT COUNT(*) FROM points;").fetchone()[0]
+        con.close()
+        commitid = repo.revparse(repo.HEAD)
+        with edit(layer):
+            layer.changeGeometry(outside[0].id(), QgsGeometry.fromPoint(QgsPoint(point.x(), point.y())))
+        repo.importgeopkg(layer, "master", "message", "me", "me@mysite.com", True)
+        updateGeopackage(repo, tiledFilename, "points", commitid, repo.HEAD)
+        con = sqlite3.connect(tiledFilename)
+        self.assertEqual(count + 1, con.execute("SELECT COUNT(*) FROM points;").fetchone()[0])
+        self.assertEqual(count + 1, con.execute("SELECT COUNT(*) FROM points_fids;").fetchone()[0])
+        self.assertEqual(0, con.execute("SELECT COUNT(*) FROM points_audit;").fetchone()[0])
+        con.close()
+
+    def testCheckoutProfile(self):
+        repo = _createSimpleTestRepo()
+        filename = tempFilename("gpkg")
+        repo.checkoutlayer(filename, "points")
+        con = sqlite3.connect(filename)
+        geomColumn = con.execute("SELECT column_name FROM gpkg_geometry_columns;").fetchone()[0]
+        columns = [v[1] for v in con.execute("PRAGMA table_info(points);") if v[1] not in ["fid", geomColumn]]
+        total = con.execute("SELECT COUNT(*) FROM points;").fetchone()[0]
+        con.close()
+        self.assertRaises(ValueError, applyProfile, filename, "points", CheckoutProfile(["wrongcolumn"]))
+        self.assertRaises(ValueError, applyProfile, filename, "points", CheckoutProfile(None, "wrongcolumn = 1"))
+        profile = CheckoutProfile(columns[:1], "fid % 2 = 1")
+        applyProfile(filename, "points", profile)
+        con = sqlite3.connect(filename)
+        self.assertEqual((total + 1) // 2, con.execute("SELECT COUNT(*) FROM points;").fetchone()[0])
+        self.assertEqual((total + 1) // 2, con.execute("SELECT COUNT(*) FROM points_fids;").fetchone()[0])
+        self.assertEqual(0, con.execute("SELECT COUNT(*) FROM points_audit;").fetchone()[0])
+        for column in columns[1:]:
+            self.assertEqual(0, con.execute('SELECT COUNT("%s") FROM points;' % column).fetchone()[0])
+        con.close()
+
+    def testSyncProfiledLayerKeepsHiddenColumns(self):
+        repo = _createEmptyTestRepo()
+        layerFilename = tempFilename("gpkg")
+        shutil.copy(_layerPath("first"), layerFilename)
+        con = sqlite3.connect(layerFilename)
+        con.execute("ALTER TABLE points ADD COLUMN name TEXT;")
+        con.execute("UPDATE points SET name = 'name' || fid;")
+        con.commit()
+        con.close()
+        repo.importgeopkg(layerFilename, "master", "points", "tester", "test@test.test", False)
+        filename = tempFilename("gpkg")
+        repo.checkoutlayer(filename, "points")
+        profile = CheckoutProfile(["n"])
+        applyProfile(filename, "points", profile, compact = True)
+        source = "%s|layername=points" % filename
+        layertracking.addTrackedLayer(source, repo.url, profile)
+        try:
+            layer = loadLayerNoCrsDialog(filename, "points", "ogr")
+            features = list(layer.getFeatures())
+            idx = layer.dataProvider().fieldNameIndex("n")
+            with edit(layer):
+                layer.changeAttributeValue(features[0].id(), idx, 1000)
+            con = sqlite3.connect(filename)
+            geogigfid = con.execute("SELECT geogig_fid FROM points_fids WHERE CAST(gpkg_fid AS INTEGER) = ?;",
+                                    (features[0].id(),)).fetchone()[0]
+            con.close()
+            path = "points/" + geogigfid
+            name = repo.feature(path, repo.HEAD)["name"]
+            self.assertIsNotNone(name)
+            repo.importgeopkg(layer, "master", "message", "me", "me@mysite.com", True)
+            feature = repo.feature(path, repo.HEAD)
+            self.assertEqual(1000, feature["n"])
+            self.assertEqual(name, feature["name"])
+        finally:
+            layertracking.removeTrackedLayer(source)
+
 
 
 def pluginSuite():
@@ -8,21 +8,31 @@ import os
 import uuid
 import unittest
 import time
+import threading
 
 
 from qgis.core import QgsFeatureRequest, edit, QgsGeometry, QgsPoint
+from qgis.PyQt.QtCore import QCoreApplication
 
 from geogig.gui.dialogs.conflictdialog import ConflictDialog
 
 from geogig.geogigwebapi.repository import (Repository,
                                             createRepoAtUrl,
                                             repositoriesFromUrl,
+                                            diffCache,
+                                            layerCache,
+                                            featureCache,
                                             GeoGigException,
                                             CannotPushException,
                                             NothingToPushException
                                            )
 
 from geogig.tools.gpkgsync import getCommitId
+from geogig.tools.filecache import cacheKey
+from geogig.geogigwebapi.commit import Commit
+from geogig.geogigwebapi.commitstore import commitStore
+from geogig.geogigwebapi.commitgraph import removeCommitGraph
+from geogig.geogigwebapi.tasks import isMainThread
 
 from geogig.tests import (_layer, _createSimpleTestRepo, _createEmptyTestRepo,
                         _createMultilayerTestRepo, _createWithMergeTestRepo)
@@ -76,11 +86,81 @@ class WebApiTests(unittest.TestCase):
         self.assertEqual("third", log[0].message)
         self.assertEqual("second", log[1].message)
 
+    def testIterLog(self):
+        repo = _createSimpleTestRepo()
+        commits = repo.iterlog(prefetch = 1)
+        self.assertEqual([c.commitid for c in repo.log()], [c.commitid for c in commits])
+
+    def testLogWithLimitMakesSingleCall(self):
+        repo = _createSimpleTestRepo()
+        calls = []
+        apicall = repo._apicall
+        def _countingApicall(command, *args, **kwargs):
+            calls.append(command)
+            return apicall(command, *args, **kwargs)
+        repo._apicall = _countingApicall
+        log = repo.log(limit = 1)
+        self.assertEqual(1, len(log))
+        self.assertEqual(["log"], calls)
+
+    def testLogReadsKnownCommitsFromStore(self):
+        repo = _createSimpleTestRepo()
+        log = repo.log()
+        path = repo.diff(log[1].commitid, log[0].commitid)[0].path
+        pathLog = repo.log(path = path)
+        calls = []
+        apicall = repo._apicall
+        def _countingApicall(command, *args, **kwargs):
+            calls.append(command)
+            return apicall(command, *args, **kwargs)
+        repo._apicall = _countingApicall
+        self.assertEqual([c.commitid for c in log], [c.commitid for c in repo.log()])
+        self.assertEqual([c.commitid for c in pathLog], [c.commitid for c in repo.log(path = path)])
+        self.assertNotIn("log", calls)
+
+    def testLogFillsCommitStore(self):
+        repo = _createSimpleTestRepo()
+        log = repo.log()
+        for commit in log:
+            self.assertIsNotNone(commitStore().commitData(repo.url, commit.commitid))
+        commit = Commit.fromref(repo, log[0].commitid)
+        self.assertEqual(log[0].message, commit.message)
+        self.assertEqual(log[0].committerdate, commit.committerdate)
+        self.assertEqual(log[1].commitid, commit.parent.commitid)
+
     def testLogMultipleParents(self):
         repo = _createWithMergeTestRepo("withmerge")
         log = repo.log()
         self.assertEqual(2, len(log[0].parents))
 
+    def testAncestry(self):
+        repo = _createWithMergeTestRepo("withmerge")
+        log = repo.log()
+        merge = log[0]
+        parent, parent2 = merge._parents
+        self.assertTrue(repo.isancestor(parent, merge.commitid))
+        self.assertTrue(repo.isancestor(parent2, merge.commitid))
+        self.assertFalse(repo.isancestor(merge.commitid, parent))
+        self.assertTrue(repo.isancestor(log[-1].commitid, "master"))
+        mergebase = repo.mergebase(parent, parent2)
+        self.assertTrue(repo.isancestor(mergebase, parent))
+        self.assertTrue(repo.isancestor(mergebase, parent2))
+        self.assertEqual((0, 2), repo.aheadbehind(parent, merge.commitid))
+        ordered = repo.topologicalorder(log[::-1])
+        self.assertEqual(merge.commitid, ordered[0].commitid)
+        self.assertEqual(log[-1].commitid, ordered[-1].commitid)
+
+    def testLoadHistory(self):
+        repo = _createSimpleTestRepo()
+        commitStore().removeRepo(repo.url)
+        removeCommitGraph(repo.url)
+        self.assertFalse(repo.hascompletehistory(repo.HEAD))
+        repo._graphids(repo.HEAD)
+        self.assertTrue(repo.hascompletehistory(repo.HEAD, repo.log()[-1].commitid))
+        loaded = []
+        repo.loadhistory([repo.HEAD], lambda: loaded.append(True))
+        self.assertEqual([True], loaded)
+
     def testBlame(self):
         repo = _createSimpleTestRepo()
         #blame = repo.blame("points/fid--678854f5_155b574742f_-8000")
@@ -93,6 +173,18 @@ class WebApiTests(unittest.TestCase):
         layer = loadLayerNoCrsDialog(filename, "points", "ogr")
         self.assertTrue(layer.isValid())
 
+    def testDownloadUsesCache(self):
+        repo = _createSimpleTestRepo()
+        filename = tempFilename("gpkg")
+        repo.checkoutlayer(filename, "points", ref = repo.HEAD)
+        hits = layerCache().hits
+        filename2 = tempFilename("gpkg")
+        repo.checkoutlayer(filename2, "points", ref = repo.HEAD)
+        self.assertEqual(hits + 1, layerCache().hits)
+        layer = loadLayerNoCrsDialog(filename2, "points", "ogr")
+        self.assertTrue(layer.isValid())
+        self.assertEqual(getCommitId(layer), repo.revparse(repo.HEAD))
+
     def testDownloadNonHead(self):
         repo = _createSimpleTestRepo()
         log = repo.log()
@@ -113,6 +205,36 @@ class WebApiTests(unittest.TestCase):
         feature = repo.feature(path, repo.HEAD)
         self.assertEqual(expected, feature)
 
+    def testFeatureUsesCache(self):
+        repo = _createSimpleTestRepo()
+        diff = repo.diff(repo.log()[2].commitid, repo.log()[1].commitid)
+        path = diff[0].path
+        feature = repo.feature(path, repo.HEAD)
+        feature["n"] = None
+        hits = featureCache().hits
+        self.assertEqual({u'geometry': u'POINT (5 5)', u'n': 2}, repo.feature(path, repo.HEAD))
+        self.assertEqual(hits + 1, featureCache().hits)
+
+    def testFeatures(self):
+        repo = _createSimpleTestRepo()
+        diff = repo.diff(repo.log()[2].commitid, repo.log()[1].commitid)
+        paths = [d.path for d in diff]
+        features = repo.features(paths, repo.HEAD)
+        for path in paths:
+            self.assertEqual(repo.feature(path, repo.HEAD), features[path])
+
+    def testFeaturesFromExport(self):
+        repo = _createSimpleTestRepo()
+        diff = repo.diff(repo.log()[2].commitid, repo.log()[1].commitid)
+        paths = [d.path for d in diff]
+        commitid = repo.revparse(repo.HEAD)
+        expected = {path: repo.feature(path, commitid) for path in paths}
+        featureCache().clear()
+        features = repo._featuresfromexport("points", paths, commitid)
+        self.assertEqual(expected, features)
+        for path in paths:
+            self.assertEqual(expected[path], featureCache().get(cacheKey(repo.url, "feature", commitid, path)))
+
     def testTrees(self):
         repo = _createMultilayerTestRepo()
         self.assertEquals(["points", "lines"], repo.trees())
@@ -175,6 +297,13 @@ class WebApiTests(unittest.TestCase):
         diff = {d.path for d in repo.diff(log[0].commitid, log[1].commitid)}
         self.assertEqual(1, len(diff))
 
+    def testIterDiff(self):
+        repo = _createSimpleTestRepo()
+        log = repo.log()
+        diff = repo.diff(log[-1].commitid, log[0].commitid)
+        paths = [d.path for d in repo.iterdiff(log[-1].commitid, log[0].commitid, prefetch = 1)]
+        self.assertEqual([d.path for d in diff], paths)
+
     def _compareLists(self, s, t):
         t = list(t)
         try:
@@ -204,6 +333,46 @@ class WebApiTests(unittest.TestCase):
         self.assertTrue(os.path.exists(filename))
         #Check exported gpkg is correct
 
+    def testExportDiffWithCallback(self):
+        repo = _createSimpleTestRepo()
+        filename = tempFilename("gpkg")
+        finished = []
+        downloadThreads = []
+        started = threading.Event()
+        release = threading.Event()
+        download = repo._downloadfile
+        def _blockedDownload(taskid, filename):
+            downloadThreads.append(isMainThread())
+            started.set()
+            release.wait(30)
+            download(taskid, filename)
+        repo._downloadfile = _blockedDownload
+        future = repo.exportdiff("HEAD", "HEAD~1", filename, callback = finished.append)
+        # the main thread keeps running while the diff is downloaded
+        timeout = time.time() + 30
+        while not started.is_set() and time.time() < timeout:
+            QCoreApplication.processEvents()
+            time.sleep(0.01)
+        self.assertTrue(started.is_set())
+        self.assertFalse(future.done())
+        self.assertEqual([], finished)
+        release.set()
+        self.assertEqual(filename, future.result())
+        self.assertEqual([future], finished)
+        self.assertEqual([False], downloadThreads)
+        self.assertTrue(os.path.exists(filename))
+
+    def testExportDiffUsesCache(self):
+        repo = _createSimpleTestRepo()
+        filename = tempFilename("gpkg")
+        repo.exportdiff("HEAD~1", "HEAD", filename, "points")
+        hits = diffCache().hits
+        filename2 = tempFilename("gpkg")
+        repo.exportdiff("HEAD~1", "HEAD", filename2, "points")
+        self.assertEqual(hits + 1, diffCache().hits)
+        with open(filename, "rb") as f, open(filename2, "rb") as f2:
+            self.assertEqual(f.read(), f2.read())
+
     def testRevParse(self):
         repo = _createSimpleTestRepo()
         head = repo.log()[0].commitid
@@ -233,6 +402,24 @@ class WebApiTests(unittest.TestCase):
         repo.deletebranch("mybranch")
         self.assertEquals(["master"], repo.branches())
 
+    def testTagsFillRefCache(self):
+        repo = _createSimpleTestRepo(True)
+        tags = repo.tags()
+        calls = []
+        apicall = repo._apicall
+        def _countingApicall(command, *args, **kwargs):
+            calls.append(command)
+            return apicall(command, *args, **kwargs)
+        repo._apicall = _countingApicall
+        self.assertEqual(tags["mytag"], repo.revparse("mytag"))
+        self.assertNotIn("refparse", calls)
+
+    def testRevparseAfterRemovingTree(self):
+        repo = _createSimpleTestRepo(True)
+        head = repo.revparse("master")
+        repo.removetree("points", "me", "me@mysite.com")
+        self.assertNotEqual(head, repo.revparse("master"))
+
     def testFirstImport(self):
         repo = _createEmptyTestRepo(True)
         layer = _layer("points")
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    conflicts.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import re
+import time
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+from requests.exceptions import HTTPError, ConnectionError, Timeout
+
+from qgis.core import QgsGeometry
+
+from geogig.gui.dialogs.conflictdialog import ConflictDialog
+from geogig.tools.jobs import reportProgress
+
+# Maximum number of conflict resolutions sent to the server at the same time
+MAX_CONCURRENT_RESOLUTIONS = 8
+# Number of times a resolution is retried after a transient error, and
+# seconds to wait before the first retry, doubled for each new one
+RESOLUTION_RETRIES = 3
+RETRY_DELAY = 0.5
+
+WKT_MATCHER = re.compile(r"^\s*(MULTI)?(POINT|LINESTRING|POLYGON)|^\s*GEOMETRYCOLLECTION", re.IGNORECASE)
+
+
+def _comparable(value):
+    '''
+    Returns a version of an attribute value that can be compared with
+    other versions. Geometries are compared with a fixed precision, since
+    local and server versions are written with different precisions
+    '''
+    try:
+        if WKT_MATCHER.match(value):
+            geom = QgsGeometry.fromWkt(value)
+            if geom is not None:
+                return geom.exportToWkt(7)
+    except TypeError:
+        pass
+    return value
+
+
+def mergeFeatures(origin, local, remote):
+    '''
+    Merges attribute by attribute the local and remote versions of a
+    feature, given their common origin. An attribute changed in only one
+    of the versions takes the changed value. Returns the merged feature
+    and the list of attributes changed in both versions with different values
+    '''
+    merged = {}
+    conflicted = []
+    names = set(origin.keys()) | set(local.keys()) | set(remote.keys())
+    for name in names:
+        o, l, r = [_comparable(f.get(name, None)) for f in (origin, local, remote)]
+        if l == r or o == r:
+            merged[name] = local.get(name, None)
+        elif o == l:
+            merged[name] = remote.get(name, None)
+        else:
+            conflicted.append(name)
+    return merged, conflicted
+
+
+def _sameFeature(feature, feature2):
+    return ({k: _comparable(v) for k, v in feature.items()}
+            == {k: _comparable(v) for k, v in feature2.items()})
+
+
+def fetchConflictVersions(conflicts):
+    '''
+    Fetches the origin, remote and local versions of the features in the
+    passed conflicts, with one features call per commit, and stores them
+    in the originFeature, remoteFeature and localFeature attributes of
+    each conflict. Versions of deleted features are left as None
+    '''
+    requested = defaultdict(list)
+    repos = {}
+    for conflict in conflicts:
+        repos[conflict.repo.url] = conflict.repo
+        versions = [("originFeature", conflict.originCommit), ("remoteFeature", conflict.remoteCommit)]
+        if conflict.localFeature is None:
+            versions.append(("localFeature", conflict.localCommit))
+        for attr, commit in versions:
+            if getattr(conflict, attr) is None:
+                requested[(conflict.repo.url, commit)].append((conflict, attr))
+    for (url, commit), versions in requested.items():
+        features = repos[url].features([c.path for c, attr in versions], commit)
+        for conflict, attr in versions:
+            if conflict.path in features:
+                setattr(conflict, attr, features[conflict.path])
+
+
+def autoMerge(conflicts):
+    '''
+    Solves the conflicts where each attribute has been changed in only
+    one of the versions, or in both of them with the same value.
+    Returns a dict with the resolutions of the solved conflicts, keyed by
+    path, as the resolvedConflicts dict of ConflictDialog, and the list
+    of conflicts that have to be solved by the user
+    '''
+    try:
+        fetchConflictVersions(conflicts)
+    except:
+        # leave all of them to the user, who can still solve them fetching features one by one
+        return {}, list(conflicts)
+    resolutions = {}
+    remaining = []
+    for conflict in conflicts:
+        versions = (conflict.originFeature, conflict.localFeature, conflict.remoteFeature)
+        if None in versions:
+            # modified in one version and deleted in the other one
+            remaining.append(conflict)
+            continue
+        merged, conflicted = mergeFeatures(*versions)
+        if conflicted:
+            remaining.append(conflict)
+        elif _sameFeature(merged, conflict.localFeature):
+            resolutions[conflict.path] = ConflictDialog.LOCAL
+        elif _sameFeature(merged, conflict.remoteFeature):
+            resolutions[conflict.path] = ConflictDialog.REMOTE
+        else:
+            resolutions[conflict.path] = merged
+    return resolutions, remaining
+
+
+def _isTransient(e):
+    if isinstance(e, (ConnectionError, Timeout)):
+        return True
+    if isinstance(e, HTTPError) and e.response is not None:
+        return e.response.status_code >= 500
+    return False
+
+
+def resolveConflict(conflict, resolution, retries = RESOLUTION_RETRIES):
+    '''Sends the resolution of a conflict, retrying it if the server fails with a transient error'''
+    delay = RETRY_DELAY
+    for attempt in range(retries + 1):
+        try:
+            _resolveConflict(conflict, resolution)
+            return
+        except Exception as e:
+            if attempt == retries or not _isTransient(e):
+                raise
+        time.sleep(delay)
+        delay *= 2
+
+
+def _resolveConflict(conflict, resolution):
+    if resolution == ConflictDialog.LOCAL:
+        conflict.resolveWithLocalVersion()
+    elif resolution == ConflictDialog.REMOTE:
+        conflict.resolveWithRemoteVersion()
+    elif resolution == ConflictDialog.DELETE:
+        conflict.resolveDeletingFeature()
+    else:
+        conflict.resolveWithNewFeature(resolution)
+
+
+def resolveConflicts(conflicts, resolutions):
+    '''
+    Sends the resolutions of the passed conflicts to the server, within
+    the transaction of the conflicts. resolutions is a dict keyed by
+    conflict path, as the resolvedConflicts dict of ConflictDialog.
+    Resolutions are independent of each other, so they are sent
+    concurrently over the pooled connections to the server. Progress is
+    reported to the job running this function, or to the status bar
+    '''
+    toResolve = [(c, resolutions[c.path]) for c in conflicts if c.path in resolutions]
+    if not toResolve:
+        return
+    pool = ThreadPool(min(len(toResolve), MAX_CONCURRENT_RESOLUTIONS))
+    try:
+        for i, _ in enumerate(pool.imap_unordered(lambda r: resolveConflict(*r), toResolve)):
+            reportProgress("Solving conflicts (%i of %i)" % (i + 1, len(toResolve)),
+                           int(100 * (i + 1) / len(toResolve)))
+        pool.close()
+        reportProgress("")
+    except:
+        # do not send the remaining ones if one of them fails or the job is cancelled
+        pool.terminate()
+        raise
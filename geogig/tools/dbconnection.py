@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    dbconnection.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+# Connections to the geopackages of tracked layers, which QGIS may have
+# open and locked while the plugin uses them
+
+import time
+import sqlite3
+import threading
+
+from geogig.config import USE_WAL
+
+from qgiscommons2.settings import pluginSetting
+
+# Time a connection waits for a lock held by another connection, such as
+# the one QGIS uses to save the edits of a layer, before failing
+BUSY_TIMEOUT = 5
+# Page cache of each connection, in KB
+CACHE_SIZE = 20000
+
+# Retries for operations that fail because the geopackage is locked. The
+# delay is doubled after each retry
+LOCK_RETRIES = 3
+RETRY_DELAY = 0.5
+
+
+def useWal():
+    '''Returns True if geopackages should use write-ahead logging, as set in the plugin settings'''
+    try:
+        return bool(pluginSetting(USE_WAL))
+    except:
+        return False
+
+
+def connect(filename):
+    '''
+    Opens a connection to a geopackage. The connection waits for locks
+    held by other connections instead of failing at once. If enabled in
+    the settings, the geopackage is switched to write-ahead logging, so
+    reading it does not block QGIS while it saves edits
+    '''
+    con = sqlite3.connect(filename, timeout = BUSY_TIMEOUT)
+    con.execute("PRAGMA busy_timeout = %i;" % (BUSY_TIMEOUT * 1000))
+    con.execute("PRAGMA cache_size = -%i;" % CACHE_SIZE)
+    if useWal():
+        try:
+            mode = con.execute("PRAGMA journal_mode = WAL;").fetchone()[0]
+        except sqlite3.OperationalError:
+            mode = None # locked. It will be switched next time
+        if mode == "wal":
+            # safe with write-ahead logging, and much faster than FULL
+            con.execute("PRAGMA synchronous = NORMAL;")
+    return con
+
+
+class LockStatistics(object):
+
+    def __init__(self):
+        self.retries = 0
+        self.failures = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+lockStatistics = LockStatistics()
+
+
+def isLockError(e):
+    if not isinstance(e, sqlite3.OperationalError):
+        return False
+    message = str(e).lower()
+    return "locked" in message or "busy" in message
+
+
+def retryOnLock(func, *args, **kwargs):
+    '''
+    Calls the passed function, calling it again if it fails because a
+    geopackage is locked. The function must leave the geopackage
+    unmodified when it fails, such as by doing its work in a transaction
+    '''
+    delay = RETRY_DELAY
+    for i in range(LOCK_RETRIES + 1):
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not isLockError(e):
+                raise
+            if i == LOCK_RETRIES:
+                lockStatistics.add("failures")
+                raise
+            lockStatistics.add("retries")
+            time.sleep(delay)
+            delay *= 2
+
+
+def recordLockFallback():
+    '''Records that an operation fell back to a slower method because a geopackage was locked'''
+    lockStatistics.add("fallbacks")
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    featurecache.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Number of puts between checks of the size of the disk store
+EVICTION_CHECK_INTERVAL = 500
+
+
+class FeatureCache(object):
+    '''
+    A cache of feature versions and feature diffs, which never change for
+    a given path and commit ids. Recently used entries are kept in memory,
+    up to maxEntries, and all of them in an SQLite database limited to
+    maxSize bytes, where the oldest entries are removed first.
+
+    Values must be serializable as JSON. Callers get their own copy of
+    the cached values, so they can modify them freely
+    '''
+
+    def __init__(self, filename, maxEntries, maxSize):
+        self.filename = filename
+        self.maxEntries = maxEntries
+        self.maxSize = maxSize
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._initialized = False
+        self._puts = 0
+
+    def _connection(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.filename, timeout = 30)
+            self._local.con = con
+        with self._lock:
+            if not self._initialized:
+                con.execute('''CREATE TABLE IF NOT EXISTS features (
+                                    key TEXT PRIMARY KEY,
+                                    value TEXT,
+                                    created REAL)''')
+                con.execute("CREATE INDEX IF NOT EXISTS features_created ON features (created)")
+                con.commit()
+                self._initialized = True
+        return con
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory.pop(key, None)
+            self._memory[key] = value
+            while len(self._memory) > self.maxEntries:
+                self._memory.popitem(last = False)
+
+    def get(self, key):
+        '''Returns the cached value for the passed key, or None if it is not in the cache'''
+        with self._lock:
+            value = self._memory.pop(key, None)
+            if value is not None:
+                self._memory[key] = value
+                self.hits += 1
+                return json.loads(value)
+        try:
+            row = self._connection().execute("SELECT value FROM features WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.diskHits += 1
+        self._remember(key, row[0])
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        value = json.dumps(value)
+        self._remember(key, value)
+        try:
+            con = self._connection()
+            with con:
+                con.execute("INSERT OR REPLACE INTO features VALUES (?, ?, ?)", (key, value, time.time()))
+        except sqlite3.Error:
+            return
+        with self._lock:
+            self._puts += 1
+            check = self._puts % EVICTION_CHECK_INTERVAL == 0
+        if check:
+            self.evict()
+
+    def diskSize(self):
+        con = self._connection()
+        pages = con.execute("PRAGMA page_count").fetchone()[0] - con.execute("PRAGMA freelist_count").fetchone()[0]
+        return pages * con.execute("PRAGMA page_size").fetchone()[0]
+
+    def evict(self):
+        '''Removes the oldest entries from the disk store until it fits in its maximum size'''
+        try:
+            con = self._connection()
+            size = self.diskSize()
+            if size <= self.maxSize:
+                return
+            count = con.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+            # entries are roughly the same size, so remove the excess plus some margin at once
+            toRemove = int(count * (1 - 0.9 * self.maxSize / float(size))) + 1
+            with con:
+                con.execute('''DELETE FROM features WHERE key IN
+                                    (SELECT key FROM features ORDER BY created LIMIT ?)''', (toRemove,))
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        try:
+            con = self._connection()
+            with con:
+                con.execute("DELETE FROM features")
+        except sqlite3.Error:
+            pass
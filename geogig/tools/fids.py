@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    fids.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+# Mapping between the fids of the features in a geopackage layer and their
+# GeoGig ids, as stored in the <layer>_fids table of the geopackage
+
+import os
+import sqlite3
+import threading
+
+from geogig.tools.interchange import geopackageVersion
+from geogig.tools.dbconnection import connect
+
+
+def _gpkgFid(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class FidMapping(object):
+    '''
+    The mapping between geopackage and GeoGig fids of a layer. The whole
+    <layer>_fids table is read at once the first time it is needed, and
+    read again if the geopackage has been modified since then. Both
+    columns of the table are indexed, for the queries that join it
+    '''
+
+    def __init__(self, filename, layername):
+        self.filename = filename
+        self.layername = layername
+        self._toGeogig = None
+        self._toGpkg = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _createIndexes(self, cursor):
+        for column in ["gpkg_fid", "geogig_fid"]:
+            try:
+                cursor.execute('CREATE INDEX IF NOT EXISTS "{layer}_fids_{column}" ON "{layer}_fids" ({column});'
+                               .format(layer = self.layername, column = column))
+            except sqlite3.Error:
+                pass # read-only or locked geopackage. Lookups are done in memory anyway
+
+    def _load(self):
+        if self._toGeogig is not None and self._version == geopackageVersion(self.filename):
+            return
+        con = connect(self.filename)
+        try:
+            cursor = con.cursor()
+            self._createIndexes(cursor)
+            con.commit()
+            self._version = geopackageVersion(self.filename)
+            rows = cursor.execute('SELECT gpkg_fid, geogig_fid FROM "%s_fids";' % self.layername).fetchall()
+        finally:
+            con.close()
+        self._toGeogig = {_gpkgFid(gpkgfid): geogigfid for gpkgfid, geogigfid in rows}
+        self._toGpkg = {geogigfid: gpkgfid for gpkgfid, geogigfid in self._toGeogig.items()}
+
+    def geogigFid(self, gpkgfid):
+        '''Returns the GeoGig id of the feature with the passed geopackage fid, or None if it has none'''
+        with self._lock:
+            self._load()
+            return self._toGeogig.get(_gpkgFid(gpkgfid))
+
+    def gpkgFid(self, geogigfid):
+        '''Returns the geopackage fid of the feature with the passed GeoGig id, or None if it is not in the layer'''
+        with self._lock:
+            self._load()
+            return self._toGpkg.get(geogigfid)
+
+    def gpkgFids(self, geogigfids):
+        '''Returns a dict with the geopackage fids of the passed GeoGig ids that are in the layer'''
+        with self._lock:
+            self._load()
+            return {fid: self._toGpkg[fid] for fid in geogigfids if fid in self._toGpkg}
+
+    def add(self, featureIds):
+        '''Adds (gpkg fid, GeoGig id) pairs to the mapping, such as those of features just imported'''
+        featureIds = [(str(gpkgfid), str(geogigfid)) for gpkgfid, geogigfid in featureIds]
+        if not featureIds:
+            return
+        with self._lock:
+            con = connect(self.filename)
+            try:
+                con.executemany('INSERT INTO "%s_fids" (gpkg_fid, geogig_fid) VALUES (?, ?);' % self.layername,
+                                featureIds)
+                con.commit()
+            finally:
+                con.close()
+            if self._toGeogig is not None:
+                for gpkgfid, geogigfid in featureIds:
+                    self._toGeogig[_gpkgFid(gpkgfid)] = geogigfid
+                    self._toGpkg[geogigfid] = _gpkgFid(gpkgfid)
+                self._version = geopackageVersion(self.filename)
+
+
+_mappings = {}
+_mappingsLock = threading.Lock()
+
+def fidMapping(filename, layername):
+    '''Returns the fid mapping of a layer, shared by all the code that uses it'''
+    key = (os.path.normcase(os.path.abspath(filename)), layername)
+    with _mappingsLock:
+        if key not in _mappings:
+            _mappings[key] = FidMapping(filename, layername)
+        return _mappings[key]
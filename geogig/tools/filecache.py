@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    filecache.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import os
+import uuid
+import shutil
+import hashlib
+import threading
+
+
+def cacheKey(*parts):
+    '''Returns a content address for the passed parts, to be used as a cache key'''
+    h = hashlib.sha1()
+    for part in parts:
+        h.update((u"%s\0" % (part or "")).encode("utf-8"))
+    return h.hexdigest()
+
+
+class FileCache(object):
+    '''
+    A folder of files addressed by key, limited to a maximum total size.
+    When the limit is exceeded, the least recently used files are removed.
+    The modification time of each file is used to record when it was
+    last used, so the usage order survives between QGIS sessions
+    '''
+
+    def __init__(self, folder, maxSize, extension = ""):
+        self.folder = folder
+        self.maxSize = maxSize
+        self.extension = extension
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(folder)
+        except os.error:
+            pass
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + self.extension)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def path(self, key):
+        '''
+        Returns the path to the cached file for the passed key, or None
+        if it is not in the cache. The file must not be modified
+        '''
+        path = self._path(key)
+        with self._lock:
+            try:
+                os.utime(path, None)
+            except OSError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return path
+
+    def get(self, key, filename):
+        '''
+        Copies the cached file for the passed key to the passed filename.
+        Returns False if it is not in the cache
+        '''
+        path = self.path(key)
+        if path is None:
+            return False
+        try:
+            shutil.copyfile(path, filename)
+        except IOError:
+            return False # evicted in the meantime
+        return True
+
+    def put(self, key, filename):
+        '''Adds a copy of the passed file to the cache'''
+        path = self._path(key)
+        tmpPath = os.path.join(self.folder, "%s.tmp" % uuid.uuid4().hex)
+        try:
+            shutil.copyfile(filename, tmpPath)
+            with self._lock:
+                if os.path.exists(path):
+                    os.remove(path)
+                os.rename(tmpPath, path)
+        except (IOError, OSError):
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            return
+        self.evict()
+
+    def remove(self, key):
+        with self._lock:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for f in self._entries():
+                os.remove(f[2])
+
+    def size(self):
+        return sum(f[1] for f in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        '''Removes the least recently used files until the cache fits in its maximum size'''
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(e[1] for e in entries)
+            for mtime, size, path in entries:
+                if total <= self.maxSize:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
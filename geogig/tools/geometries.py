@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    geometries.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+# Conversion of geopackage geometry blobs to WKT, written the same way the
+# GeoGig server writes geometries in its responses. It does not use QGIS
+# geometries, so it can be used from any thread
+
+import struct
+
+GEOMETRY_TYPES = {1: "POINT", 2: "LINESTRING", 3: "POLYGON", 4: "MULTIPOINT",
+                  5: "MULTILINESTRING", 6: "MULTIPOLYGON", 7: "GEOMETRYCOLLECTION"}
+
+# Size of the envelope in the header of a geopackage geometry blob, for each
+# value of the envelope indicator
+ENVELOPE_SIZES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+
+
+def gpkgWkb(blob):
+    '''Returns the WKB geometry in a geopackage geometry blob, after its header'''
+    blob = bytes(blob)
+    flags = bytearray(blob[3:4])[0]
+    return blob[8 + ENVELOPE_SIZES[(flags >> 1) & 7]:]
+
+
+def _formatNumber(v):
+    if v == int(v) and abs(v) < 1e16:
+        return str(int(v))
+    s = repr(v)
+    if "e" in s:
+        s = ("%.16f" % v).rstrip("0").rstrip(".")
+    return s
+
+
+class _WkbReader(object):
+
+    def __init__(self, wkb):
+        self.wkb = wkb
+        self.pos = 0
+
+    def _unpack(self, fmt, size):
+        values = struct.unpack(self.endian + fmt, self.wkb[self.pos:self.pos + size])
+        self.pos += size
+        return values
+
+    def _coords(self, n):
+        coords = []
+        for i in range(n):
+            values = self._unpack("%id" % self.dims, 8 * self.dims)
+            coords.append("%s %s" % (_formatNumber(values[0]), _formatNumber(values[1])))
+        return ", ".join(coords)
+
+    def _ring(self):
+        n = self._unpack("I", 4)[0]
+        return "(%s)" % self._coords(n)
+
+    def read(self):
+        '''Reads a geometry and returns its name and its text without the name'''
+        self.endian = "<" if bytearray(self.wkb[self.pos:self.pos + 1])[0] else ">"
+        self.pos += 1
+        wkbType = self._unpack("I", 4)[0]
+        # ISO and extended WKB flag the Z and M dimensions differently
+        hasZ = wkbType & 0x80000000 or (wkbType & 0xffff) // 1000 in [1, 3]
+        hasM = wkbType & 0x40000000 or (wkbType & 0xffff) // 1000 in [2, 3]
+        self.dims = 2 + (1 if hasZ else 0) + (1 if hasM else 0)
+        name = GEOMETRY_TYPES[(wkbType & 0xffff) % 1000]
+        if name == "POINT":
+            values = self._unpack("%id" % self.dims, 8 * self.dims)
+            if values[0] != values[0]: # NaN coordinates for an empty point
+                return name, "EMPTY"
+            return name, "(%s %s)" % (_formatNumber(values[0]), _formatNumber(values[1]))
+        n = self._unpack("I", 4)[0]
+        if n == 0:
+            return name, "EMPTY"
+        if name == "LINESTRING":
+            return name, "(%s)" % self._coords(n)
+        if name == "POLYGON":
+            return name, "(%s)" % ", ".join([self._ring() for i in range(n)])
+        parts = [self.read() for i in range(n)]
+        if name == "GEOMETRYCOLLECTION":
+            return name, "(%s)" % ", ".join(["%s %s" % part for part in parts])
+        return name, "(%s)" % ", ".join([part[1] for part in parts])
+
+
+def gpkgToWkt(blob):
+    '''Returns the WKT of a geopackage geometry blob, or None if there is no geometry'''
+    if blob is None:
+        return None
+    return "%s %s" % _WkbReader(gpkgWkb(blob)).read()
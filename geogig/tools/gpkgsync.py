@@ -46,12 +46,22 @@ from geogig.gui.dialogs.userconfigdialog import UserConfigDialog
 
 from geogig.geogigwebapi.diff import LocalDiff
 from geogig.geogigwebapi.repository import GeoGigException, Repository
+from geogig.geogigwebapi.commit import Commit
 
 from geogig.tools.layertracking import (getTrackingInfoForGeogigLayer,
                                         removeTrackedLayer,
                                         addTrackedLayer,
                                         getTrackingInfo)
 from geogig.tools.utils import (layerGeopackageFilename)
+from geogig.tools.interchange import applyChanges, createAuditTables, INSERT, UPDATE, DELETE
+from geogig.tools.fids import fidMapping
+from geogig.tools.tiles import (checkoutGeopackage, checkoutTiles, bboxTiles, loadedTiles,
+                                featuresOutsideTiles, MAX_TILES)
+from geogig.tools.profiles import layerProfile, applyProfile
+from geogig.tools.dbconnection import (connect, retryOnLock, isLockError,
+                                       recordLockFallback, lockStatistics)
+from geogig.tools.jobs import jobManager, checkCancelled, JobCancelledException
+from geogig.tools.conflicts import autoMerge, resolveConflicts
 from geogig.tools.layers import (WrongLayerSourceException,
                                  layerFromSource,
                                  namesFromLayer,
@@ -61,21 +71,13 @@ from geogig.tools.layers import (WrongLayerSourceException,
 from qgiscommons2.files import tempFilename
 from qgiscommons2.layers import loadLayerNoCrsDialog
 
-INSERT, UPDATE, DELETE  = 1, 2, 3
-
 
 def syncLayer(layer):
     tracking = getTrackingInfo(layer)
     repo = Repository(tracking.repoUrl)
     filename, layername = namesFromLayer(layer)
-    con = sqlite3.connect(filename)
-    cursor = con.cursor()
-    cursor.execute("SELECT * FROM %s_audit;" % layername)
-    changes = bool(cursor.fetchall())
-    cursor.close()
-    con.close()
-    if changes:
-        con = sqlite3.connect(filename)
+    if hasLocalChanges(layer):
+        con = connect(filename)
         cursor = con.cursor()
         beforeAttrs = set(v[1] for v in cursor.execute("PRAGMA table_info('%s');" % layername))
         afterAttrs = set(v[1] for v in cursor.execute("PRAGMA table_info('%s_audit');" % layername)
@@ -98,58 +100,76 @@ def syncLayer(layer):
         if dlg.branch is None:
             return
 
-        if dlg.branch not in repo.branches():
-            commitId = getCommitId(layer)
-            repo.createbranch(commitId, dlg.branch)
-        mergeCommitId, importCommitId, conflicts, featureIds = repo.importgeopkg(layer, dlg.branch, dlg.message, user, email, True)
-
-        if conflicts:
-            ret = QMessageBox.warning(iface.mainWindow(), "Error while syncing",
-                                      "There are conflicts between local and remote changes.\n"
-                                      "Do you want to continue and fix them?",
-                                      QMessageBox.Yes | QMessageBox.No)
-            if ret == QMessageBox.No:
-                repo.closeTransaction(conflicts[0].transactionId)
-                return
-            solved, resolvedConflicts = solveConflicts(conflicts)
-            if not solved:
-                repo.closeTransaction(conflicts[0].transactionId)
+        branch, message = dlg.branch, dlg.message
+        commitId = getCommitId(layer)
+        def _import():
+            if branch not in repo.branches():
+                repo.createbranch(commitId, branch)
+            result = repo.importgeopkg(layer, branch, message, user, email, True)
+            conflicts = result[2]
+            if conflicts:
+                resolutions, remaining = autoMerge(conflicts)
+            else:
+                resolutions, remaining = {}, []
+            return result, resolutions, remaining
+
+        def _imported(imported):
+            (mergeCommitId, importCommitId, conflicts, featureIds), resolutions, remaining = imported
+            if remaining:
+                ret = QMessageBox.warning(iface.mainWindow(), "Error while syncing",
+                                          "There are conflicts between local and remote changes.\n"
+                                          "Do you want to continue and fix them?",
+                                          QMessageBox.Yes | QMessageBox.No)
+                if ret == QMessageBox.No:
+                    repo.closeTransaction(conflicts[0].transactionId)
+                    return
+                solved, resolvedConflicts = solveConflicts(remaining)
+                if not solved:
+                    repo.closeTransaction(conflicts[0].transactionId)
+                    return
+                resolutions.update(resolvedConflicts)
+
+            def _update():
+                if conflicts:
+                    resolveConflicts(conflicts, resolutions)
+                    repo.commitAndCloseMergeAndTransaction(user, email, "Resolved merge conflicts", conflicts[0].transactionId)
+
+                _updateFeatureIds(filename, layername, featureIds)
+                try:
+                    updateGeopackage(repo, filename, layername, importCommitId, mergeCommitId)
+                except JobCancelledException:
+                    raise
+                except Exception as e:
+                    _logFallback(e, "Could not apply changes while syncing")
+                    checkoutGeopackage(repo, tracking.geopkg, layername, mergeCommitId)
+
+            def _updated(result):
+                commitdialog.suggestedMessage = ""
+                _layerSynced(repo, layer)
+
+            jobManager.submit("Update layer '%s'" % layername, _update, _updated)
+
+        jobManager.submit("Sync layer '%s'" % layername, _import, _imported)
+    else:
+        def _branches():
+            return [branch for branch in repo.branches() if layername in repo.trees(branch)]
+
+        def _selectBranch(branches):
+            branch, ok = QInputDialog.getItem(iface.mainWindow(), "Sync",
+                                              "Select branch to update from",
+                                              branches, 0, False)
+            if not ok:
                 return
-            for conflict, resolution in zip(conflicts, list(resolvedConflicts.values())):
-                if resolution == ConflictDialog.LOCAL:
-                    conflict.resolveWithLocalVersion()
-                elif resolution == ConflictDialog.REMOTE:
-                    conflict.resolveWithRemoteVersion()
-                elif resolution == ConflictDialog.DELETE:
-                    conflict.resolveDeletingFeature()
-                else:
-                    conflict.resolveWithNewFeature(resolution)
-            repo.commitAndCloseMergeAndTransaction(user, email, "Resolved merge conflicts", conflicts[0].transactionId)
-
-        updateFeatureIds(repo, layer, featureIds)
-        try:
-            applyLayerChanges(repo, layer, importCommitId, mergeCommitId)
-        except:
-            QgsMessageLog.logMessage("Database locked while syncing. Using full layer checkout instead", level=QgsMessageLog.CRITICAL)
-            repo.checkoutlayer(tracking.geopkg, layername, None, mergeCommitId)
+            commitId = getCommitId(layer)
+            def _update():
+                headCommitId = repo.revparse(branch)
+                updateGeopackage(repo, filename, layername, commitId, headCommitId)
+            jobManager.submit("Update layer '%s'" % layername, _update,
+                              lambda result: _layerSynced(repo, layer))
 
-        commitdialog.suggestedMessage = ""
-    else:
-        branches = []
-        for branch in repo.branches():
-            trees = repo.trees(branch)
-            if layername in trees:
-                branches.append(branch)
-
-        branch, ok = QInputDialog.getItem(iface.mainWindow(), "Sync",
-                                          "Select branch to update from",
-                                          branches, 0, False)
-        if not ok:
-            return
-        commitId = getCommitId(layer)
-        headCommitId = repo.revparse(branch)
-        applyLayerChanges(repo, layer, commitId, headCommitId)
+        jobManager.submit("Sync layer '%s'" % layername, _branches, _selectBranch)
 
+def _layerSynced(repo, layer):
     layer.reload()
     layer.triggerRepaint()
     repoWatcher.repoChanged.emit(repo)
@@ -161,82 +181,128 @@ def syncLayer(layer):
 
 def updateFeatureIds(repo, layer, featureIds):
     filename, layername = namesFromLayer(layer)
-    con = sqlite3.connect(filename)
-    cursor = con.cursor()
-    for ids in featureIds:
-        cursor.execute('INSERT INTO "%s_fids" VALUES ("%s", "%s")' % (layername, ids[0], ids[1]))
-    cursor.close()
-    con.commit()
-    con.close()
+    _updateFeatureIds(filename, layername, featureIds)
 
-def gpkgfidFromGeogigfid(cursor, layername, geogigfid):
-    cursor.execute("SELECT gpkg_fid FROM %s_fids WHERE geogig_fid='%s';" % (layername, geogigfid))
-    gpkgfid = cursor.fetchone()[0]
-    return gpkgfid
+def _updateFeatureIds(filename, layername, featureIds):
+    fidMapping(filename, layername).add(featureIds)
 
 def applyLayerChanges(repo, layer, beforeCommitId, afterCommitId, clearAudit = True):
     layer.reload()
     filename, layername = namesFromLayer(layer)
+    updateGeopackage(repo, filename, layername, beforeCommitId, afterCommitId, clearAudit)
+
+def updateGeopackage(repo, filename, layername, beforeCommitId, afterCommitId, clearAudit = True):
+    '''
+    Applies the changes between two commits to a layer geopackage.
+    Does not use the QGIS layer, so it can be called from a job
+    '''
     changesFilename = tempFilename("gpkg")
     beforeCommitId, afterCommitId = repo.revparse(beforeCommitId), repo.revparse(afterCommitId)
     repo.exportdiff(beforeCommitId, afterCommitId, changesFilename, layername)
+    checkCancelled()
+    inserted = retryOnLock(applyChanges, filename, changesFilename, layername, afterCommitId, clearAudit)
+    # Tiled layers only keep the features added or moved into the tiles they have loaded
+    tiles = loadedTiles(filename, layername)
+    outside = featuresOutsideTiles(filename, layername, tiles, inserted) if tiles is not None else None
+    retryOnLock(applyProfile, filename, layername, layerProfile(filename, layername), removeFids = outside)
+
+
+# Number of features of an imported layer that are checked to exist in
+# the repository before tracking the layer without downloading it again
+IMPORT_CHECK_SAMPLE = 10
+
+def trackImportedGeopackage(repo, filename, layername, commitId, featureIds):
+    '''
+    Turns a geopackage layer just imported to a new layer in a repository
+    into a tracked layer at the import commit, creating the tables and
+    triggers that a checkout has, without downloading the layer again.
+    featureIds are the (gpkg fid, GeoGig id) pairs of the features that
+    the server did not give their fid as GeoGig id.
+    Returns False if the commit does not contain just the features of the
+    geopackage, so the layer must be checked out instead
+    '''
+    con = connect(filename)
+    try:
+        cursor = con.cursor()
+        count = cursor.execute('SELECT COUNT(*) FROM "%s";' % layername).fetchone()[0]
+        sample = [str(r[0]) for r in cursor.execute('SELECT fid FROM "%s" ORDER BY RANDOM() LIMIT %i;'
+                                                    % (layername, IMPORT_CHECK_SAMPLE))]
+    finally:
+        con.close()
+    commit = Commit.fromref(repo, commitId)
+    if (commit.added, commit.modified, commit.removed) != (count, 0, 0):
+        return False
+    ids = dict((str(gpkgfid), str(geogigfid)) for gpkgfid, geogigfid in featureIds)
+    paths = ["%s/%s" % (layername, ids.get(fid, fid)) for fid in sample]
+    if len(repo.features(paths, commitId)) != len(paths):
+        return False
+    createAuditTables(filename, layername, commitId, featureIds, repo.url)
+    return True
 
-    con = sqlite3.connect(filename)
+
+# Largest ratio of changed features to layer features for which updating
+# a layer with a diff is considered cheaper than downloading it again
+DELTA_CHECKOUT_RATIO = 0.2
+
+def _useDelta(repo, filename, layername, currentCommitId, newCommitId):
+    if repo.islayercached(layername, newCommitId):
+        return False
+    con = connect(filename)
     cursor = con.cursor()
-    changesCon = sqlite3.connect(changesFilename)
-    changesCursor = changesCon.cursor()
-
-    attributes = [v[1] for v in cursor.execute("PRAGMA table_info('%s');" % layername)]
-    attrnames = [a for a in attributes if a != "fid"]
-
-    changesCursor.execute("SELECT * FROM %s_changes WHERE audit_op=2;" % layername)
-    modified = changesCursor.fetchall()
-    for m in modified:
-        geogigfid = m[0]
-        changesGpkgfid = gpkgfidFromGeogigfid(changesCursor, layername, geogigfid)
-        gpkgfid = gpkgfidFromGeogigfid(cursor, layername, geogigfid)
-        changesCursor.execute("SELECT * FROM %s WHERE fid='%s';" % (layername, changesGpkgfid))
-        featureRow = changesCursor.fetchone()
-        attrs = {attr: featureRow[attributes.index(attr)] for attr in attrnames}
-        vals = ",".join(['"%s"=?' % k for k in list(attrs.keys())])
-        cursor.execute("UPDATE %s SET %s WHERE fid='%s'" % (layername, vals, gpkgfid), list(attrs.values()))
-
-    changesCursor.execute("SELECT * FROM %s_changes WHERE audit_op=1;" % layername)
-    added = changesCursor.fetchall()
-    for a in added:
-        geogigfid = a[0]
-        changesGpkgfid = gpkgfidFromGeogigfid(changesCursor, layername, geogigfid)
-        changesCursor.execute("SELECT * FROM %s WHERE fid='%s';" % (layername, changesGpkgfid))
-        featureRow = changesCursor.fetchone()
-        attrs = {attr: featureRow[attributes.index(attr)] for attr in attrnames}
-        cols = ', '.join('"%s"' % col for col in list(attrs.keys()))
-        vals = ', '.join('?' for val in list(attrs.values()))
-        cursor.execute('INSERT INTO "%s" (%s) VALUES (%s)' % (layername, cols, vals), list(attrs.values()))
-        gpkgfid = cursor.lastrowid
-        cursor.execute('INSERT INTO "%s_fids" VALUES ("%s", "%s")' % (layername, gpkgfid, geogigfid))
-
-    changesCursor.execute("SELECT * FROM %s_changes WHERE audit_op=3;" % layername)
-    removed = changesCursor.fetchall()
-    for r in removed:
-        geogigfid = r[0]
-        gpkgfid = gpkgfidFromGeogigfid(cursor, layername, geogigfid)
-        cursor.execute("DELETE FROM %s WHERE fid='%s'" % (layername, gpkgfid))
-
-    changesCursor.close()
-    changesCon.close()
-
-    if clearAudit:
-        cursor.execute("DELETE FROM %s_audit;" % layername)
-        cursor.execute("UPDATE geogig_audited_tables SET commit_id='%s' WHERE table_name='%s'" % (afterCommitId, layername))
-
-    con.commit()
+    # the largest fid is a cheap estimate of the number of features
+    cursor.execute('SELECT MAX(fid) FROM "%s";' % layername)
+    nfeatures = cursor.fetchone()[0] or 0
     cursor.close()
     con.close()
+    maxChanges = nfeatures * DELTA_CHECKOUT_RATIO
+    if maxChanges < 1:
+        return False
+    return repo.estimatedchanges(currentCommitId, newCommitId) <= maxChanges
+
+def changeLayerVersion(repo, layer, ref):
+    '''
+    Updates a tracked layer with no local changes to the given commit.
+    If few features change between the current and the new commit, only
+    the diff between them is downloaded and applied to the layer.
+    Otherwise, the full layer is checked out
+    '''
+    layer.reload()
+    filename, layername = namesFromLayer(layer)
+    changeGeopackageVersion(repo, filename, layername, ref)
+
+def changeGeopackageVersion(repo, filename, layername, ref):
+    '''
+    Same as changeLayerVersion, for a layer geopackage. Does not use
+    the QGIS layer, so it can be called from a job
+    '''
+    currentCommitId = _commitIdFromGeopackage(filename, layername)
+    newCommitId = repo.revparse(ref)
+    if currentCommitId == newCommitId:
+        return
+    if _useDelta(repo, filename, layername, currentCommitId, newCommitId):
+        try:
+            updateGeopackage(repo, filename, layername, currentCommitId, newCommitId)
+            return
+        except JobCancelledException:
+            raise
+        except Exception as e:
+            _logFallback(e, "Could not apply changes between versions")
+    checkoutGeopackage(repo, filename, layername, newCommitId)
+
+
+def _logFallback(e, message):
+    if isLockError(e):
+        recordLockFallback()
+        message = "Database locked (%i times in this session)" % lockStatistics.fallbacks
+    QgsMessageLog.logMessage("%s. Using full layer checkout instead" % message, level=QgsMessageLog.WARNING)
 
 
 def getCommitId(layer):
     filename, layername = namesFromLayer(layer)
-    con = sqlite3.connect(filename)
+    return _commitIdFromGeopackage(filename, layername)
+
+def _commitIdFromGeopackage(filename, layername):
+    con = connect(filename)
     cursor = con.cursor()
     cursor.execute("SELECT commit_id FROM geogig_audited_tables WHERE table_name='%s';" % layername)
     commitid = cursor.fetchone()[0]
@@ -264,7 +330,27 @@ def isGeoGigGeopackage(layer):
 class HasLocalChangesError(Exception):
     pass
 
-def checkoutLayer(repo, layername, bbox, ref = None):
+def _checkout(repo, filename, layername, bbox, ref, profile):
+    if bbox is not None:
+        tiles = bboxTiles(bbox)
+        if 0 < len(tiles) <= MAX_TILES:
+            checkoutTiles(repo, filename, layername, tiles, ref, profile)
+            return
+        QgsMessageLog.logMessage("Extent covers too many tiles. Checking out the full layer",
+                                 level=QgsMessageLog.WARNING)
+    repo.checkoutlayer(filename, layername, None, ref)
+    applyProfile(filename, layername, profile, compact = True)
+
+def checkoutLayer(repo, layername, bbox, ref = None, profile = None):
+    '''
+    Adds a repository layer to the project, checking it out if it is not
+    tracked or is at a different commit. If a bounding box is passed, only
+    the tiles that cover it are checked out, and more tiles are loaded later
+    as the map is panned. If a checkout profile is passed, only the columns
+    and features in it are kept. It is recorded in the tracking info of
+    the layer, so it is also applied when the layer is synced. Layers
+    already tracked keep the profile they were checked out with
+    '''
     ref = ref or repo.HEAD
     newCommitId = repo.revparse(ref)
     trackedlayer = getTrackingInfoForGeogigLayer(repo.url, layername)
@@ -283,8 +369,8 @@ def checkoutLayer(repo, layername, bbox, ref = None):
         source = "%s|layername=%s" % (filename, layername)
 
     if trackedlayer is None:
-        repo.checkoutlayer(filename, layername, bbox, ref or repo.HEAD)
-        addTrackedLayer(source, repo.url)
+        _checkout(repo, filename, layername, bbox, ref, profile)
+        addTrackedLayer(source, repo.url, profile)
         try:
             layer = layerFromSource(source)
             iface.messageBar().pushMessage("GeoGig", "Layer was already included in the current QGIS project",
@@ -309,7 +395,10 @@ def checkoutLayer(repo, layername, bbox, ref = None):
             if hasLocalChanges(layer):
                 raise HasLocalChangesError()
             filename, layername = namesFromLayer(layer)
-            repo.checkoutlayer(filename, layername, bbox, ref)
+            if bbox is None:
+                checkoutGeopackage(repo, filename, layername, ref)
+            else:
+                _checkout(repo, filename, layername, bbox, ref, layerProfile(filename, layername))
             layer.reload()
             if not wasLoaded:
                 QgsMapLayerRegistry.instance().addMapLayers([layer])
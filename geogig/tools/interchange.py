@@ -0,0 +1,485 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    interchange.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+# Set-based SQL operations on GeoGig interchange geopackages (layers with
+# their <layer>_audit and <layer>_fids tables, as exported by the server)
+
+import os
+import sqlite3
+
+from geogig.tools.dbconnection import connect, BUSY_TIMEOUT
+
+INSERT, UPDATE, DELETE  = 1, 2, 3
+
+# UPDATE ... FROM is only available from SQLite 3.33
+_UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+
+def _columns(cursor, table, schema = "main"):
+    return [v[1] for v in cursor.execute('PRAGMA %s.table_info("%s");' % (schema, table))]
+
+
+def geopackageVersion(filename):
+    '''
+    Returns a value that changes whenever the passed geopackage is modified,
+    including changes still in its write-ahead log, to tell when data read
+    from it is stale
+    '''
+    version = []
+    for f in [filename, filename + "-wal"]:
+        try:
+            stat = os.stat(f)
+            version.append((stat.st_mtime, stat.st_size))
+        except OSError:
+            version.append(None)
+    return version
+
+
+def _lastFid(cursor, layername):
+    cursor.execute('SELECT COALESCE(MAX(fid), 0) FROM main."%s";' % layername)
+    lastFid = cursor.fetchone()[0]
+    cursor.execute("SELECT name FROM main.sqlite_master WHERE type='table' AND name='sqlite_sequence';")
+    if cursor.fetchone() is not None:
+        cursor.execute("SELECT seq FROM main.sqlite_sequence WHERE name = ?;", (layername,))
+        seq = cursor.fetchone()
+        if seq is not None:
+            lastFid = max(lastFid, seq[0])
+    return lastFid
+
+
+def applyChanges(filename, changesFilename, layername, commitId = None, clearAudit = True):
+    '''
+    Applies the changes in a diff geopackage exported by the server to the
+    layer in the passed geopackage file.
+
+    All changes are applied with a few set-based statements in a single
+    transaction, joining features through the <layer>_fids tables of both
+    geopackages. Features added to the layer, and modified features that
+    were not in it, are registered in its <layer>_fids table. If
+    clearAudit is True, the audit table is emptied and the layer is marked
+    as being at the passed commit. Returns the fids of the features added
+    '''
+    con = connect(filename)
+    con.isolation_level = None
+    cursor = con.cursor()
+    try:
+        cursor.execute("ATTACH DATABASE ? AS changes;", (changesFilename,))
+        attrnames = [a for a in _columns(cursor, layername) if a != "fid"]
+        changesColumns = _columns(cursor, layername + "_changes", "changes")
+        idColumn = changesColumns[0]
+        cols = ", ".join('"%s"' % a for a in attrnames)
+        srcCols = ", ".join('src."%s"' % a for a in attrnames)
+
+        cursor.execute("BEGIN;")
+        cursor.execute('''CREATE TEMP TABLE geogig_apply AS
+                          SELECT ch."{id}" AS geogig_fid, ch.audit_op AS audit_op,
+                                 CAST(cf.gpkg_fid AS INTEGER) AS src_fid,
+                                 CAST(lf.gpkg_fid AS INTEGER) AS dst_fid
+                          FROM changes."{layer}_changes" ch
+                          LEFT JOIN changes."{layer}_fids" cf ON cf.geogig_fid = ch."{id}"
+                          LEFT JOIN main."{layer}_fids" lf ON lf.geogig_fid = ch."{id}";'''
+                       .format(id = idColumn, layer = layername))
+        cursor.execute("CREATE INDEX temp.geogig_apply_dst ON geogig_apply(dst_fid);")
+        # Modified features that are not in the layer, such as ones that did not
+        # match the filter of its checkout profile or were outside its loaded
+        # tiles before, are added to it
+        cursor.execute('''UPDATE temp.geogig_apply SET audit_op = ? WHERE audit_op = ?
+                          AND dst_fid IS NULL AND src_fid IS NOT NULL;''', (INSERT, UPDATE))
+
+        if attrnames:
+            if _UPDATE_FROM:
+                sets = ", ".join('"%s" = src."%s"' % (a, a) for a in attrnames)
+                cursor.execute('''UPDATE main."{layer}" SET {sets}
+                                  FROM changes."{layer}" AS src, temp.geogig_apply AS ap
+                                  WHERE ap.audit_op = {op} AND src.fid = ap.src_fid
+                                  AND main."{layer}".fid = ap.dst_fid;'''
+                               .format(layer = layername, sets = sets, op = UPDATE))
+            else:
+                sets = ", ".join('''"{attr}" = (SELECT src."{attr}" FROM changes."{layer}" AS src
+                                     JOIN temp.geogig_apply AS ap ON src.fid = ap.src_fid
+                                     WHERE ap.audit_op = {op} AND ap.dst_fid = main."{layer}".fid)'''
+                                 .format(attr = a, layer = layername, op = UPDATE) for a in attrnames)
+                cursor.execute('''UPDATE main."{layer}" SET {sets}
+                                  WHERE fid IN (SELECT dst_fid FROM temp.geogig_apply WHERE audit_op = {op});'''
+                               .format(layer = layername, sets = sets, op = UPDATE))
+
+        # New features get consecutive fids after the largest one ever used in the layer
+        cursor.execute('''UPDATE temp.geogig_apply SET dst_fid = ? + rowid
+                          WHERE audit_op = ?;''', (_lastFid(cursor, layername), INSERT))
+        cursor.execute('''INSERT INTO main."{layer}" (fid{sep}{cols})
+                          SELECT ap.dst_fid{sep}{srcCols} FROM changes."{layer}" AS src
+                          JOIN temp.geogig_apply AS ap ON src.fid = ap.src_fid
+                          WHERE ap.audit_op = {op} ORDER BY ap.rowid;'''
+                       .format(layer = layername, cols = cols, srcCols = srcCols,
+                               sep = ", " if attrnames else "", op = INSERT))
+        cursor.execute('''INSERT INTO main."{layer}_fids" (gpkg_fid, geogig_fid)
+                          SELECT CAST(dst_fid AS TEXT), geogig_fid FROM temp.geogig_apply
+                          WHERE audit_op = {op};'''.format(layer = layername, op = INSERT))
+
+        cursor.execute('''DELETE FROM main."{layer}" WHERE fid IN
+                          (SELECT dst_fid FROM temp.geogig_apply WHERE audit_op = {op});'''
+                       .format(layer = layername, op = DELETE))
+
+        if clearAudit:
+            cursor.execute('DELETE FROM main."%s_audit";' % layername)
+            cursor.execute("UPDATE main.geogig_audited_tables SET commit_id = ? WHERE table_name = ?;",
+                           (commitId, layername))
+
+        cursor.execute("SELECT dst_fid FROM temp.geogig_apply WHERE audit_op = ?;", (INSERT,))
+        inserted = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DROP TABLE temp.geogig_apply;")
+        cursor.execute("COMMIT;")
+        return inserted
+    except:
+        try:
+            cursor.execute("ROLLBACK;")
+        except sqlite3.OperationalError:
+            pass # no transaction was started
+        raise
+    finally:
+        cursor.close()
+        con.close()
+
+
+def _dropAuditTriggers(cursor, layername):
+    '''Drops the audit triggers of a layer, returning them so they can be restored with _restoreTriggers'''
+    cursor.execute('''SELECT name, sql FROM main.sqlite_master WHERE type = 'trigger'
+                      AND tbl_name = ? AND name LIKE ?;''', (layername, layername + "_audit_%"))
+    triggers = cursor.fetchall()
+    for name, sql in triggers:
+        cursor.execute('DROP TRIGGER main."%s";' % name)
+    return triggers
+
+
+def _restoreTriggers(cursor, triggers):
+    for name, sql in triggers:
+        cursor.execute(sql)
+
+
+def appendFeatures(filename, otherFilename, layername):
+    '''
+    Adds to the layer in the passed geopackage the features of the same
+    layer in another geopackage exported by the server, such as one with
+    another area of the layer, that it does not contain yet. Features are
+    matched through the <layer>_fids tables of both geopackages, and the
+    ones added are registered in the <layer>_fids table of the layer.
+
+    The audit triggers are dropped while the features are added, so they
+    are not taken as local changes. Returns the number of features added
+    '''
+    con = connect(filename)
+    con.isolation_level = None
+    cursor = con.cursor()
+    try:
+        cursor.execute("ATTACH DATABASE ? AS other;", (otherFilename,))
+        attrnames = [a for a in _columns(cursor, layername) if a != "fid"]
+        cols = ", ".join('"%s"' % a for a in attrnames)
+        srcCols = ", ".join('src."%s"' % a for a in attrnames)
+
+        cursor.execute("BEGIN;")
+        cursor.execute('''CREATE TEMP TABLE geogig_merge (src_fid INTEGER, geogig_fid TEXT, dst_fid INTEGER);''')
+        cursor.execute('''INSERT INTO temp.geogig_merge (src_fid, geogig_fid)
+                          SELECT src.fid, ofi.geogig_fid FROM other."{layer}" AS src
+                          JOIN other."{layer}_fids" AS ofi ON CAST(ofi.gpkg_fid AS INTEGER) = src.fid
+                          WHERE ofi.geogig_fid NOT IN (SELECT geogig_fid FROM main."{layer}_fids")
+                          ORDER BY src.fid;'''.format(layer = layername))
+        cursor.execute("UPDATE temp.geogig_merge SET dst_fid = ? + rowid;", (_lastFid(cursor, layername),))
+
+        triggers = _dropAuditTriggers(cursor, layername)
+        cursor.execute('''INSERT INTO main."{layer}" (fid{sep}{cols})
+                          SELECT m.dst_fid{sep}{srcCols} FROM other."{layer}" AS src
+                          JOIN temp.geogig_merge AS m ON src.fid = m.src_fid
+                          ORDER BY m.rowid;'''
+                       .format(layer = layername, cols = cols, srcCols = srcCols,
+                               sep = ", " if attrnames else ""))
+        cursor.execute('''INSERT INTO main."{layer}_fids" (gpkg_fid, geogig_fid)
+                          SELECT CAST(dst_fid AS TEXT), geogig_fid FROM temp.geogig_merge;'''
+                       .format(layer = layername))
+        _restoreTriggers(cursor, triggers)
+        added = cursor.execute("SELECT COUNT(*) FROM temp.geogig_merge;").fetchone()[0]
+
+        cursor.execute("DROP TABLE temp.geogig_merge;")
+        cursor.execute("COMMIT;")
+        return added
+    except:
+        try:
+            cursor.execute("ROLLBACK;")
+        except sqlite3.OperationalError:
+            pass # no transaction was started
+        raise
+    finally:
+        cursor.close()
+        con.close()
+
+
+def filterFeatures(filename, layername, hiddenColumns = None, filter = None, compact = False,
+                   removeFids = None):
+    '''
+    Empties the passed columns of a layer and removes the features that do
+    not match the passed SQL filter and the ones with the fids in
+    removeFids, along with their entries in the <layer>_fids table.
+    Features with local changes are not modified. The
+    audit triggers are dropped meanwhile, so this is not taken as local
+    changes. If compact is True, the geopackage is vacuumed afterwards to
+    reclaim the space freed.
+
+    Raises ValueError if the filter is not valid, before modifying anything
+    '''
+    con = connect(filename)
+    con.isolation_level = None
+    cursor = con.cursor()
+    try:
+        if filter is not None:
+            try:
+                cursor.execute('SELECT COUNT(*) FROM main."%s" WHERE (%s);' % (layername, filter))
+            except sqlite3.Error as e:
+                raise ValueError("Invalid filter '%s': %s" % (filter, e))
+        unchanged = 'fid NOT IN (SELECT fid FROM main."%s_audit")' % layername
+
+        cursor.execute("BEGIN;")
+        triggers = _dropAuditTriggers(cursor, layername)
+        if filter is not None or removeFids:
+            cursor.execute("CREATE TEMP TABLE geogig_filtered (fid INTEGER PRIMARY KEY);")
+        if filter is not None:
+            cursor.execute('''INSERT OR IGNORE INTO temp.geogig_filtered (fid) SELECT fid FROM main."{layer}"
+                              WHERE NOT COALESCE(({filter}), 0) AND {unchanged};'''
+                           .format(layer = layername, filter = filter, unchanged = unchanged))
+        if removeFids:
+            cursor.executemany('''INSERT OR IGNORE INTO temp.geogig_filtered (fid) SELECT fid FROM main."{layer}"
+                                  WHERE fid = ? AND {unchanged};'''.format(layer = layername, unchanged = unchanged),
+                               [(fid,) for fid in removeFids])
+        if filter is not None or removeFids:
+            cursor.execute('''DELETE FROM main."{layer}_fids" WHERE CAST(gpkg_fid AS INTEGER) IN
+                              (SELECT fid FROM temp.geogig_filtered);'''.format(layer = layername))
+            cursor.execute('DELETE FROM main."%s" WHERE fid IN (SELECT fid FROM temp.geogig_filtered);'
+                           % layername)
+            cursor.execute("DROP TABLE temp.geogig_filtered;")
+        if hiddenColumns:
+            sets = ", ".join('"%s" = NULL' % c for c in hiddenColumns)
+            cursor.execute('UPDATE main."%s" SET %s WHERE %s;' % (layername, sets, unchanged))
+        _restoreTriggers(cursor, triggers)
+        cursor.execute("COMMIT;")
+        if compact:
+            try:
+                cursor.execute("VACUUM;")
+            except sqlite3.OperationalError:
+                pass # geopackage in use. The space freed is reused by later changes anyway
+    except:
+        try:
+            cursor.execute("ROLLBACK;")
+        except sqlite3.OperationalError:
+            pass # no transaction was started
+        raise
+    finally:
+        cursor.close()
+        con.close()
+
+
+def fillColumns(filename, layername, columns, features):
+    '''
+    Sets the values of the passed columns of features in the layer and
+    audit tables of a geopackage, such as one created by saveAuditTables.
+    features is a dict with the attributes of the features, keyed by their
+    GeoGig ids. Features not in the geopackage are ignored
+    '''
+    if not columns or not features:
+        return
+    con = connect(filename)
+    try:
+        cursor = con.cursor()
+        fids = dict(cursor.execute('SELECT geogig_fid, CAST(gpkg_fid AS INTEGER) FROM "%s_fids";'
+                                   % layername).fetchall())
+        values = [[attrs.get(c) for c in columns] + [fids[geogigfid]]
+                  for geogigfid, attrs in features.items() if geogigfid in fids]
+        sets = ", ".join('"%s" = ?' % c for c in columns)
+        for table in [layername, layername + "_audit"]:
+            cursor.executemany('UPDATE "%s" SET %s WHERE fid = ?;' % (table, sets), values)
+        con.commit()
+    finally:
+        con.close()
+
+
+def _dropSchema(cursor):
+    # Removes all the tables, views and triggers of the main database
+    objects = cursor.execute("""SELECT type, name, sql FROM main.sqlite_master
+                                WHERE name NOT LIKE 'sqlite_%';""").fetchall()
+    for objectType in ["trigger", "view"]:
+        for t, name, sql in objects:
+            if t == objectType:
+                cursor.execute('DROP %s IF EXISTS main."%s";' % (objectType.upper(), name))
+    # virtual tables first, since they remove their own shadow tables
+    tables = [(name, sql) for t, name, sql in objects if t == "table"]
+    tables.sort(key = lambda table: not (table[1] or "").upper().startswith("CREATE VIRTUAL"))
+    for name, sql in tables:
+        cursor.execute('DROP TABLE IF EXISTS main."%s";' % name)
+
+
+def copyDatabase(source, dest):
+    '''
+    Copies a geopackage over another one. The copy is made through SQLite,
+    replacing the content of the destination in a single transaction, so
+    layers that have it open and its write-ahead log stay consistent
+    '''
+    con = connect(dest)
+    con.isolation_level = None
+    cursor = con.cursor()
+    try:
+        cursor.execute("ATTACH DATABASE ? AS src;", (source,))
+        cursor.execute("BEGIN IMMEDIATE;")
+        _dropSchema(cursor)
+        objects = cursor.execute("""SELECT type, name, sql FROM src.sqlite_master
+                                    WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+                                    ORDER BY rowid;""").fetchall()
+        # the shadow tables of spatial indexes are created with their virtual table
+        virtual = [name for t, name, sql in objects if t == "table" and sql.upper().startswith("CREATE VIRTUAL")]
+        shadow = set([name + suffix for name in virtual for suffix in ["_node", "_rowid", "_parent"]])
+        tables = [(name, sql) for t, name, sql in objects if t == "table" and name not in shadow]
+        for name, sql in tables:
+            cursor.execute(sql)
+        for name, sql in tables:
+            cursor.execute('INSERT INTO main."{0}" SELECT * FROM src."{0}";'.format(name))
+        cursor.execute("SELECT name FROM src.sqlite_master WHERE type='table' AND name='sqlite_sequence';")
+        if cursor.fetchone() is not None:
+            cursor.execute("DELETE FROM main.sqlite_sequence;")
+            cursor.execute("INSERT INTO main.sqlite_sequence SELECT * FROM src.sqlite_sequence;")
+        # triggers last, so they do not run while copying
+        for objectType in ["index", "view", "trigger"]:
+            for t, name, sql in objects:
+                if t == objectType:
+                    cursor.execute(sql)
+        for pragma in ["application_id", "user_version"]:
+            value = cursor.execute("PRAGMA src.%s;" % pragma).fetchone()[0]
+            cursor.execute("PRAGMA main.%s = %i;" % (pragma, value))
+        cursor.execute("COMMIT;")
+    except:
+        try:
+            cursor.execute("ROLLBACK;")
+        except sqlite3.Error:
+            pass
+        raise
+    finally:
+        con.close()
+
+
+def saveAuditTables(filename, layername, newfilename):
+    '''
+    Creates the interchange geopackage to send to the server when importing
+    the local changes of a layer. It contains the audit, fids and audited
+    tables of the passed geopackage, and the current version of the features
+    that were added or modified, copied in a single transaction
+    '''
+    con = sqlite3.connect(newfilename, timeout = BUSY_TIMEOUT)
+    con.isolation_level = None
+    cursor = con.cursor()
+    try:
+        cursor.execute("ATTACH DATABASE ? AS db2;", (filename,))
+        cursor.execute("BEGIN;")
+        auditTable = layername + "_audit"
+        tables = [auditTable, layername + "_fids", "geogig_audited_tables", "gpkg_geometry_columns", layername]
+        for table in tables:
+            cursor.execute("SELECT sql FROM db2.sqlite_master WHERE type='table' AND name=?;", (table,))
+            cursor.execute(cursor.fetchone()[0])
+        for table in tables[:-1]:
+            cursor.execute('INSERT INTO main."{table}" SELECT * FROM db2."{table}";'.format(table = table))
+        idColumn = _columns(cursor, auditTable, "db2")[0]
+        cursor.execute('''INSERT INTO main."{layer}" SELECT * FROM db2."{layer}"
+                          WHERE fid IN (SELECT DISTINCT "{id}" FROM db2."{audit}" WHERE audit_op <> {op});'''
+                       .format(layer = layername, audit = auditTable, id = idColumn, op = DELETE))
+        cursor.execute("COMMIT;")
+    except:
+        try:
+            cursor.execute("ROLLBACK;")
+        except sqlite3.OperationalError:
+            pass
+        raise
+    finally:
+        cursor.close()
+        con.close()
+
+
+def createAuditTables(filename, layername, commitId, featureIds = None, repoUrl = None):
+    '''
+    Turns a layer in a geopackage into a layer tracked by GeoGig at the
+    passed commit, creating the same tables and triggers that a layer
+    checked out from the server has. Features get their fid as GeoGig id,
+    unless a different one is given in the (gpkg fid, GeoGig id) pairs
+    of featureIds
+    '''
+    con = connect(filename)
+    con.isolation_level = None
+    cursor = con.cursor()
+    try:
+        info = list(cursor.execute('PRAGMA table_info("%s");' % layername))
+        columns = [c[1] for c in info]
+        pk = [c[1] for c in info if c[5]][0]
+        auditTable = layername + "_audit"
+        cursor.execute("BEGIN;")
+        cursor.execute("CREATE TABLE IF NOT EXISTS geogig_metadata (repository_uri VARCHAR);")
+        cursor.execute("CREATE TABLE IF NOT EXISTS geogig_audited_tables (table_name VARCHAR, mapped_path VARCHAR, "
+                       "audit_table VARCHAR, commit_id VARCHAR);")
+        if repoUrl is not None:
+            cursor.execute("DELETE FROM geogig_metadata;")
+            cursor.execute("INSERT INTO geogig_metadata VALUES (?);", (repoUrl,))
+        cursor.execute("DELETE FROM geogig_audited_tables WHERE table_name = ?;", (layername,))
+        cursor.execute("INSERT INTO geogig_audited_tables VALUES (?, ?, ?, ?);",
+                       (layername, layername, auditTable, commitId))
+
+        cursor.execute('DROP TABLE IF EXISTS "%s_fids";' % layername)
+        cursor.execute('CREATE TABLE "%s_fids" (gpkg_fid VARCHAR, geogig_fid VARCHAR, PRIMARY KEY(gpkg_fid));'
+                       % layername)
+        cursor.execute('INSERT INTO "{layer}_fids" SELECT CAST("{pk}" AS TEXT), CAST("{pk}" AS TEXT) FROM "{layer}";'
+                       .format(layer = layername, pk = pk))
+        cursor.executemany('INSERT OR REPLACE INTO "%s_fids" VALUES (?, ?);' % layername,
+                           [(str(gpkgfid), str(geogigfid)) for gpkgfid, geogigfid in featureIds or []])
+
+        for op in ["insert", "update", "delete"]:
+            cursor.execute("DROP TRIGGER IF EXISTS '%s_audit_%s';" % (layername, op))
+        cursor.execute('DROP TABLE IF EXISTS "%s";' % auditTable)
+        definitions = ", ".join('"%s" %s' % (c[1], c[2]) for c in info)
+        cursor.execute('CREATE TABLE "%s" (%s, audit_timestamp INTEGER DEFAULT CURRENT_TIMESTAMP, audit_op INTEGER);'
+                       % (auditTable, definitions))
+        cols = ", ".join("'%s'" % c for c in columns)
+        newValues = ", ".join("NEW.'%s'" % c for c in columns)
+        for op, opcode in [("insert", INSERT), ("update", UPDATE)]:
+            cursor.execute('''CREATE TRIGGER '{layer}_audit_{op}' AFTER {OP} ON '{layer}'
+                              BEGIN
+                                INSERT INTO '{audit}' ({cols}, audit_op) VALUES ({values}, {opcode});
+                              END;'''.format(layer = layername, audit = auditTable, op = op, OP = op.upper(),
+                                             cols = cols, values = newValues, opcode = opcode))
+        cursor.execute('''CREATE TRIGGER '{layer}_audit_delete' AFTER DELETE ON '{layer}'
+                          BEGIN
+                            INSERT INTO '{audit}' ('{pk}', audit_op) VALUES (OLD.'{pk}', {opcode});
+                          END;'''.format(layer = layername, audit = auditTable, pk = pk, opcode = DELETE))
+        cursor.execute("COMMIT;")
+    except:
+        try:
+            cursor.execute("ROLLBACK;")
+        except sqlite3.OperationalError:
+            pass
+        raise
+    finally:
+        cursor.close()
+        con.close()
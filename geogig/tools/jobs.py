@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    jobs.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+import threading
+import traceback
+
+from qgis.PyQt.QtCore import pyqtSignal, pyqtSlot, QObject
+from qgis.core import QgsMessageLog
+from qgis.gui import QgsMessageBar
+from qgis.utils import iface
+
+from geogig.config import MAX_CONCURRENT_JOBS
+from geogig.repowatcher import repoWatcher
+from geogig.geogigwebapi.tasks import isMainThread
+
+from qgiscommons2.settings import pluginSetting
+
+DEFAULT_MAX_CONCURRENT_JOBS = 2
+
+
+class JobCancelledException(Exception):
+    pass
+
+
+class Job(object):
+    '''
+    A long GeoGig operation run in a worker thread by the job manager.
+    Changes in its status or progress are notified with the
+    repoWatcher.jobAdded, jobChanged and jobFinished signals
+    '''
+
+    PENDING, RUNNING, FINISHED, FAILED, CANCELLED = list(range(5))
+
+    def __init__(self, title, func, onFinished = None):
+        self.title = title
+        self.func = func
+        self.onFinished = onFinished
+        self.status = Job.PENDING
+        self.text = ""
+        self.progress = None
+        self.result = None
+        self.exception = None
+        self.cancelled = False
+        self._cancelActions = []
+        self._lock = threading.Lock()
+
+    def isDone(self):
+        return self.status in [Job.FINISHED, Job.FAILED, Job.CANCELLED]
+
+    def setProgress(self, text, progress = None):
+        '''Sets the progress of the job, as a text and a percentage. Can be called from any thread'''
+        self.text = text
+        self.progress = progress
+        repoWatcher.jobChanged.emit(self)
+
+    def addCancelAction(self, action):
+        '''
+        Adds a function to call if the job is cancelled, such as closing
+        a transaction opened by the job on the server
+        '''
+        with self._lock:
+            if not self.cancelled:
+                self._cancelActions.append(action)
+                return
+        action()
+
+    def checkCancelled(self):
+        if self.cancelled:
+            raise JobCancelledException()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled or self.isDone():
+                return
+            self.cancelled = True
+            actions, self._cancelActions = self._cancelActions, []
+        for action in actions:
+            try:
+                action()
+            except:
+                QgsMessageLog.logMessage("Error while cancelling '%s':\n%s" % (self.title, traceback.format_exc()),
+                                         level=QgsMessageLog.WARNING)
+        jobManager._cancelPending(self)
+
+
+_current = threading.local()
+
+def currentJob():
+    '''Returns the job run by the current thread, or None'''
+    return getattr(_current, "job", None)
+
+
+def reportProgress(text, progress = None):
+    '''
+    Reports the progress of the current operation, in the panel of the job
+    that runs it or in the status bar if it does not run in a job.
+    Raises JobCancelledException if the job has been cancelled
+    '''
+    job = currentJob()
+    if job is not None:
+        job.checkCancelled()
+        job.setProgress(text, progress)
+    elif isMainThread():
+        if progress is None:
+            iface.mainWindow().statusBar().showMessage(text)
+        else:
+            iface.mainWindow().statusBar().showMessage("%s [%i%%]" % (text, progress))
+
+
+def progressReporter():
+    '''
+    Returns a function to report progress of the current operation
+    from other threads, such as the one polling server tasks
+    '''
+    job = currentJob()
+    if job is None:
+        return lambda text, progress = None: reportProgress(text, progress)
+    return job.setProgress
+
+
+def addCancelAction(action):
+    '''Adds a function to call if the job run by the current thread is cancelled'''
+    job = currentJob()
+    if job is not None:
+        job.addCancelAction(action)
+
+
+def checkCancelled():
+    job = currentJob()
+    if job is not None:
+        job.checkCancelled()
+
+
+class JobManager(QObject):
+    '''
+    Runs jobs in worker threads, up to a maximum number at the same time.
+    The onFinished function of a job is called in the main thread with
+    the result of the job, if it finishes correctly
+    '''
+
+    _jobDone = pyqtSignal(object)
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.pending = []
+        self.running = []
+        self._jobDone.connect(self._finishJob)
+
+    def _maxJobs(self):
+        try:
+            return max(1, int(pluginSetting(MAX_CONCURRENT_JOBS)))
+        except:
+            return DEFAULT_MAX_CONCURRENT_JOBS
+
+    def submit(self, title, func, onFinished = None):
+        job = Job(title, func, onFinished)
+        self.pending.append(job)
+        repoWatcher.jobAdded.emit(job)
+        self._startJobs()
+        return job
+
+    def _startJobs(self):
+        while self.pending and len(self.running) < self._maxJobs():
+            job = self.pending.pop(0)
+            job.status = Job.RUNNING
+            self.running.append(job)
+            t = threading.Thread(target=self._run, args=(job,))
+            t.daemon = True
+            t.start()
+            repoWatcher.jobChanged.emit(job)
+
+    def _run(self, job):
+        _current.job = job
+        try:
+            job.checkCancelled()
+            job.result = job.func()
+            job.status = Job.FINISHED
+        except JobCancelledException:
+            job.status = Job.CANCELLED
+        except Exception as e:
+            job.exception = e
+            if job.cancelled:
+                job.status = Job.CANCELLED
+            else:
+                job.status = Job.FAILED
+                QgsMessageLog.logMessage("Error in '%s':\n%s" % (job.title, traceback.format_exc()),
+                                         level=QgsMessageLog.CRITICAL)
+        finally:
+            _current.job = None
+        self._jobDone.emit(job)
+
+    def _cancelPending(self, job):
+        if job in self.pending:
+            self.pending.remove(job)
+            job.status = Job.CANCELLED
+            repoWatcher.jobFinished.emit(job)
+
+    @pyqtSlot(object)
+    def _finishJob(self, job):
+        self.running.remove(job)
+        try:
+            if job.status == Job.FINISHED:
+                if job.onFinished is not None:
+                    job.onFinished(job.result)
+            elif job.status == Job.FAILED:
+                iface.messageBar().pushMessage("GeoGig", "'%s' failed: %s" % (job.title, job.exception),
+                                               level=QgsMessageBar.CRITICAL, duration=5)
+            else:
+                iface.messageBar().pushMessage("GeoGig", "'%s' was cancelled" % job.title,
+                                               level=QgsMessageBar.INFO, duration=5)
+        finally:
+            repoWatcher.jobFinished.emit(job)
+            self._startJobs()
+
+jobManager = JobManager()
@@ -42,6 +42,9 @@ from qgis.utils import iface
 from qgiscommons2.files import tempFilename
 from qgiscommons2.layers import loadLayerNoCrsDialog, vectorLayers
 
+from geogig.tools.fids import FidMapping, fidMapping
+from geogig.tools.localchanges import hasChanges
+
 ALL_TYPES = -1
 
 class WrongLayerSourceException(BaseException) :
@@ -67,17 +70,10 @@ def getGroups():
 
 
 def geogigFidFromGpkgFid(trackedlayer, fid):
-    con = sqlite3.connect(trackedlayer.geopkg)
-    tablename = trackedlayer.layername + "_fids"
-    cursor = con.cursor()
-    cursor.execute("SELECT geogig_fid FROM %s WHERE gpkg_fid = %s;" % (tablename, fid))
-    try:
-        geogigFid = cursor.fetchone()[0]
-        return geogigFid
-    except:
+    geogigFid = fidMapping(trackedlayer.geopkg, trackedlayer.layername).geogigFid(fid)
+    if geogigFid is None:
         return fid
-    finally:
-        cursor.close()
+    return geogigFid
 
 
 def formatSource(source):
@@ -121,13 +117,7 @@ def namesFromLayer(layer):
 
 def hasLocalChanges(layer):
     filename, layername = namesFromLayer(layer)
-    con = sqlite3.connect(filename)
-    cursor = con.cursor()
-    cursor.execute("SELECT * FROM %s_audit;" % layername)
-    changes = cursor.fetchall()
-    cursor.close()
-    con.close()
-    return changes
+    return hasChanges(filename, layername)
 
 ADDED, REMOVED, MODIFIED_BEFORE, MODIFIED_AFTER = list(range(4))
 
@@ -136,11 +126,6 @@ diffStylePoints = os.path.join(resourcesPath, "difflayer_points.qml")
 diffStyleLines = os.path.join(resourcesPath, "difflayer_lines.qml")
 diffStylePolygons = os.path.join(resourcesPath, "difflayer_polygons.qml")
 
-def gpkgfidFromGeogigfid(cursor, layername, geogigfid):
-    cursor.execute("SELECT gpkg_fid FROM %s_fids WHERE geogig_fid='%s';" % (layername, geogigfid))
-    gpkgfid = int(cursor.fetchone()[0])
-    return gpkgfid
-
 def addDiffLayers(repo, commit, commit2, layernames):
 
     styles = [diffStylePoints, diffStyleLines, diffStylePolygons]
@@ -158,6 +143,8 @@ def addDiffLayers(repo, commit, commit2, layernames):
         beforeCursor = beforeCon.cursor()
         afterCon = sqlite3.connect(afterFilename)
         afterCursor = afterCon.cursor()
+        beforeFids = FidMapping(beforeFilename, layername)
+        afterFids = FidMapping(afterFilename, layername)
 
         attributes = [v[1] for v in beforeCursor.execute("PRAGMA table_info('%s');" % layername)]
         attrnames = [f.name() for f in beforeLayer.pendingFields()]
@@ -168,7 +155,7 @@ def addDiffLayers(repo, commit, commit2, layernames):
         modified = beforeCursor.fetchall()
         for m in modified:
             geogigfid = m[0]
-            beforeGpkgfid = gpkgfidFromGeogigfid(beforeCursor, layername, geogigfid)
+            beforeGpkgfid = beforeFids.gpkgFid(geogigfid)
             beforeCursor.execute("SELECT * FROM %s WHERE fid='%s';" % (layername, beforeGpkgfid))
             featureRow = beforeCursor.fetchone()
             attrs = {attr: featureRow[attributes.index(attr)] for attr in attrnames}
@@ -177,7 +164,7 @@ def addDiffLayers(repo, commit, commit2, layernames):
             request.setFilterFid(beforeGpkgfid)
             feature = next(beforeLayer.getFeatures(request))
             layerFeatures.append({"attrs":attrs, "geom": QgsGeometry(feature.geometry())})
-            afterGpkgfid = gpkgfidFromGeogigfid(afterCursor, layername, geogigfid)
+            afterGpkgfid = afterFids.gpkgFid(geogigfid)
             afterCursor.execute("SELECT * FROM %s WHERE fid='%s';" % (layername,afterGpkgfid))
             featureRow = afterCursor.fetchone()
             attrs = {attr: featureRow[attributes.index(attr)] for attr in attrnames}
@@ -192,7 +179,7 @@ def addDiffLayers(repo, commit, commit2, layernames):
         added = afterCursor.fetchall()
         for a in added:
             geogigfid = a[0]
-            afterGpkgfid = gpkgfidFromGeogigfid(afterCursor, layername, geogigfid)
+            afterGpkgfid = afterFids.gpkgFid(geogigfid)
             afterCursor.execute("SELECT * FROM %s WHERE fid='%s';" % (layername, afterGpkgfid))
             featureRow = afterCursor.fetchone()
             attrs = {attr: featureRow[attributes.index(attr)] for attr in attrnames}
@@ -206,7 +193,7 @@ def addDiffLayers(repo, commit, commit2, layernames):
         removed = beforeCursor.fetchall()
         for r in removed:
             geogigfid = r[0]
-            beforeGpkgfid = gpkgfidFromGeogigfid(beforeCursor, layername, geogigfid)
+            beforeGpkgfid = beforeFids.gpkgFid(geogigfid)
             beforeCursor.execute("SELECT * FROM %s WHERE fid='%s';" % (layername, beforeGpkgfid))
             featureRow = beforeCursor.fetchone()
             attrs = {attr: featureRow[attributes.index(attr)] for attr in attrnames}
@@ -50,22 +50,25 @@ class Encoder(JSONEncoder):
 def decoder(jsonobj):
     if 'source' in jsonobj:
         return TrackedLayer(jsonobj['source'],
-                            jsonobj['repoUrl'])
+                            jsonobj['repoUrl'],
+                            jsonobj.get('profile'))
     else:
         return jsonobj
 
 class TrackedLayer(object):
-    def __init__(self, source, repoUrl):
+    def __init__(self, source, repoUrl, profile = None):
         self.repoUrl = repoUrl
         self.source = source
+        # checkout profile, as returned by CheckoutProfile.toDict, or None
+        self.profile = profile
         self.geopkg, self.layername = source.split("|")
         self.layername = self.layername.split("=")[-1]
 
 
-def addTrackedLayer(source, repoFolder):
+def addTrackedLayer(source, repoFolder, profile = None):
     global tracked
     source = formatSource(source)
-    layer = TrackedLayer(source, repoFolder)
+    layer = TrackedLayer(source, repoFolder, profile.toDict() if profile is not None else None)
     if layer not in tracked:
         for lay in tracked:
             if lay.source == source:
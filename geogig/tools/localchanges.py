@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    localchanges.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+# Status of the local changes of tracked layers, read from their audit
+# tables without loading them
+
+import os
+import threading
+from collections import namedtuple
+
+from geogig.repowatcher import repoWatcher
+from geogig.tools.interchange import geopackageVersion, INSERT, DELETE
+from geogig.tools.dbconnection import connect
+
+
+class ChangeCounts(namedtuple("ChangeCounts", ["added", "modified", "removed"])):
+    '''Number of features added, modified and removed in a layer since its last sync'''
+
+    def total(self):
+        return self.added + self.modified + self.removed
+
+    def __str__(self):
+        if not self.total():
+            return "none"
+        return "%i added, %i modified, %i removed" % self
+
+NO_CHANGES = ChangeCounts(0, 0, 0)
+
+
+def _hasChanges(cursor, layername):
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM "%s_audit");' % layername)
+    return bool(cursor.fetchone()[0])
+
+
+def _changeCounts(cursor, layername):
+    # A feature edited several times has a row in the audit table for each
+    # edit. Its net change is given by its first and last operations
+    cursor.execute('''SELECT f.audit_op, l.audit_op, COUNT(*) FROM
+                      (SELECT MIN(rowid) AS firstid, MAX(rowid) AS lastid FROM "{audit}" GROUP BY fid) AS g
+                      JOIN "{audit}" AS f ON f.rowid = g.firstid
+                      JOIN "{audit}" AS l ON l.rowid = g.lastid
+                      GROUP BY f.audit_op, l.audit_op;'''.format(audit = layername + "_audit"))
+    added = modified = removed = 0
+    for firstOp, lastOp, count in cursor.fetchall():
+        if firstOp == INSERT:
+            if lastOp != DELETE:
+                added += count
+        elif lastOp == DELETE:
+            removed += count
+        else:
+            modified += count
+    return ChangeCounts(added, modified, removed)
+
+
+class LocalChangesCache(object):
+    '''
+    Caches whether tracked layers have local changes, and how many. The
+    cached values for a layer are discarded when its edits are committed,
+    or when its geopackage is modified by other means, such as a sync
+    '''
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _key(self, filename, layername):
+        return (os.path.normcase(os.path.abspath(filename)), layername)
+
+    def _get(self, filename, layername, name, func):
+        key = self._key(filename, layername)
+        version = geopackageVersion(filename)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["version"] != version:
+                entry = {"version": version}
+                self._entries[key] = entry
+            if name in entry:
+                return entry[name]
+        con = connect(filename)
+        try:
+            value = func(con.cursor(), layername)
+        finally:
+            con.close()
+        with self._lock:
+            entry[name] = value
+        return value
+
+    def hasChanges(self, filename, layername):
+        '''Returns True if the layer has changes not synced with the repository'''
+        return self._get(filename, layername, "hasChanges", _hasChanges)
+
+    def changeCounts(self, filename, layername):
+        '''Returns the number of features added, modified and removed in the layer'''
+        if not self.hasChanges(filename, layername):
+            return NO_CHANGES
+        return self._get(filename, layername, "counts", _changeCounts)
+
+    def invalidate(self, filename = None, layername = None):
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(filename, layername), None)
+
+localChangesCache = LocalChangesCache()
+
+def hasChanges(filename, layername):
+    return localChangesCache.hasChanges(filename, layername)
+
+def changeCounts(filename, layername):
+    return localChangesCache.changeCounts(filename, layername)
+
+
+_watched = set()
+
+def watchLayer(layer, filename, layername):
+    '''
+    Discards the cached status of a layer when edits to it are committed,
+    and notifies it with the repoWatcher.localChangesChanged signal
+    '''
+    layerid = layer.id()
+    if layerid in _watched:
+        return
+    _watched.add(layerid)
+    def _committed(*args):
+        localChangesCache.invalidate(filename, layername)
+        repoWatcher.localChangesChanged.emit(layer)
+    layer.committedFeaturesAdded.connect(_committed)
+    layer.committedFeaturesRemoved.connect(_committed)
+    layer.committedAttributeValuesChanges.connect(_committed)
+    layer.committedGeometriesChanges.connect(_committed)
+    layer.destroyed.connect(lambda: _watched.discard(layerid))
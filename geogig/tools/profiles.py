@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    profiles.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+# Checkout profiles, which restrict the columns and features of a tracked
+# layer that are kept in its geopackage. The values of the columns not in
+# the profile are emptied, but the columns are not removed, so the layer
+# keeps the feature type of the repository. When local changes are
+# uploaded, the values of those columns are taken from the repository
+
+from geogig.tools.dbconnection import connect
+from geogig.tools.interchange import filterFeatures
+from geogig.tools.layertracking import getTrackingInfo
+
+
+class CheckoutProfile(object):
+    '''
+    The columns and features of a layer to keep in its geopackage. columns
+    is a list of column names, or None for all of them. The geometry column
+    is always kept. filter is an SQL expression on the columns of the layer,
+    or None to keep all features
+    '''
+
+    def __init__(self, columns = None, filter = None):
+        self.columns = list(columns) if columns else None
+        self.filter = filter.strip() if filter and filter.strip() else None
+
+    def isEmpty(self):
+        return self.columns is None and self.filter is None
+
+    def hiddenColumns(self, filename, layername):
+        '''
+        Returns the columns of the layer that are not in the profile. Raises
+        ValueError if the profile has columns that are not in the layer
+        '''
+        if self.columns is None:
+            return []
+        con = connect(filename)
+        try:
+            cursor = con.cursor()
+            cursor.execute("SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?;", (layername,))
+            geomColumn = cursor.fetchone()[0]
+            columns = [v[1] for v in cursor.execute('PRAGMA table_info("%s");' % layername)
+                       if v[1] not in ["fid", geomColumn]]
+        finally:
+            con.close()
+        missing = [c for c in self.columns if c not in columns]
+        if missing:
+            raise ValueError("Columns not in layer '%s': %s" % (layername, ", ".join(missing)))
+        return [c for c in columns if c not in self.columns]
+
+    def toDict(self):
+        return {"columns": self.columns, "filter": self.filter}
+
+    @staticmethod
+    def fromDict(d):
+        if not d:
+            return None
+        return CheckoutProfile(d.get("columns"), d.get("filter"))
+
+    def __str__(self):
+        parts = []
+        if self.columns is not None:
+            parts.append("columns: %s" % ", ".join(self.columns))
+        if self.filter is not None:
+            parts.append("filter: %s" % self.filter)
+        return "; ".join(parts) or "full layer"
+
+
+def layerProfile(filename, layername):
+    '''Returns the checkout profile of a tracked layer, or None if it has none'''
+    tracking = getTrackingInfo("%s|layername=%s" % (filename, layername))
+    if tracking is None:
+        return None
+    return CheckoutProfile.fromDict(tracking.profile)
+
+
+def applyProfile(filename, layername, profile, compact = False, removeFids = None):
+    '''
+    Removes from a layer geopackage the values and features that are not
+    in the passed profile, and the features with the fids in removeFids,
+    such as ones outside the areas checked out. Raises ValueError if the
+    profile is not valid for the layer, before modifying anything
+    '''
+    if profile is None or profile.isEmpty():
+        if removeFids:
+            filterFeatures(filename, layername, compact = compact, removeFids = removeFids)
+        return
+    filterFeatures(filename, layername, profile.hiddenColumns(filename, layername),
+                   profile.filter, compact, removeFids)
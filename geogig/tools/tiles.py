@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+    tiles.py
+    ---------------------
+    Date                 : October 2026
+    Copyright            : (C) 2016 Boundless, http://boundlessgeo.com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+__author__ = 'Victor Olaya'
+__date__ = 'October 2026'
+__copyright__ = '(C) 2016 Boundless, http://boundlessgeo.com'
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = '$Format:%H$'
+
+# Tiled checkouts, where a tracked layer contains only the features in the
+# areas of the map that have been displayed. The layer is divided in a grid
+# of tiles in EPSG:4326, and the tiles loaded are kept in the geogig_tiles
+# table of the geopackage
+
+import os
+import math
+import struct
+import sqlite3
+
+from qgis.PyQt.QtCore import QObject, QTimer
+from qgis.core import (QgsRectangle,
+                       QgsGeometry,
+                       QgsCoordinateTransform,
+                       QgsCoordinateReferenceSystem)
+from qgis.utils import iface
+
+from geogig.tools.interchange import appendFeatures
+from geogig.tools.profiles import layerProfile, applyProfile
+from geogig.tools.dbconnection import connect, retryOnLock
+from geogig.tools.jobs import jobManager, reportProgress
+
+from qgiscommons2.files import tempFilename
+
+# Size of the tiles, in degrees
+TILE_SIZE = 1.0
+# Tiles are not loaded when the map shows more than this number of them,
+# so zooming out does not end up downloading the whole layer
+MAX_TILES = 16
+# Time to wait after the map extent changes before loading tiles, in ms
+LOAD_DELAY = 500
+
+
+def tilesInExtent(rect):
+    '''Returns the (x, y) tiles that cover the passed rectangle, in EPSG:4326'''
+    xmin = max(-180.0, rect.xMinimum())
+    xmax = min(180.0, rect.xMaximum())
+    ymin = max(-90.0, rect.yMinimum())
+    ymax = min(90.0, rect.yMaximum())
+    if xmin > xmax or ymin > ymax:
+        return []
+    x0, y0 = int(math.floor(xmin / TILE_SIZE)), int(math.floor(ymin / TILE_SIZE))
+    x1 = max(x0, int(math.ceil(xmax / TILE_SIZE)) - 1)
+    y1 = max(y0, int(math.ceil(ymax / TILE_SIZE)) - 1)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def tileBbox(tile):
+    '''Returns the bounding box of a tile, as expected by Repository.checkoutlayer'''
+    x, y = tile
+    return (QgsRectangle(x * TILE_SIZE, y * TILE_SIZE, (x + 1) * TILE_SIZE, (y + 1) * TILE_SIZE),
+            "EPSG:4326")
+
+
+def extentTo4326(rect, authid):
+    if authid == "EPSG:4326":
+        return rect
+    trans = QgsCoordinateTransform(QgsCoordinateReferenceSystem(authid),
+                                   QgsCoordinateReferenceSystem("EPSG:4326"))
+    return trans.transformBoundingBox(rect)
+
+
+def loadedTiles(filename, layername):
+    '''Returns the set of tiles loaded in a layer, or None if the layer was fully checked out'''
+    con = connect(filename)
+    try:
+        cursor = con.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='geogig_tiles';")
+        if cursor.fetchone() is None:
+            return None
+        cursor.execute("SELECT x, y FROM geogig_tiles WHERE table_name = ?;", (layername,))
+        tiles = set(cursor.fetchall())
+    finally:
+        con.close()
+    return tiles or None
+
+
+def _envelope(blob):
+    '''
+    Returns the (xmin, ymin, xmax, ymax) envelope of a geopackage geometry
+    blob, or None if the geometry is empty. The envelope in the header of
+    the blob is used if it has one
+    '''
+    blob = bytes(blob)
+    flags = bytearray(blob[3:4])[0]
+    if flags & 0x10:
+        return None
+    endian = "<" if flags & 1 else ">"
+    if (flags >> 1) & 7:
+        xmin, xmax, ymin, ymax = struct.unpack(endian + "4d", blob[8:40])
+        return xmin, ymin, xmax, ymax
+    wkb = blob[8:]
+    wkbEndian = "<" if bytearray(wkb[0:1])[0] else ">"
+    wkbType = struct.unpack(wkbEndian + "I", wkb[1:5])[0]
+    if wkbType % 1000 == 1:
+        x, y = struct.unpack(wkbEndian + "2d", wkb[5:21])
+        return x, y, x, y
+    geom = QgsGeometry()
+    geom.fromWkb(wkb)
+    rect = geom.boundingBox()
+    return rect.xMinimum(), rect.yMinimum(), rect.xMaximum(), rect.yMaximum()
+
+
+def _tileExtents(cursor, layername, tiles):
+    # Extents of the tiles, in the CRS of the layer
+    cursor.execute('''SELECT s.organization, s.organization_coordsys_id FROM gpkg_geometry_columns AS g
+                      JOIN gpkg_spatial_ref_sys AS s ON s.srs_id = g.srs_id
+                      WHERE g.table_name = ?;''', (layername,))
+    organization, code = cursor.fetchone()
+    authid = "%s:%s" % (organization.upper(), code)
+    extents = []
+    for tile in tiles:
+        rect = tileBbox(tile)[0]
+        if authid != "EPSG:4326":
+            trans = QgsCoordinateTransform(QgsCoordinateReferenceSystem("EPSG:4326"),
+                                           QgsCoordinateReferenceSystem(authid))
+            rect = trans.transformBoundingBox(rect)
+        extents.append((rect.xMinimum(), rect.yMinimum(), rect.xMaximum(), rect.yMaximum()))
+    return extents
+
+
+def featuresOutsideTiles(filename, layername, tiles, fids):
+    '''
+    Returns the fids, among the passed ones, of the features of a layer
+    whose extent does not intersect any of the passed tiles. Features with
+    empty geometries are considered to be inside
+    '''
+    if not fids:
+        return []
+    con = connect(filename)
+    try:
+        cursor = con.cursor()
+        extents = _tileExtents(cursor, layername, tiles)
+        cursor.execute("SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?;", (layername,))
+        geomColumn = cursor.fetchone()[0]
+        outside = []
+        fids = list(fids)
+        for i in range(0, len(fids), 500):
+            chunk = fids[i:i + 500]
+            cursor.execute('SELECT fid, "%s" FROM "%s" WHERE fid IN (%s);'
+                           % (geomColumn, layername, ",".join("?" * len(chunk))), chunk)
+            for fid, blob in cursor.fetchall():
+                envelope = _envelope(blob) if blob is not None else None
+                if envelope is None:
+                    continue
+                xmin, ymin, xmax, ymax = envelope
+                if not any(xmin <= exmax and xmax >= exmin and ymin <= eymax and ymax >= eymin
+                           for exmin, eymin, exmax, eymax in extents):
+                    outside.append(fid)
+    finally:
+        con.close()
+    return outside
+
+
+def _addTiles(filename, layername, tiles):
+    con = connect(filename)
+    try:
+        con.execute('''CREATE TABLE IF NOT EXISTS geogig_tiles (table_name TEXT, x INTEGER, y INTEGER,
+                       PRIMARY KEY (table_name, x, y));''')
+        con.executemany("INSERT OR IGNORE INTO geogig_tiles (table_name, x, y) VALUES (?, ?, ?);",
+                        [(layername, x, y) for x, y in tiles])
+        con.commit()
+    finally:
+        con.close()
+
+
+def _commitId(filename, layername):
+    con = connect(filename)
+    try:
+        cursor = con.cursor()
+        cursor.execute("SELECT commit_id FROM geogig_audited_tables WHERE table_name = ?;", (layername,))
+        return cursor.fetchone()[0]
+    finally:
+        con.close()
+
+
+def loadTiles(repo, filename, layername, tiles, profile = None):
+    '''
+    Adds to a tiled layer the features in the passed tiles, at the commit
+    the layer is at. Features already in the layer, including the ones
+    edited or deleted locally, are not modified. The checkout profile of
+    the layer is applied to the features added. Returns the number of
+    features added
+    '''
+    loaded = loadedTiles(filename, layername) or set()
+    tiles = [t for t in tiles if t not in loaded]
+    if not tiles:
+        return 0
+    profile = profile or layerProfile(filename, layername)
+    commitId = _commitId(filename, layername)
+    added = 0
+    for i, tile in enumerate(tiles):
+        reportProgress("Loading tile %i of %i" % (i + 1, len(tiles)), i * 100 // len(tiles))
+        tileFilename = tempFilename("gpkg")
+        repo.checkoutlayer(tileFilename, layername, tileBbox(tile), commitId)
+        try:
+            added += retryOnLock(appendFeatures, filename, tileFilename, layername)
+            retryOnLock(_addTiles, filename, layername, [tile])
+        finally:
+            try:
+                os.remove(tileFilename)
+            except OSError:
+                pass
+    retryOnLock(applyProfile, filename, layername, profile)
+    return added
+
+
+def checkoutTiles(repo, filename, layername, tiles, ref, profile = None):
+    '''
+    Checks out a layer to a geopackage, with only the features in the
+    passed tiles that are in the passed checkout profile
+    '''
+    repo.checkoutlayer(filename, layername, tileBbox(tiles[0]), ref)
+    _addTiles(filename, layername, tiles[:1])
+    applyProfile(filename, layername, profile)
+    loadTiles(repo, filename, layername, tiles[1:], profile)
+
+
+def checkoutGeopackage(repo, filename, layername, ref):
+    '''
+    Checks out a layer to an existing geopackage at the given commit. If
+    the layer is tiled, only the tiles loaded in it are checked out again.
+    The checkout profile of the layer, if any, is applied
+    '''
+    tiles = loadedTiles(filename, layername)
+    profile = layerProfile(filename, layername)
+    if tiles is None:
+        repo.checkoutlayer(filename, layername, None, ref)
+        applyProfile(filename, layername, profile)
+    else:
+        checkoutTiles(repo, filename, layername, sorted(tiles), ref, profile)
+
+
+def canvasBbox():
+    '''Returns the current map extent, as a bounding box to pass to checkoutLayer'''
+    canvas = iface.mapCanvas()
+    return (canvas.extent(), canvas.mapSettings().destinationCrs().authid())
+
+
+def bboxTiles(bbox):
+    '''Returns the tiles covering a (QgsRectangle, crs authid) bounding box'''
+    return tilesInExtent(extentTo4326(*bbox))
+
+
+class TileLoader(QObject):
+    '''
+    Loads the tiles of a tiled layer that are shown in the map canvas but
+    not yet in the layer, in a background job, after the user pans or
+    zooms the map. Nothing is loaded while the layer is being edited
+    '''
+
+    def __init__(self, layer, repo, filename, layername):
+        QObject.__init__(self, iface.mapCanvas())
+        self.layer = layer
+        self.layerid = layer.id()
+        self.repo = repo
+        self.filename = filename
+        self.layername = layername
+        self.job = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(LOAD_DELAY)
+        self.timer.timeout.connect(self.loadVisibleTiles)
+        iface.mapCanvas().extentsChanged.connect(self.timer.start)
+        layer.destroyed.connect(self.stop)
+
+    def stop(self):
+        _loaders.pop(self.layerid, None)
+        self.layer = None
+        self.timer.stop()
+        try:
+            iface.mapCanvas().extentsChanged.disconnect(self.timer.start)
+        except:
+            pass
+        self.deleteLater()
+
+    def loadVisibleTiles(self):
+        if self.layer is None or self.layer.isEditable():
+            return
+        if self.job is not None and not self.job.isDone():
+            self.timer.start()
+            return
+        try:
+            tiles = bboxTiles(canvasBbox())
+        except:
+            return # extent cannot be transformed to EPSG:4326
+        if len(tiles) > MAX_TILES:
+            return
+        loaded = loadedTiles(self.filename, self.layername)
+        if loaded is None:
+            self.stop() # layer has been fully checked out
+            return
+        missing = [t for t in tiles if t not in loaded]
+        if missing:
+            self.job = jobManager.submit("Load tiles of layer '%s'" % self.layername,
+                                         lambda: loadTiles(self.repo, self.filename, self.layername, missing),
+                                         self._tilesLoaded)
+
+    def _tilesLoaded(self, added):
+        if added and self.layer is not None:
+            if not self.layer.isEditable():
+                self.layer.reload()
+            self.layer.triggerRepaint()
+
+
+_loaders = {}
+
+def watchTiles(layer, repo, filename, layername):
+    '''Starts loading the tiles of a layer as the map is panned, if it is a tiled layer'''
+    try:
+        if loadedTiles(filename, layername) is None:
+            return
+    except sqlite3.Error:
+        return
+    layerid = layer.id()
+    if layerid in _loaders:
+        return
+    _loaders[layerid] = TileLoader(layer, repo, filename, layername)